@@ -1,30 +1,353 @@
+import hashlib
+import json
 import logging
-from urllib.request import urlopen
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
 logger = logging.getLogger()
 logging.basicConfig()
 logger.setLevel(logging.INFO)
 
+# Size of the reads from the responses and of the writes to disk
+CHUNK_SIZE = 1024 * 1024
+# Size of the ranges requested by parallel downloads
+PART_SIZE = 8 * 1024 * 1024
+# Number of files downloaded at the same time by download_files
+MAX_CONNECTIONS = 16
+# Bytes read from the responses but not written to disk yet, across downloads
+MAX_BYTES_IN_FLIGHT = 64 * 1024 * 1024
 
-def download_file(filename_and_path, download_link):
+
+def download_file(
+    filename_and_path,
+    download_link,
+    chunk_size=CHUNK_SIZE,
+    max_workers=1,
+    part_size=PART_SIZE,
+    resume=True,
+    checksum=None,
+    checksum_algorithm="sha256",
+    timeout=60,
+):
     """This allows user to download file from S3 using pre-signed URL generated
     by the download query API.
 
+    The file is streamed to disk chunk_size bytes at a time, so it never has
+    to fit in memory. It is written to filename_and_path + ".part" and only
+    renamed once it is complete (and its checksum matches), so an interrupted
+    download can be resumed by calling download_file again.
+
+    With max_workers > 1, files larger than part_size are downloaded with
+    parallel HTTP Range requests of part_size bytes, written in place into a
+    preallocated file. The ranges already written are tracked in a
+    ".part.json" file, so resuming only requests the missing ones, whatever
+    max_workers is then.
+
     Args:
         filename_and_path (str): exact path with filename where user want to store.
             Eg. dir/subdir/filename.ext
         download_link (str): pre-signed URL from S3
+        chunk_size (int): number of bytes read from the response at a time.
+        max_workers (int): number of ranges downloaded at the same time.
+        part_size (int): size of the ranges of parallel downloads.
+        resume (bool): continue a previous partial download, if any.
+        checksum (str): expected hex digest of the file, it is not verified
+            when None.
+        checksum_algorithm (str): hashlib name of the checksum algorithm.
+        timeout (float): seconds to wait for the server to respond.
+
+    Returns:
+        bool: whether the file was downloaded.
+
+    Raises:
+        ValueError: if the file does not match the checksum, the partial
+            download is then removed.
     """
-    # Get file content using urlopen
-    with urlopen(download_link) as response:
-        if response.getcode() != 200:
-            logger.warn(
-                "Failed to download file [%s], returned status code [%d]",
+    part_path = f"{filename_and_path}.part"
+    # the preallocated file of a parallel download is only valid with it
+    progress_path = f"{part_path}.json"
+    logger.info(f"Downloading to {filename_and_path}")
+    try:
+        size = None
+        if not resume:
+            _remove(progress_path)
+        ranged = os.path.exists(progress_path)
+        if max_workers > 1 or ranged:
+            size = _get_size(download_link, timeout)
+        if size is None and ranged:
+            logger.info("The partial download can't be resumed, restarting it")
+            _remove(part_path, progress_path)
+            ranged = False
+        if size is not None and (size > part_size or ranged):
+            _download_ranges(
                 download_link,
-                response.status_code,
+                part_path,
+                size,
+                part_size,
+                max_workers,
+                resume,
+                chunk_size,
+                timeout,
             )
+        else:
+            _download_stream(download_link, part_path, resume, chunk_size, timeout)
+    except HTTPError as e:
+        logger.warning(
+            "Failed to download file [%s], returned status code [%d]",
+            download_link,
+            e.code,
+        )
+        return False
+
+    if checksum is not None:
+        digest = _file_digest(part_path, checksum_algorithm, chunk_size)
+        if digest != checksum.lower():
+            os.remove(part_path)
+            raise ValueError(
+                f"{checksum_algorithm} checksum of {filename_and_path} is "
+                f"{digest}, expected {checksum}"
+            )
+
+    os.replace(part_path, filename_and_path)
+    return True
+
+
+def download_files(
+    downloads,
+    max_connections=MAX_CONNECTIONS,
+    max_bytes_in_flight=MAX_BYTES_IN_FLIGHT,
+    progress=None,
+    **kwargs,
+):
+    """Downloads many files at the same time with download_file.
+
+    At most max_connections files are downloaded at once, each with up to
+    max_workers connections, and every connection reads max_bytes_in_flight /
+    (max_connections * max_workers) bytes at a time, so the data held in
+    memory stays under max_bytes_in_flight. A failed download does not stop
+    the others.
+
+    Args:
+        downloads (list): (filename_and_path, download_link) pairs, e.g. from
+            downloads_from_response. Missing directories are created.
+        max_connections (int): number of files downloaded at the same time.
+        max_bytes_in_flight (int): bytes read but not written yet, across
+            downloads.
+        progress (callable): called after every file with the number of files
+            done, the number of files, the bytes downloaded and the seconds
+            elapsed.
+        **kwargs: passed on to download_file, e.g. resume or max_workers. A
+            chunk_size larger than the share of the budget of a connection is
+            reduced to it.
+
+    Returns:
+        dict: the paths "downloaded" and "failed", the number of "bytes"
+        downloaded, the "seconds" it took and the "throughput" in bytes per
+        second.
+    """
+    connections = max_connections * max(kwargs.get("max_workers", 1), 1)
+    chunk_size = max(max_bytes_in_flight // connections, 1)
+    if "chunk_size" in kwargs:
+        chunk_size = min(kwargs.pop("chunk_size"), chunk_size)
+    downloaded = []
+    failed = []
+    total_bytes = 0
+    start = time.monotonic()
+
+    def download(filename_and_path, download_link):
+        directory = os.path.dirname(filename_and_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return download_file(
+            filename_and_path, download_link, chunk_size=chunk_size, **kwargs
+        )
+
+    with ThreadPoolExecutor(max_workers=max_connections) as executor:
+        futures = {
+            executor.submit(download, path, link): path for path, link in downloads
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                success = future.result()
+            except Exception as e:
+                logger.warning(f"Failed to download {path}: {e}")
+                success = False
+            if success:
+                downloaded.append(path)
+                total_bytes += os.path.getsize(path)
+            else:
+                failed.append(path)
+            if progress is not None:
+                progress(
+                    len(downloaded) + len(failed),
+                    len(futures),
+                    total_bytes,
+                    time.monotonic() - start,
+                )
+
+    seconds = time.monotonic() - start
+    throughput = total_bytes / seconds if seconds else 0.0
+    logger.info(
+        f"Downloaded {len(downloaded)} files, {total_bytes} bytes in "
+        f"{seconds:.1f} s ({throughput / 1e6:.1f} MB/s), {len(failed)} failed"
+    )
+    return {
+        "downloaded": downloaded,
+        "failed": failed,
+        "bytes": total_bytes,
+        "seconds": seconds,
+        "throughput": throughput,
+    }
+
+
+def downloads_from_response(response, directory):
+    """Returns the downloads of a batch response of the download query API.
+
+    The files are stored under directory with the same path as in S3. A
+    response for query parameters downloads every file matching the query.
+
+    Args:
+        response (dict): the JSON body of the response, holding the
+            "download_urls" by S3 URI.
+        directory (str): directory where the files are stored.
+
+    Returns:
+        list: (filename_and_path, download_link) pairs for download_files.
+    """
+    downloads = []
+    for s3_uri, download_link in response["download_urls"].items():
+        # s3://bucket/path/file.ext -> directory/path/file.ext
+        key = s3_uri.split("//", 1)[1].split("/", 1)[1]
+        downloads.append((os.path.join(directory, key), download_link))
+    return downloads
+
+
+def _get_size(download_link, timeout):
+    """Returns the size of the file if the server supports Range requests.
+
+    Pre-signed URLs are only valid for GET requests, so the size is read from
+    the Content-Range of a request for the first byte instead of a HEAD
+    request.
+    """
+    request = Request(download_link, headers={"Range": "bytes=0-0"})
+    with urlopen(request, timeout=timeout) as response:
+        content_range = response.headers.get("Content-Range")
+        if response.getcode() != 206 or content_range is None:
+            return None
+        # bytes 0-0/<size>
+        size = content_range.rsplit("/", 1)[1]
+        return None if size == "*" else int(size)
+
+
+def _download_stream(download_link, part_path, resume, chunk_size, timeout):
+    """Streams the file to part_path, after what is already there if resuming."""
+    offset = 0
+    if resume and os.path.exists(part_path):
+        offset = os.path.getsize(part_path)
+
+    request = Request(download_link)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        if e.code != 416 or not offset:
+            raise
+        # the partial download is complete if it has the size of the file,
+        # otherwise the file has changed or the partial download is corrupt
+        if _get_size(download_link, timeout) == offset:
             return
-        # save/write file content to file on local machine
-        with open(filename_and_path, "wb") as file:
-            logger.info(f"Downloading to {filename_and_path}")
-            file.write(response.read())
+        logger.info("The partial download does not match the file, restarting it")
+        os.remove(part_path)
+        _download_stream(download_link, part_path, False, chunk_size, timeout)
+        return
+
+    with response:
+        # the server may ignore the range and send the whole file again
+        mode = "ab" if response.getcode() == 206 else "wb"
+        with open(part_path, mode) as file:
+            _copy(response, file, chunk_size)
+
+
+def _download_ranges(
+    download_link, part_path, size, part_size, max_workers, resume, chunk_size, timeout
+):
+    """Downloads the ranges of the file in parallel into part_path."""
+    progress_path = f"{part_path}.json"
+    # start of every range already written
+    done = set()
+    if (
+        resume
+        and os.path.exists(progress_path)
+        and os.path.exists(part_path)
+        and os.path.getsize(part_path) == size
+    ):
+        with open(progress_path) as progress:
+            done = set(json.load(progress))
+    else:
+        # the progress file is written first, so that the preallocated file
+        # is never mistaken for a partial download of the whole file
+        with open(progress_path, "w") as progress:
+            json.dump([], progress)
+        # preallocate the file, every range is written in place
+        with open(part_path, "wb") as file:
+            file.truncate(size)
+
+    lock = threading.Lock()
+
+    def download_range(start):
+        end = min(start + part_size, size) - 1
+        request = Request(download_link, headers={"Range": f"bytes={start}-{end}"})
+        with urlopen(request, timeout=timeout) as response:
+            if response.getcode() != 206:
+                raise RuntimeError(
+                    f"Range request for bytes {start}-{end} of {download_link} "
+                    f"returned status code {response.getcode()}"
+                )
+            with open(part_path, "r+b") as file:
+                file.seek(start)
+                _copy(response, file, chunk_size)
+        with lock:
+            done.add(start)
+            with open(progress_path, "w") as progress:
+                json.dump(sorted(done), progress)
+
+    starts = [start for start in range(0, size, part_size) if start not in done]
+    logger.info(f"Downloading {len(starts)} ranges of {part_size} bytes")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # list raises the first error of the ranges
+        list(executor.map(download_range, starts))
+    os.remove(progress_path)
+
+
+def _remove(*paths):
+    """Removes the files that exist among paths."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _copy(response, file, chunk_size):
+    """Writes the body of the response to the file, one chunk at a time."""
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        file.write(chunk)
+
+
+def _file_digest(path, algorithm, chunk_size):
+    """Returns the hex digest of a file, reading it one chunk at a time."""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,17 +1,42 @@
 # Standard
+import base64
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Installed
 import boto3
 import botocore
+from opensearchpy import RequestsHttpConnection
+
+# Local
+from .dynamodb_utils.object_index import ObjectIndex
+from .opensearch_utils.client import Client
+from .opensearch_utils.index import Index
+from .opensearch_utils.query import VALID_PARAMS, Query
 
 # Logger setup
 logger = logging.getLogger()
 logging.basicConfig()
 logger.setLevel(logging.INFO)
 
+# Largest number of files a batch request may ask for. The S3 URIs are sent in
+# the body of a POST request, a URL only fits a few dozen of them.
+MAX_BATCH_SIZE = 1000
+# Number of head_object requests sent at the same time in a batch
+MAX_WORKERS = 16
+
+# Lambda keeps the module loaded between warm invocations, so anything stored
+# here is reused until the container is recycled or the entry expires.
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "300"))
+_cache = {
+    "client": None,
+    "client_created_at": 0.0,
+    "object_index": None,
+}
+
 
 def http_response(header_type="text/html", status_code=200, body="Success"):
     """Customizes HTTP response for the lambda function.
@@ -40,6 +65,234 @@ def http_response(header_type="text/html", status_code=200, body="Success"):
     }
 
 
+def _get_object_index():
+    """Return the index of the existing objects, reused between warm invocations.
+
+    The objects are looked up in the ``OBJECT_INDEX_TABLE`` DynamoDB table, if
+    set, and remembered for ``OBJECT_INDEX_TTL_SECONDS``.
+
+    Returns
+    -------
+    ObjectIndex
+        The object index of this container.
+    """
+    if _cache["object_index"] is None:
+        _cache["object_index"] = ObjectIndex(
+            table_name=os.environ.get("OBJECT_INDEX_TABLE"),
+            ttl=int(os.environ.get("OBJECT_INDEX_TTL_SECONDS", "60")),
+        )
+    return _cache["object_index"]
+
+
+def _create_open_search_client():
+    """Creates and returns an OpenSearch client.
+
+    Returns
+    -------
+    Client
+        A Client object that's connected to the specified OpenSearch cluster.
+    """
+    hosts = [{"host": os.environ["OS_DOMAIN"], "port": int(os.environ["OS_PORT"])}]
+
+    session = boto3.session.Session()
+    client = session.client(
+        service_name="secretsmanager", region_name=os.environ["REGION"]
+    )
+    response = client.get_secret_value(SecretId=os.environ["SECRET_ID"])
+
+    auth = (os.environ["OS_ADMIN_USERNAME"], response["SecretString"])
+
+    return Client(
+        hosts=hosts,
+        http_auth=auth,
+        use_ssl=True,
+        verify_certs=True,
+        connnection_class=RequestsHttpConnection,
+        http_compress=True,
+    )
+
+
+def _get_open_search_client():
+    """Return the OpenSearch client, reused between warm invocations.
+
+    The client (and the Secrets Manager lookup behind it) is only recreated
+    once it is older than ``CACHE_TTL_SECONDS``, so rotated credentials are
+    still picked up.
+
+    Returns
+    -------
+    Client
+        A Client object that's connected to the specified OpenSearch cluster.
+    """
+    now = time.monotonic()
+    if (
+        _cache["client"] is not None
+        and now - _cache["client_created_at"] < CACHE_TTL_SECONDS
+    ):
+        return _cache["client"]
+
+    if _cache["client"] is not None:
+        _cache["client"].close()
+
+    _cache["client"] = _create_open_search_client()
+    _cache["client_created_at"] = now
+    return _cache["client"]
+
+
+def _parse_s3_uri(s3_uri):
+    """Returns the bucket and key of an S3 URI.
+
+    Raises
+    ------
+    ValueError
+        If the URI is not of the form s3://bucket/key.
+    """
+    if not s3_uri.startswith("s3://") or "/" not in s3_uri[len("s3://") :]:
+        raise ValueError(f"Not valid S3 URI: {s3_uri}")
+    bucket, key = s3_uri[len("s3://") :].split("/", 1)
+    return bucket, key
+
+
+def _object_exists(s3_client, s3_uri):
+    """Returns whether the object of an S3 URI exists.
+
+    S3 answers 403 instead of 404 for the missing objects of the buckets that
+    can't be listed, those objects can't be downloaded either, so they are
+    reported as missing rather than failing the whole batch.
+
+    Raises
+    ------
+    botocore.exceptions.ClientError
+        If S3 fails with another error than a missing object.
+    """
+    bucket, key = _parse_s3_uri(s3_uri)
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("403", "404"):
+            return False
+        raise
+    return True
+
+
+def _query_s3_uris(query_params):
+    """Returns the S3 URIs of the files matching the query parameters.
+
+    The S3 URI of a file is the id of its document in the metadata index.
+
+    Raises
+    ------
+    ValueError
+        If more than MAX_BATCH_SIZE files match.
+    """
+    query = Query(query_params, size=MAX_BATCH_SIZE, fields=[])
+    s3_uris = []
+    client = _get_open_search_client()
+    hits = client.iter_search(query, Index(os.environ["OS_INDEX"]))
+    try:
+        for hit in hits:
+            if len(s3_uris) == MAX_BATCH_SIZE:
+                raise ValueError(
+                    f"More than {MAX_BATCH_SIZE} files match, narrow down the query"
+                )
+            s3_uris.append(hit["_id"])
+    finally:
+        hits.close()
+    return s3_uris
+
+
+def batch_presign(s3_uris, url_life):
+    """Checks that the objects exist and presigns a download URL for each one.
+
+    The objects are first looked up in the object index, and only the ones
+    missing from it are checked in S3, concurrently. Every URL is presigned
+    locally with one shared client.
+
+    Parameters
+    ----------
+    s3_uris : list
+        The S3 URIs of the files to download.
+    url_life : int
+        Number of seconds the URLs are valid for.
+
+    Returns
+    -------
+    dict
+        The download URL of every file that exists, by S3 URI, and the list of
+        the S3 URIs of the files that don't exist.
+    """
+    s3_client = boto3.client("s3")
+    object_index = _get_object_index()
+    indexed = object_index.find(s3_uris)
+    unknown = [s3_uri for s3_uri in s3_uris if s3_uri not in indexed]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        exists = executor.map(lambda s3_uri: _object_exists(s3_client, s3_uri), unknown)
+        in_s3 = {s3_uri for s3_uri, found in zip(unknown, exists) if found}
+    for s3_uri in in_s3:
+        object_index.add(s3_uri)
+
+    download_urls = {}
+    not_found = []
+    for s3_uri in s3_uris:
+        if s3_uri not in indexed and s3_uri not in in_s3:
+            not_found.append(s3_uri)
+            continue
+        bucket, key = _parse_s3_uri(s3_uri)
+        download_urls[s3_uri] = s3_client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=url_life
+        )
+    return {"download_urls": download_urls, "not_found": not_found}
+
+
+def _parse_batch_body(event):
+    """Returns the S3 URIs listed in the JSON body of a batch request.
+
+    Raises
+    ------
+    ValueError
+        If the body is not a JSON object with an ``s3_uris`` list of at most
+        MAX_BATCH_SIZE valid S3 URIs.
+    """
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+    try:
+        s3_uris = json.loads(body)["s3_uris"]
+    except (json.JSONDecodeError, TypeError, KeyError) as e:
+        raise ValueError('The body must be a JSON object with an "s3_uris" list') from e
+    if not isinstance(s3_uris, list) or not all(
+        isinstance(s3_uri, str) for s3_uri in s3_uris
+    ):
+        raise ValueError('"s3_uris" must be a list of S3 URIs')
+    if len(s3_uris) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} files can be requested at once")
+    for s3_uri in s3_uris:
+        _parse_s3_uri(s3_uri)
+    return s3_uris
+
+
+def _batch_handler(event, url_life):
+    """Handles a batch request, see lambda_handler."""
+    try:
+        if event.get("httpMethod") == "POST":
+            s3_uris = _parse_batch_body(event)
+        else:
+            s3_uris = _query_s3_uris(event["queryStringParameters"])
+    except ValueError as e:
+        return http_response(status_code=400, body=str(e))
+
+    # the same file may be requested twice
+    s3_uris = list(dict.fromkeys(s3_uris))
+    try:
+        response_body = batch_presign(s3_uris, url_life)
+    except botocore.exceptions.ClientError as e:
+        return http_response(
+            status_code=e.response["ResponseMetadata"]["HTTPStatusCode"], body=str(e)
+        )
+
+    return http_response(header_type="application/json", body=json.dumps(response_body))
+
+
 def lambda_handler(event, context):
     """This lambda handler checks if this file exists or not. If file doesn't exist, it
     gives back an error. Otherwise, it returns pre-signed s3 url that user can use to
@@ -60,13 +313,31 @@ def lambda_handler(event, context):
         The response from the function which could either be a pre-signed
         S3 URL in case of successful operation or an error message with
         corresponding status code in case of failure.
+
+    Notes
+    -----
+    Many files can be requested at once, either with a POST request whose JSON
+    body holds the ``s3_uris`` list, or with the parameters of the query API
+    (instrument, level, start_date, end_date). The response then holds the
+    ``download_urls`` of the files that exist, by S3 URI, and the S3 URIs of
+    the files that were ``not_found``.
     """
     logger.info(f"Event: {event}")
     logger.info(f"Context: {context}")
 
     one_day = 86400
-    url_life = os.environ.get("URL_EXPIRE", one_day)
+    url_life = int(os.environ.get("URL_EXPIRE", one_day))
 
+    query_params = event.get("queryStringParameters") or {}
+    if event.get("httpMethod") == "POST" or any(
+        param in query_params for param in VALID_PARAMS
+    ):
+        return _batch_handler(event, url_life)
+    return _single_handler(event, url_life)
+
+
+def _single_handler(event, url_life):
+    """Handles a request for a single file, see lambda_handler."""
     if not event.get("queryStringParameters"):
         response_body = """No input given. It requires s3_uri.\n
                         s3_uri: full s3 URI. Eg. s3://bucket-name/filepath/filename.pkts
@@ -94,17 +365,24 @@ def lambda_handler(event, context):
         return http_response(status_code=400, body=response_body)
 
     s3_client = boto3.client("s3")
+    object_index = _get_object_index()
 
-    # check if object exists
-    try:
-        s3_client.head_object(Bucket=bucket, Key=filepath)
-    except botocore.exceptions.ClientError as e:
-        if e.response["Error"]["Code"] == "404":
-            # object doesn't exist
-            return http_response(status_code=404, body="File not found in S3.")
-        else:
-            # fails due to another error
-            return http_response(status_code=e.response["Error"]["Code"], body=str(e))
+    # check if object exists, S3 is only asked about the objects the indexer
+    # has not recorded
+    if not object_index.find([s3_uri]):
+        try:
+            s3_client.head_object(Bucket=bucket, Key=filepath)
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] == "404":
+                # object doesn't exist
+                return http_response(status_code=404, body="File not found in S3.")
+            else:
+                # fails due to another error
+                return http_response(
+                    status_code=e.response["ResponseMetadata"]["HTTPStatusCode"],
+                    body=str(e),
+                )
+        object_index.add(s3_uri)
 
     pre_signed_url = s3_client.generate_presigned_url(
         "get_object", Params={"Bucket": bucket, "Key": filepath}, ExpiresIn=url_life
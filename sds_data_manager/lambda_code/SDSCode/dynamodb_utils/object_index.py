@@ -0,0 +1,174 @@
+import time
+
+import boto3
+
+# Seconds an object stays in the index after it was ingested, the S3 delete
+# events remove it sooner
+RETENTION_SECONDS = 7 * 24 * 3600
+
+
+def object_index_key(s3_uri):
+    """
+    Returns the key of an object in the object index table.
+
+    Parameters
+    ----------
+    s3_uri: str
+        S3 URI of the object, e.g. s3://bucket/path/file.pkts.
+    """
+    return {"s3_uri": s3_uri}
+
+
+def object_index_item(s3_uri, retention=RETENTION_SECONDS):
+    """
+    Returns the item recording that an object exists, to write to the
+    object index table.
+
+    Parameters
+    ----------
+    s3_uri: str
+        S3 URI of the object, e.g. s3://bucket/path/file.pkts.
+    retention: int
+        seconds until the item expires, DynamoDB deletes it some time after.
+    """
+    return {**object_index_key(s3_uri), "expires_at": int(time.time()) + retention}
+
+
+class ObjectIndex:
+    """
+    Class to check whether S3 objects exist without a request to S3.
+
+    ...
+
+    The indexer records the S3 URI of every file it ingests in the object index
+    table, keyed by S3 URI, and removes it when the file is deleted. Items
+    expire after a retention period, so the table doesn't grow forever and an
+    object whose delete event was missed is only trusted for that long. The
+    objects found there, or confirmed by the caller with a head_object
+    request, are remembered in memory for ttl seconds, so repeated downloads
+    of the same files don't need any request. An object missing from the index
+    may still exist, e.g. if it expired, so callers fall back to S3 for those.
+
+    Attributes
+    ----------
+    table_name: str, optional
+        name of the object index table, objects are only remembered in memory
+        without it.
+    ttl: float
+        seconds an object is remembered in memory.
+    max_entries: int
+        maximum number of objects remembered in memory.
+
+    Methods
+    -------
+    find(s3_uris):
+        returns the S3 URIs known to exist.
+    add(s3_uri):
+        remembers that an object exists.
+    """
+
+    # BatchGetItem limit
+    batch_size = 100
+
+    def __init__(
+        self,
+        table_name=None,
+        ttl=60,
+        max_entries=10_000,
+        max_retries=3,
+        dynamodb=None,
+    ):
+        self.table_name = table_name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_retries = max_retries
+        self.dynamodb = dynamodb
+        if table_name is not None and dynamodb is None:
+            self.dynamodb = boto3.resource("dynamodb")
+        # {S3 URI: expiry time}
+        self._known = {}
+
+    def find(self, s3_uris):
+        """
+        Returns the S3 URIs known to exist, from memory or from the table.
+
+        Parameters
+        ----------
+        s3_uris: list
+            S3 URIs of the objects to look for.
+
+        Returns
+        -------
+        set
+            the S3 URIs of s3_uris known to exist, the others may exist too.
+        """
+        now = time.time()
+        found = {uri for uri in s3_uris if self._known.get(uri, 0) > now}
+        missing = list(dict.fromkeys(uri for uri in s3_uris if uri not in found))
+        if self.table_name is None:
+            return found
+
+        for start in range(0, len(missing), self.batch_size):
+            for s3_uri in self._get_batch(missing[start : start + self.batch_size]):
+                found.add(s3_uri)
+                self.add(s3_uri)
+        return found
+
+    def add(self, s3_uri):
+        """
+        Remembers that an object exists.
+
+        Parameters
+        ----------
+        s3_uri: str
+            S3 URI of the object.
+        """
+        if len(self._known) >= self.max_entries:
+            now = time.time()
+            self._known = {
+                uri: expires_at
+                for uri, expires_at in self._known.items()
+                if expires_at > now
+            }
+            if len(self._known) >= self.max_entries:
+                self._known.clear()
+        self._known[s3_uri] = time.time() + self.ttl
+
+    def _get_batch(self, s3_uris):
+        """
+        Sends one BatchGetItem request and retries the unprocessed keys.
+
+        Parameters
+        ----------
+        s3_uris: list
+            at most 100 S3 URIs.
+
+        Returns
+        -------
+        list
+            the S3 URIs of s3_uris found in the table.
+        """
+        request_items = {
+            self.table_name: {
+                "Keys": [object_index_key(uri) for uri in s3_uris],
+                "ProjectionExpression": "s3_uri, expires_at",
+            }
+        }
+        found = []
+        for _ in range(self.max_retries + 1):
+            response = self.dynamodb.batch_get_item(RequestItems=request_items)
+            # DynamoDB deletes the expired items up to a few days late
+            now = time.time()
+            found += [
+                item["s3_uri"]
+                for item in response["Responses"].get(self.table_name, [])
+                if item["expires_at"] > now
+            ]
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                break
+        # keys still unprocessed are checked in S3 by the caller
+        return found
+
+    def __repr__(self):
+        return f"ObjectIndex({self.table_name}, {len(self._known)} objects)"
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+# Prefix of the cache_key of the generation counter of every instrument, "*"
+# counts the writes of every instrument. The counters never expire.
+GENERATION_PREFIX = "generation#"
+ALL_INSTRUMENTS = "*"
+# Prefix of the cache_key of the shared results, which expire
+RESULT_PREFIX = "result#"
+
+
+class QueryCache:
+    """
+    Class to cache the results of the query API, in memory and optionally in a
+    DynamoDB table shared by every lambda container.
+
+    ...
+
+    Results are stored under a key made of the normalized request and of the
+    generation of the instrument it filters on. The indexer bumps the
+    generation of every instrument it writes documents for, so the results
+    cached before the write are never returned again. Without a table there is
+    no generation, and results are only dropped when they expire.
+
+    The in-memory tier is a least recently used cache of at most max_entries
+    results. The DynamoDB tier only holds results small enough to fit in an
+    item, and expires them with the table time to live attribute.
+
+    Attributes
+    ----------
+    max_entries: int
+        maximum number of results kept in memory.
+    ttl: float
+        seconds a result is kept in memory.
+    table: boto3 DynamoDB Table, optional
+        table holding the generations and the shared results, with the
+        cache_key partition key and the expires_at time to live attribute.
+    shared_ttl: int
+        seconds a result is kept in the table.
+    max_shared_bytes: int
+        size of the largest result stored in the table, DynamoDB items are
+        limited to 400 KB.
+
+    Methods
+    -------
+    make_key(request, instrument):
+        returns the cache key of a request.
+    get(key):
+        returns the cached result of a key, or None.
+    put(key, value):
+        caches the result of a key.
+    generation(instrument):
+        returns the generation of the results of an instrument.
+    bump_generations(instruments):
+        invalidates the results of the instruments.
+    """
+
+    def __init__(
+        self,
+        max_entries=128,
+        ttl=60,
+        table=None,
+        shared_ttl=300,
+        max_shared_bytes=350_000,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.table = table
+        self.shared_ttl = shared_ttl
+        self.max_shared_bytes = max_shared_bytes
+        # {key: (expiry time, result)}, least recently used first
+        self._entries = OrderedDict()
+
+    def make_key(self, request, instrument=None):
+        """
+        Returns the cache key of a request.
+
+        Parameters
+        ----------
+        request: dict
+            everything the result depends on, e.g. the index, query DSL and
+            page. The filters of bool queries are compared in any order.
+        instrument: str, optional
+            instrument the request filters on, if any.
+
+        Returns
+        -------
+        str
+            the key of the request at the current generation of the instrument.
+        """
+        normalized = json.dumps(_normalize(request), sort_keys=True)
+        digest = hashlib.sha256(normalized.encode()).hexdigest()
+        return f"{digest}-{self.generation(instrument)}"
+
+    def get(self, key):
+        """
+        Returns the cached result of a key, or None if it is not cached.
+
+        Parameters
+        ----------
+        key: str
+            key returned by make_key.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if time.time() < expires_at:
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+
+        if self.table is None:
+            return None
+        item = self.table.get_item(Key={"cache_key": RESULT_PREFIX + key}).get("Item")
+        # the time to live deletes expired items within a few days
+        if item is None or item["expires_at"] <= time.time():
+            return None
+        value = json.loads(item["result"])
+        self._put_memory(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Caches the result of a key.
+
+        Parameters
+        ----------
+        key: str
+            key returned by make_key.
+        value: dict
+            JSON serializable result.
+        """
+        self._put_memory(key, value)
+        if self.table is None:
+            return
+        result = json.dumps(value)
+        if len(result) > self.max_shared_bytes:
+            return
+        self.table.put_item(
+            Item={
+                "cache_key": RESULT_PREFIX + key,
+                "result": result,
+                "expires_at": int(time.time() + self.shared_ttl),
+            }
+        )
+
+    def generation(self, instrument=None):
+        """
+        Returns the generation of the results of an instrument.
+
+        Parameters
+        ----------
+        instrument: str, optional
+            the instrument, or None for results across instruments.
+
+        Returns
+        -------
+        int
+            number of times documents were written for the instrument, 0
+            without a table.
+        """
+        if self.table is None:
+            return 0
+        item = self.table.get_item(
+            Key={"cache_key": GENERATION_PREFIX + (instrument or ALL_INSTRUMENTS)}
+        ).get("Item")
+        return int(item["generation"]) if item else 0
+
+    def bump_generations(self, instruments):
+        """
+        Invalidates the cached results of the instruments, and the results
+        across instruments.
+
+        Parameters
+        ----------
+        instruments: iterable
+            instruments documents were written for.
+        """
+        if self.table is None:
+            return
+        for instrument in [*instruments, ALL_INSTRUMENTS]:
+            self.table.update_item(
+                Key={"cache_key": GENERATION_PREFIX + instrument},
+                UpdateExpression="ADD generation :one",
+                ExpressionAttributeValues={":one": 1},
+            )
+
+    def _put_memory(self, key, value):
+        """Stores a result in memory, evicting the least recently used ones."""
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __repr__(self):
+        return f"QueryCache({len(self._entries)} results, table={self.table})"
+
+
+def _normalize(value):
+    """Sorts the filters of bool queries, their order doesn't change the hits."""
+    if isinstance(value, dict):
+        return {
+            key: (
+                sorted(
+                    (_normalize(v) for v in item),
+                    key=lambda v: json.dumps(v, sort_keys=True),
+                )
+                if key == "filter" and isinstance(item, list)
+                else _normalize(item)
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
@@ -0,0 +1,151 @@
+import logging
+import time
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessingStatusWriter:
+    """
+    Class to buffer processing status items and write them to a DynamoDB
+    table with BatchWriteItem requests.
+
+    ...
+
+    Items are sent as soon as a full batch of 25 (the BatchWriteItem limit)
+    has been buffered, and the rest is sent by flush. The writer is also a
+    context manager that flushes on exit. If an exception is raised, the
+    buffered items are dropped instead, so a failed invocation writes nothing
+    more and the original error is not hidden by a failed flush. Use one
+    writer per invocation, the DynamoDB resource can be shared between them.
+
+    Attributes
+    ----------
+    table_name: str
+        name of the DynamoDB table to write to.
+    key_names: tuple
+        partition and sort key attribute names. Items with the same key in
+        the buffer replace each other, BatchWriteItem rejects duplicates.
+    max_retries: int
+        number of times unprocessed items are retried before giving up.
+    base_delay: float
+        delay in seconds before the first retry, doubled on every retry.
+
+    Methods
+    -------
+    put_item(item):
+        adds an item to the buffer, writing a batch when it is full.
+    put_items(items):
+        adds a list of items to the buffer.
+    flush():
+        writes every buffered item to the table.
+    clear():
+        drops every buffered item without writing it.
+    """
+
+    batch_size = 25
+
+    def __init__(
+        self,
+        table_name,
+        key_names=("instrument", "filename"),
+        max_retries=5,
+        base_delay=0.05,
+        dynamodb=None,
+    ):
+        self.table_name = table_name
+        self.key_names = key_names
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.dynamodb = dynamodb or boto3.resource("dynamodb")
+        # {item key: item}, in insertion order
+        self._buffer = {}
+
+    def put_item(self, item):
+        """
+        Adds an item to the buffer and writes a batch once it is full.
+
+        Parameters
+        ----------
+        item: dict
+            the item to write to the table.
+        """
+        key = tuple(item[name] for name in self.key_names)
+        self._buffer.pop(key, None)
+        self._buffer[key] = item
+        if len(self._buffer) >= self.batch_size:
+            self._write_buffer()
+
+    def put_items(self, items):
+        """
+        Adds a list of items to the buffer.
+
+        Parameters
+        ----------
+        items: list
+            the items to write to the table.
+        """
+        for item in items:
+            self.put_item(item)
+
+    def flush(self):
+        """Writes every buffered item to the table."""
+        while self._buffer:
+            self._write_buffer()
+
+    def clear(self):
+        """Drops every buffered item without writing it."""
+        self._buffer.clear()
+
+    def _write_buffer(self):
+        """Writes up to one batch of buffered items to the table."""
+        keys = list(self._buffer)[: self.batch_size]
+        items = [self._buffer.pop(key) for key in keys]
+        self._write_batch(items)
+
+    def _write_batch(self, items):
+        """
+        Sends one BatchWriteItem request and retries the unprocessed items
+        with exponential backoff.
+
+        Parameters
+        ----------
+        items: list
+            at most 25 items to write to the table.
+        """
+        request_items = {
+            self.table_name: [{"PutRequest": {"Item": item}} for item in items]
+        }
+        for attempt in range(self.max_retries + 1):
+            response = self.dynamodb.batch_write_item(RequestItems=request_items)
+            request_items = response.get("UnprocessedItems")
+            if not request_items:
+                return
+            if attempt < self.max_retries:
+                delay = self.base_delay * 2**attempt
+                logger.info(
+                    f"{len(request_items[self.table_name])} items were not "
+                    f"processed, retrying in {delay} seconds."
+                )
+                time.sleep(delay)
+
+        raise RuntimeError(
+            f"{len(request_items[self.table_name])} items could not be written to "
+            f"{self.table_name} after {self.max_retries} retries"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            logger.warning(
+                f"Dropping {len(self._buffer)} buffered items after {exc_type.__name__}"
+            )
+            self.clear()
+            return
+        self.flush()
+
+    def __repr__(self):
+        return f"ProcessingStatusWriter({self.table_name}, {len(self._buffer)} items)"
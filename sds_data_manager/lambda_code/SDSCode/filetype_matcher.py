@@ -0,0 +1,120 @@
+class FiletypeMatcher:
+    """
+    Class to represent the file naming patterns from config.json compiled into
+    lookup tables, so a filename can be matched against every pattern at once.
+
+    ...
+
+    Patterns are grouped by their number of fields and by which fields hold a
+    literal value rather than a "*" wildcard. Each group is a dictionary keyed
+    on the tuple of literal values, so matching a filename costs one dictionary
+    lookup per group instead of a field by field comparison per pattern. When
+    several patterns match, the one listed first in config.json wins, which is
+    the same result as scanning the configuration in order.
+
+    Attributes
+    ----------
+    filetypes: list
+        list of file type dictionaries as loaded from config.json.
+
+    Methods
+    -------
+    match(filename):
+        returns the metadata dictionary of the first matching pattern.
+    match_filetype(filename):
+        returns the matching file type and its metadata dictionary.
+    classify(filenames):
+        returns the metadata dictionary for each filename in a list.
+    """
+
+    def __init__(self, filetypes):
+        self.filetypes = filetypes
+        # field names of each pattern, in the order they appear in the filename
+        self._fields = [tuple(filetype["pattern"]) for filetype in filetypes]
+        # {field count: {literal field positions: {literal values: position}}}
+        self._groups = {}
+
+        for position, filetype in enumerate(filetypes):
+            values = list(filetype["pattern"].values())
+            literal_positions = tuple(
+                i for i, value in enumerate(values) if value != "*"
+            )
+            literal_values = tuple(values[i] for i in literal_positions)
+            lookup = self._groups.setdefault(len(values), {}).setdefault(
+                literal_positions, {}
+            )
+            # only keep the first pattern, later duplicates can never match
+            lookup.setdefault(literal_values, position)
+
+    def match(self, filename):
+        """
+        Returns the metadata of the first pattern matching the filename.
+
+        Parameters
+        ----------
+        filename: str
+            the filename to match, without any leading path.
+
+        Returns
+        -------
+        dict or None
+            dictionary of pattern field to filename value, or None if no
+            pattern matches.
+        """
+        return self.match_filetype(filename)[1]
+
+    def match_filetype(self, filename):
+        """
+        Returns the first file type matching the filename and its metadata.
+
+        Parameters
+        ----------
+        filename: str
+            the filename to match, without any leading path.
+
+        Returns
+        -------
+        tuple
+            the matching file type dictionary and the metadata dictionary, or
+            (None, None) if no pattern matches.
+        """
+        split_filename = filename.replace("_", ".").split(".")
+        position = self._find(split_filename)
+        if position is None:
+            return None, None
+
+        metadata = dict(zip(self._fields[position], split_filename))
+        return self.filetypes[position], metadata
+
+    def classify(self, filenames):
+        """
+        Returns the metadata of the first matching pattern for every filename.
+
+        Parameters
+        ----------
+        filenames: list
+            list of filenames to match, without any leading path.
+
+        Returns
+        -------
+        list
+            metadata dictionary, or None if no pattern matches, for each
+            filename in the same order as the input.
+        """
+        return [self.match(filename) for filename in filenames]
+
+    def _find(self, split_filename):
+        """Returns the position of the first matching pattern, or None."""
+        groups = self._groups.get(len(split_filename))
+        if groups is None:
+            return None
+
+        best = None
+        for literal_positions, lookup in groups.items():
+            position = lookup.get(tuple(split_filename[i] for i in literal_positions))
+            if position is not None and (best is None or position < best):
+                best = position
+        return best
+
+    def __repr__(self):
+        return f"FiletypeMatcher({len(self.filetypes)} file types)"
@@ -3,20 +3,28 @@ import json
 import logging
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Installed
 import boto3
 from opensearchpy import RequestsHttpConnection
 
+from .dynamodb_utils.object_index import object_index_item, object_index_key
 from .dynamodb_utils.processing_status import ProcessingStatus
+from .dynamodb_utils.query_cache import QueryCache
+from .dynamodb_utils.status_writer import ProcessingStatusWriter
 
 # Local
+from .filetype_matcher import FiletypeMatcher
 from .opensearch_utils.action import Action
 from .opensearch_utils.client import Client
 from .opensearch_utils.document import Document
 from .opensearch_utils.index import Index
+from .opensearch_utils.mappings import DATA_TRACKER_INDEX_BODY, METADATA_INDEX_BODY
 from .opensearch_utils.payload import Payload
-from .opensearch_utils.snapshot import run_backup
+from .opensearch_utils.snapshot import SnapshotCoordinator
 
 # Logger setup
 logger = logging.getLogger()
@@ -27,22 +35,75 @@ s3 = boto3.client("s3")
 # Create a Step Functions client
 step_function_client = boto3.client("stepfunctions")
 
+# Lambda keeps the module loaded between warm invocations, so anything stored
+# here is reused until the container is recycled or the entry expires.
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "300"))
+_cache = {
+    "config": None,
+    "config_etag": None,
+    "config_checked_at": 0.0,
+    "matcher": None,
+    "client": None,
+    "client_created_at": 0.0,
+    "snapshot_coordinator": None,
+    "query_cache": None,
+}
+# boto3 resources are not thread-safe and the handler writes to DynamoDB from
+# several threads at once, so every thread gets its own DynamoDB resource.
+_thread_local = threading.local()
+
 
 def _load_allowed_filenames():
     """Load the allowed filenames configuration from an S3 bucket.
 
+    The parsed configuration is cached across warm invocations. Once the cache
+    entry is older than ``CACHE_TTL_SECONDS`` the ETag of 'config.json' is
+    checked and the file is only downloaded again if it has changed.
+
     Returns
     -------
     dict
         The content of 'config.json', parsed into a Python dictionary.
     """
+    now = time.monotonic()
+    if (
+        _cache["config"] is not None
+        and now - _cache["config_checked_at"] < CACHE_TTL_SECONDS
+    ):
+        return _cache["config"]
+
+    bucket = os.environ["S3_CONFIG_BUCKET_NAME"]
+    if _cache["config"] is not None:
+        etag = s3.head_object(Bucket=bucket, Key="config.json")["ETag"]
+        if etag == _cache["config_etag"]:
+            _cache["config_checked_at"] = now
+            return _cache["config"]
+        logger.info("config.json has changed, reloading it from S3.")
 
     # get the config file from the S3 bucket
-    config_object = s3.get_object(
-        Bucket=os.environ["S3_CONFIG_BUCKET_NAME"], Key="config.json"
-    )
+    config_object = s3.get_object(Bucket=bucket, Key="config.json")
     file_content = config_object["Body"].read()
-    return json.loads(file_content)
+    _cache["config"] = json.loads(file_content)
+    _cache["config_etag"] = config_object["ETag"]
+    _cache["config_checked_at"] = now
+    return _cache["config"]
+
+
+def _get_filetype_matcher():
+    """Return the compiled filename matcher for the current config.json.
+
+    The matcher is only rebuilt when a new version of the configuration
+    has been loaded.
+
+    Returns
+    -------
+    FiletypeMatcher
+        Matcher compiled from the allowed file types.
+    """
+    filetypes = _load_allowed_filenames()
+    if _cache["matcher"] is None or _cache["matcher"].filetypes is not filetypes:
+        _cache["matcher"] = FiletypeMatcher(filetypes)
+    return _cache["matcher"]
 
 
 def _check_for_matching_filetype(pattern: dict, filename: str):
@@ -79,6 +140,27 @@ def _check_for_matching_filetype(pattern: dict, filename: str):
     return file_dictionary
 
 
+def classify_filenames(filenames):
+    """Match a whole list of filenames or S3 keys against the allowed file types.
+
+    This is the batch counterpart of ``_check_for_matching_filetype``, meant for
+    backfills and reconciliation jobs that need to classify many keys at once.
+
+    Parameters
+    ----------
+    filenames : list
+        Filenames or S3 keys to classify. Any leading path is ignored.
+
+    Returns
+    -------
+    list
+        The metadata dictionary, or None when no file type matches, for each
+        filename in the same order as the input.
+    """
+    basenames = [os.path.basename(filename) for filename in filenames]
+    return _get_filetype_matcher().classify(basenames)
+
+
 def _create_open_search_client():
     """Retrieve secrets from Secrets Manager and creates an Open Search client.
 
@@ -107,6 +189,51 @@ def _create_open_search_client():
         use_ssl=True,
         verify_certs=True,
         connnection_class=RequestsHttpConnection,
+        http_compress=True,
+    )
+
+
+def _get_open_search_client():
+    """Return the cached OpenSearch client, creating a new one when needed.
+
+    The client, and with it the password from Secrets Manager, is reused across
+    warm invocations. It is rebuilt after ``CACHE_TTL_SECONDS`` so a rotated
+    secret is eventually picked up without a cold start.
+
+    Returns
+    -------
+    Client
+        An instance of the OpenSearch client connected to the specified cluster.
+    """
+    now = time.monotonic()
+    if (
+        _cache["client"] is not None
+        and now - _cache["client_created_at"] < CACHE_TTL_SECONDS
+    ):
+        return _cache["client"]
+
+    if _cache["client"] is not None:
+        _cache["client"].close()
+
+    _cache["client"] = _create_open_search_client()
+    _cache["client_created_at"] = now
+    # make sure the indexes get their mappings if this call creates them
+    for index in _get_indexes():
+        _cache["client"].put_index_template(index)
+    return _cache["client"]
+
+
+def _get_indexes():
+    """Return the metadata and data tracker indexes with their mappings.
+
+    Returns
+    -------
+    tuple
+        The metadata index and the data tracker index.
+    """
+    return (
+        Index(os.environ["METADATA_INDEX"], METADATA_INDEX_BODY),
+        Index(os.environ["DATA_TRACKER_INDEX"], DATA_TRACKER_INDEX_BODY),
     )
 
 
@@ -139,25 +266,231 @@ def initialize_data_processing_status(metadata: dict, filename):
     }
 
 
-def write_data_to_dynamodb(item: dict):
-    """Write data to DynamoDB.
+def _get_dynamodb():
+    """Return the DynamoDB resource of the calling thread.
+
+    The resource is created from its own boto3 session, the default session
+    is not thread-safe either, and reused by later calls from the same thread.
+
+    Returns
+    -------
+    boto3.resources.base.ServiceResource
+        DynamoDB resource only used by the calling thread.
+    """
+    if getattr(_thread_local, "dynamodb", None) is None:
+        _thread_local.dynamodb = boto3.session.Session().resource("dynamodb")
+    return _thread_local.dynamodb
+
+
+def _get_status_writer():
+    """Return a new DynamoDB status writer for this invocation.
+
+    The writer buffers items, so it is not shared between invocations: the
+    items of a failed invocation must not be written by the next one. Only
+    the DynamoDB resource is reused between warm invocations.
+
+    Returns
+    -------
+    ProcessingStatusWriter
+        Writer that batches processing status items into the DynamoDB table.
+    """
+    return ProcessingStatusWriter(
+        os.environ["DYNAMODB_TABLE"], dynamodb=_get_dynamodb()
+    )
+
+
+def add_to_object_index(s3_paths: list):
+    """Record the ingested files in the object index, if there is one.
 
     Parameters
     ----------
-    item : dict
-        data for database
+    s3_paths : list
+        S3 URIs of the ingested files.
     """
-    dynamodb = boto3.resource("dynamodb")
-    table = dynamodb.Table(os.environ["DYNAMODB_TABLE"])
-    table.put_item(Item=item)
+    if not os.environ.get("OBJECT_INDEX_TABLE"):
+        return
+    with ProcessingStatusWriter(
+        os.environ["OBJECT_INDEX_TABLE"],
+        key_names=("s3_uri",),
+        dynamodb=_get_dynamodb(),
+    ) as writer:
+        writer.put_items([object_index_item(s3_path) for s3_path in s3_paths])
+
+
+def remove_from_object_index(s3_paths: list):
+    """Remove deleted files from the object index, if there is one.
+
+    Parameters
+    ----------
+    s3_paths : list
+        S3 URIs of the deleted files.
+    """
+    if not os.environ.get("OBJECT_INDEX_TABLE"):
+        return
+    table = _get_dynamodb().Table(os.environ["OBJECT_INDEX_TABLE"])
+    with table.batch_writer() as batch:
+        for s3_path in s3_paths:
+            batch.delete_item(Key=object_index_key(s3_path))
+
+
+def _remove_deleted_objects(records: list):
+    """Remove the files deleted by the records of an event from the object index.
+
+    Parameters
+    ----------
+    records : list
+        S3 event notification records.
+
+    Returns
+    -------
+    list
+        The records of the created files.
+    """
+    created = []
+    removed = []
+    for record in records:
+        if record.get("eventName", "").startswith("ObjectRemoved"):
+            removed.append(record["s3"]["object"]["key"])
+        else:
+            created.append(record)
+    if removed:
+        logger.info(f"Removing {len(removed)} deleted files from the object index.")
+        remove_from_object_index(
+            [os.path.join(os.environ["S3_DATA_BUCKET"], key) for key in removed]
+        )
+    return created
+
+
+def _get_snapshot_coordinator():
+    """Return the snapshot coordinator, reused between warm invocations.
+
+    Concurrent indexer invocations share a lease item in the
+    ``SNAPSHOT_LEASE_TABLE`` DynamoDB table so at most one snapshot is taken
+    every ``SNAPSHOT_INTERVAL_SECONDS``.
+
+    Returns
+    -------
+    SnapshotCoordinator
+        Coordinator for the OpenSearch domain of this deployment.
+    """
+    if _cache["snapshot_coordinator"] is None:
+        lease_table = boto3.resource("dynamodb").Table(
+            os.environ["SNAPSHOT_LEASE_TABLE"]
+        )
+        _cache["snapshot_coordinator"] = SnapshotCoordinator(
+            host=os.environ["OS_DOMAIN"],
+            region=os.environ["REGION"],
+            snapshot_repo_name=os.environ["SNAPSHOT_REPO_NAME"],
+            snapshot_s3_bucket=os.environ["S3_SNAPSHOT_BUCKET_NAME"],
+            snapshot_role_arn=os.environ["SNAPSHOT_ROLE_ARN"],
+            interval=int(os.environ.get("SNAPSHOT_INTERVAL_SECONDS", "900")),
+            lease_table=lease_table,
+            lease_key={"lease_id": "opensearch-snapshot"},
+        )
+    return _cache["snapshot_coordinator"]
+
+
+def _get_query_cache():
+    """Return the query API result cache, reused between warm invocations.
+
+    Returns
+    -------
+    QueryCache or None
+        Cache sharing the results of the query API through the
+        ``QUERY_CACHE_TABLE`` DynamoDB table, None if there is no such table.
+    """
+    if _cache["query_cache"] is None and os.environ.get("QUERY_CACHE_TABLE"):
+        _cache["query_cache"] = QueryCache(
+            table=boto3.resource("dynamodb").Table(os.environ["QUERY_CACHE_TABLE"])
+        )
+    return _cache["query_cache"]
+
+
+def write_data_to_dynamodb(items: list):
+    """Write data to DynamoDB in batches.
+
+    Parameters
+    ----------
+    items : list
+        data for database, one dictionary per file
+    """
+    with _get_status_writer() as status_writer:
+        status_writer.put_items(items)
+
+
+def check_bulk_result(result):
+    """Check that OpenSearch indexed every document of the payload.
+
+    The documents are created, so the ones that already exist are rejected
+    with a 409 conflict when S3 delivers the same event again. Those are
+    expected, any other failure fails the invocation so the event is retried.
+
+    Parameters
+    ----------
+    result : BulkResult
+        outcome of sending the payload to OpenSearch.
+
+    Raises
+    ------
+    RuntimeError
+        If a document was rejected for another reason than a conflict.
+    """
+    logger.info(f"Sent the payload to OpenSearch: {result}")
+    failures = result.get_failures(ignore_statuses={409})
+    if failures:
+        raise RuntimeError(
+            f"{len(failures)} documents could not be indexed, "
+            f"first failure: {failures[0]}"
+        )
+
+
+def invalidate_query_cache(instruments):
+    """Invalidate the cached query results of instruments with new documents.
+
+    The new documents must be searchable first, or a query in between would
+    cache the old results under the new generation, so the payload is sent
+    with ``refresh=wait_for`` when there is a query cache.
+
+    Parameters
+    ----------
+    instruments : iterable
+        names of the instruments with new documents.
+    """
+    query_cache = _get_query_cache()
+    if query_cache is not None:
+        query_cache.bump_generations(instruments)
+
+
+def start_processing(instruments):
+    """Start one step function execution per instrument.
+
+    Parameters
+    ----------
+    instruments : iterable
+        names of the instruments with new data.
+    """
+    state_machine_arn = os.environ.get("STATE_MACHINE_ARN")
+    for instrument in instruments:
+        input_data = {"instrument": instrument}
+        response = step_function_client.start_execution(
+            stateMachineArn=state_machine_arn,
+            input=json.dumps(input_data),  # Input data must be a JSON string
+        )
+        logger.info(f"Step function execution started: {response}")
 
 
 def lambda_handler(event, context):
     """Handler function for creating metadata, adding it to the payload,
     and sending it to the opensearch instance.
 
-    This function is an event handler called by the AWS Lambda upon the creation of an
-    object in a s3 bucket.
+    This function is an event handler called by the AWS Lambda upon the creation of
+    objects in a s3 bucket. All records of the event are processed together: they are
+    sent to OpenSearch in one bulk payload and to DynamoDB in batch writes, and one
+    step function execution is started for each instrument found in the batch.
+    Deleted objects are removed from the object index of the download API.
+
+    The lambda is also invoked by a scheduled rule, to take the OpenSearch
+    snapshot that was skipped at the end of a burst of writes, if any.
 
     Parameters
     ----------
@@ -174,48 +507,40 @@ def lambda_handler(event, context):
     logger.info(f"Event: {event}")
     logger.info(f"Context: {context}")
 
-    # Retrieve a list of allowed file types
-    logger.info("Loading allowed filenames from configuration file in S3.")
-    filetypes = _load_allowed_filenames()
-    logger.info("Allowed file types: " + str(filetypes))
+    if event.get("source") == "aws.events":
+        _get_snapshot_coordinator().take_pending_snapshot()
+        return None
+
+    records = _remove_deleted_objects(event["Records"])
+    if not records:
+        return None
 
-    # Grab environment variables
-    host = os.environ["OS_DOMAIN"]
-    snapshot_repo_name = os.environ["SNAPSHOT_REPO_NAME"]
-    snapshot_s3_bucket = os.environ["S3_SNAPSHOT_BUCKET_NAME"]
-    snapshot_role_arn = os.environ["SNAPSHOT_ROLE_ARN"]
-    region = os.environ["REGION"]
+    # Match every file of the batch against the allowed file types at once
+    logger.info("Loading allowed filenames from configuration file in S3.")
+    filenames = [record["s3"]["object"]["key"] for record in records]
+    all_metadata = classify_filenames(filenames)
 
-    # create opensearch client
-    client = _create_open_search_client()
     # create index (AKA 'table' in other database)
-    metadata_index = Index(os.environ["METADATA_INDEX"])
-    data_tracker_index = Index(os.environ["DATA_TRACKER_INDEX"])
+    metadata_index, data_tracker_index = _get_indexes()
 
     # create a payload
     document_payload = Payload()
-
-    # We're only expecting one record, but for some reason the Records are a list object
-    for record in event["Records"]:
-        # Retrieve the Object name
-        logger.info(f"Record Received: {record}")
-        filename = record["s3"]["object"]["key"]
-
+    # processing status data is written to DynamoDB in batches of 25
+    status_writer = _get_status_writer()
+    items = []
+    # S3 paths of the files recorded for the download API
+    s3_paths = []
+    # instruments in the order they were first seen in the batch
+    instruments = {}
+
+    for filename, metadata in zip(filenames, all_metadata):
         logger.info(f"Attempting to insert {os.path.basename(filename)} into database")
 
-        # Look for matching file types in the configuration
-        for filetype in filetypes:
-            metadata = _check_for_matching_filetype(
-                filetype["pattern"], os.path.basename(filename)
-            )
-            if metadata is not None:
-                break
-
         # Found nothing. This should probably send out an error notification
         # to the team, because how did it make its way onto the SDS?
         if metadata is None:
-            logger.info("Found no matching file types to index this file against.")
-            return None
+            logger.info(f"Found no matching file types to index {filename} against.")
+            continue
 
         logger.info("Found the following metadata to index: " + str(metadata))
 
@@ -231,27 +556,51 @@ def lambda_handler(event, context):
         # Initialize processing status for injested data to pending. This will be
         # updated when the data is processed.
         item = initialize_data_processing_status(metadata=metadata, filename=filename)
-
-        # Write processing status data to DynamoDB.
-        write_data_to_dynamodb(item)
+        items.append(item)
+        status_writer.put_item(item)
+        # record that the file exists, for the download API
+        s3_paths.append(s3_path)
 
         # Write processing status data to opensearch as well.
         data_tracker_doc = Document(data_tracker_index, filename, Action.CREATE, item)
         document_payload.add_documents(data_tracker_doc)
 
-    # send the paylaod to the opensearch instance
-    client.send_payload(document_payload)
-
-    # take OpenSearch Snapshot
-    run_backup(host, region, snapshot_repo_name, snapshot_s3_bucket, snapshot_role_arn)
+        instruments[metadata["instrument"]] = None
 
-    client.close()
+    if not items:
+        logger.info("None of the files in this event matched a known file type.")
+        return None
 
-    # Start Step function execution
-    state_machine_arn = os.environ.get("STATE_MACHINE_ARN")
-    input_data = {"instrument": metadata["instrument"]}
-    response = step_function_client.start_execution(
-        stateMachineArn=state_machine_arn,
-        input=json.dumps(input_data),  # Input data must be a JSON string
-    )
-    logger.info(f"Step function execution started: {response}")
+    # get the opensearch client, reused between warm invocations
+    client = _get_open_search_client()
+    snapshot_coordinator = _get_snapshot_coordinator()
+
+    # The DynamoDB and OpenSearch writes are independent, so they run at the
+    # same time. The processing only starts once both are done.
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        # Write the remaining processing status data to DynamoDB. The main
+        # thread does not use the writer or its resource until this is done.
+        status_future = executor.submit(status_writer.flush)
+        object_index_future = executor.submit(add_to_object_index, s3_paths)
+        # send the paylaod to the opensearch instance, the query cache is only
+        # invalidated once the documents are searchable
+        bulk_future = executor.submit(
+            client.send_payload,
+            document_payload,
+            refresh="wait_for" if _get_query_cache() is not None else None,
+        )
+        status_future.result()
+        object_index_future.result()
+        check_bulk_result(bulk_future.result())
+
+        # take OpenSearch Snapshot, unless one was already taken recently,
+        # while the step functions are started
+        snapshot_future = executor.submit(snapshot_coordinator.take_snapshot_if_due)
+
+        # the cached query results of these instruments are out of date
+        invalidate_query_cache(instruments)
+
+        # Start one step function execution per instrument in the batch
+        start_processing(instruments)
+
+        snapshot_future.result()
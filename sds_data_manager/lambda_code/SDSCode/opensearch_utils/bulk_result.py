@@ -0,0 +1,98 @@
+class BulkResult:
+    """
+    Class to represent the outcome of sending a bulk payload to OpenSearch.
+
+    ...
+
+    Attributes
+    ----------
+    successful: int
+        number of documents OpenSearch accepted.
+    failed: list
+        the bulk response item of every document that was rejected, as a
+        dict with the action, index, id, status and error of the document.
+    retries: int
+        number of bulk requests sent again because of throttling.
+
+    Methods
+    -------
+    add_item(action, item):
+        records the bulk response item of one document.
+    is_successful():
+        returns whether every document was accepted.
+    get_failures(ignore_statuses):
+        returns the failures whose status is not ignored.
+    """
+
+    def __init__(self):
+        self.successful = 0
+        self.failed = []
+        self.retries = 0
+
+    def add_item(self, action, item):
+        """
+        Records the bulk response item of one document.
+
+        Parameters
+        ----------
+        action: str
+            the bulk action of the document, e.g. "create".
+        item: dict
+            the response item of the document, holding its status and error.
+        """
+        if "error" in item:
+            self.failed.append(
+                {
+                    "action": action,
+                    "_index": item.get("_index"),
+                    "_id": item.get("_id"),
+                    "status": item.get("status"),
+                    "error": item["error"],
+                }
+            )
+        else:
+            self.successful += 1
+
+    def merge(self, other):
+        """
+        Adds the counts and failures of another result to this one.
+
+        Parameters
+        ----------
+        other: BulkResult
+            result of another part of the same payload.
+        """
+        self.successful += other.successful
+        self.failed += other.failed
+        self.retries += other.retries
+
+    def is_successful(self):
+        """Returns whether every document was accepted by OpenSearch."""
+        return not self.failed
+
+    def get_failures(self, ignore_statuses=()):
+        """
+        Returns the failures whose status is not ignored.
+
+        Parameters
+        ----------
+        ignore_statuses: iterable, optional
+            statuses of the failures to leave out, e.g. 409 for the documents
+            that already exist.
+
+        Returns
+        -------
+        list
+            the failed bulk response items with another status.
+        """
+        return [
+            failure
+            for failure in self.failed
+            if failure["status"] not in ignore_statuses
+        ]
+
+    def __repr__(self):
+        return (
+            f"BulkResult(successful={self.successful}, failed={len(self.failed)}, "
+            f"retries={self.retries})"
+        )
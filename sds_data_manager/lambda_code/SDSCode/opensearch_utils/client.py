@@ -1,6 +1,33 @@
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import opensearchpy
 
 from .action import Action
+from .bulk_result import BulkResult
+
+logger = logging.getLogger(__name__)
+
+# How long OpenSearch keeps a point in time alive between two pages
+PIT_KEEP_ALIVE = "1m"
+# Sort order of searches against a point in time. _shard_doc makes it a total
+# order, so search_after never skips or repeats a hit, without loading the _id
+# field data on the heap.
+PIT_SORT = [{"_shard_doc": "asc"}]
+# How long OpenSearch keeps the point in time of search_page alive after each
+# page. Callers request the next page between two invocations of the query
+# API, and a cached first page hands out the point in time of its cursor until
+# the query cache entry expires.
+PAGE_KEEP_ALIVE = "5m"
+# Statuses of bulk requests and items worth sending again: the cluster is
+# throttling or temporarily unavailable
+RETRY_STATUSES = {429, 502, 503, 504}
+# Seconds to wait for the response to one bulk request
+BULK_REQUEST_TIMEOUT = 120
 
 
 class Client:
@@ -23,7 +50,9 @@ class Client:
         turn on / off verification of SSL certificates.
     connection_class:
 
-
+    http_compress: boolean
+        turn on / off gzip compression of the request bodies and of the
+        responses.
 
     Methods
     -------
@@ -33,12 +62,29 @@ class Client:
         deletes an index in the OpenSearch cluster.
     index_exists(index):
         checks whether a particular index exists in the OpenSearch cluster.
+    put_index_template(index):
+        creates or updates the template applied when the index is created.
     document_exists(document):
         checks whether a particular document exists in the OpenSearch cluster.
     send_document(document):
         sends a document to the OpenSearch cluster with its associated action.
-    send_payload(payload):
-        Sends a bulk payload of documents to the OpenSearch cluster.
+    send_payload(payload, max_workers, max_retries, base_delay, refresh):
+        Sends a bulk payload of documents to the OpenSearch cluster, returns
+        a BulkResult.
+    send_chunk(items, max_retries, base_delay, refresh):
+        Sends one chunk of a payload, returns a BulkResult.
+    iter_search(query, index, page_size):
+        yields the hits matching a query one page at a time.
+    search(query, index):
+        returns every hit matching a query.
+    search_page(query, index, page_size, cursor):
+        returns one page of hits and the cursor to request the next one.
+    parallel_scan(query, index, slices, page_size):
+        yields every hit matching a query, read by several threads at once.
+    count(query, index):
+        returns the number of documents matching a query.
+    aggregate(query, index):
+        returns the buckets of the aggregations of a query.
 
 
     """
@@ -50,18 +96,23 @@ class Client:
         use_ssl=True,
         verify_certs=True,
         connnection_class=opensearchpy.RequestsHttpConnection,
+        http_compress=False,
     ):
         self.hosts = hosts
         self.http_auth = http_auth
         self.use_ssl = use_ssl
         self.verify_certs = verify_certs
         self.connnection_class = connnection_class
+        self.http_compress = http_compress
         self.client = opensearchpy.OpenSearch(
             hosts=self.hosts,
             http_auth=self.http_auth,
             use_ssl=self.use_ssl,
             verify_certs=self.verify_certs,
             connection_class=self.connnection_class,
+            # trades CPU time for fewer bytes on the wire, worth it over the
+            # network to the domain but not on a local connection
+            http_compress=self.http_compress,
         )
 
     def create_index(self, index):
@@ -99,6 +150,22 @@ class Client:
         """
         return self.client.indices.exists(index.get_name())
 
+    def put_index_template(self, index):
+        """
+        Creates or updates an index template holding the body of the index,
+        so the settings and mappings apply whenever OpenSearch creates the
+        index, including when a document is written to a missing index.
+
+        Parameters
+        ----------
+        index: Index
+            index whose body holds the settings and mappings of the template.
+        """
+        self.client.indices.put_index_template(
+            name=f"{index.get_name()}-template",
+            body={"index_patterns": [index.get_name()], "template": index.get_body()},
+        )
+
     def document_exists(self, document):
         """
         Returns an boolean indicating whether the document exists in the index.
@@ -135,22 +202,155 @@ class Client:
         elif action == Action.INDEX:
             self._index_document(document)
 
-    def send_payload(self, payload):
+    def send_payload(
+        self, payload, max_workers=4, max_retries=5, base_delay=0.5, refresh=None
+    ):
         """
         Sends a bulk payload of documents to the OpenSearch cluster.
 
+        The chunks of the payload are sent concurrently. Documents rejected
+        because the cluster is throttling (429) or unavailable are sent again
+        with exponential backoff, other rejected documents are reported in
+        the returned result.
+
         Parameters
         ----------
         payload: Payload
             payload containing bulk documents to be sent to the OpenSearch cluster.
+        max_workers: int, optional
+            maximum number of bulk requests in flight.
+        max_retries: int, optional
+            number of times throttled documents are sent again.
+        base_delay: float, optional
+            seconds to wait before the first retry, doubled on every retry.
+        refresh: str, optional
+            refresh parameter of the bulk requests, "wait_for" returns once
+            the documents are searchable without forcing a refresh.
+
+        Returns
+        -------
+        BulkResult
+            number of documents accepted and details of the rejected ones.
+        """
+        result = BulkResult()
+        chunks = payload.chunk_items()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            chunk_results = executor.map(
+                lambda items: self.send_chunk(items, max_retries, base_delay, refresh),
+                chunks,
+            )
+            for chunk_result in chunk_results:
+                result.merge(chunk_result)
+
+        if not result.is_successful():
+            logger.error(
+                f"{len(result.failed)} documents were rejected by OpenSearch, "
+                f"first failure: {result.failed[0]}"
+            )
+        return result
+
+    def send_chunk(self, items, max_retries=5, base_delay=0.5, refresh=None):
         """
-        for chunk in payload.payload_chunks():
-            self.client.bulk(chunk, params={"request_timeout": 1000000})
+        Sends one chunk of a payload in a bulk request and retries the
+        throttled documents.
+
+        Parameters
+        ----------
+        items: list
+            encoded bulk request lines of each document.
+        max_retries: int, optional
+            number of times throttled documents are sent again.
+        base_delay: float, optional
+            seconds to wait before the first retry, doubled on every retry.
+        refresh: str, optional
+            refresh parameter of the bulk request.
+
+        Returns
+        -------
+        BulkResult
+            outcome of every document of items.
+        """
+        result = BulkResult()
+        params = {"request_timeout": BULK_REQUEST_TIMEOUT}
+        if refresh is not None:
+            params["refresh"] = refresh
+        for attempt in range(max_retries + 1):
+            last_attempt = attempt == max_retries
+            try:
+                response = self.client.bulk(b"".join(items), params=params)
+            except opensearchpy.TransportError as e:
+                items = _handle_bulk_error(e, items, result, last_attempt)
+            else:
+                items = _handle_bulk_response(response, items, result, last_attempt)
+
+            if not items:
+                break
+            delay = base_delay * 2**attempt
+            logger.info(
+                f"{len(items)} documents were throttled, retrying in {delay} seconds."
+            )
+            result.retries += 1
+            time.sleep(delay)
+
+        return result
 
     def get_document(self, document):
         """Returns the specified document"""
         return self.client.get(index=document.get_index(), id=document.get_identifier())
 
+    def iter_search(self, query, index, page_size=None):
+        """
+        Yields the hits matching the query, fetching one page at a time.
+
+        The search runs against a point in time of the index and pages through
+        it with search_after, so only one page of hits is held in memory and
+        the results are consistent even if documents are indexed meanwhile. The
+        point in time is released once the generator is exhausted or closed.
+
+        Parameters
+        ----------
+        query: Query
+            query object instantiated with the desired query parameters.
+        index: Index
+            OpenSearch index to use for the search.
+        page_size: int, optional
+            number of hits fetched per request, defaults to the query size.
+
+        Yields
+        ------
+        dict
+            the hits matching the query, in the order they are stored in the index.
+        """
+        page_size = page_size or query.size()
+        pit_id = self.client.create_pit(
+            index=index.get_name(), params={"keep_alive": PIT_KEEP_ALIVE}
+        )["pit_id"]
+        try:
+            search_after = None
+            while True:
+                body = {
+                    **query.query_dsl(),
+                    **query.source_dsl(),
+                    "size": page_size,
+                    "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+                    "sort": PIT_SORT,
+                }
+                if search_after is not None:
+                    body["search_after"] = search_after
+
+                result = self.client.search(body=body)
+                # OpenSearch may return a new id for the point in time
+                pit_id = result.get("pit_id", pit_id)
+                hits = result["hits"]["hits"]
+                for hit in hits:
+                    search_after = hit.pop("sort")
+                    yield hit
+
+                if len(hits) < page_size:
+                    break
+        finally:
+            self.client.delete_pit(body={"pit_id": [pit_id]})
+
     def search(self, query, index):
         """
         Searches the OpenSearch cluster using the provided query object.
@@ -161,25 +361,251 @@ class Client:
             query object instantiated with the desired query parameters.
         index: Index
             OpenSearch index to use for the search.
+
+        Returns
+        -------
+        list
+            every hit matching the query, see iter_search.
         """
-        # search the opensearch instance with scroll to handle larger responses
-        result = self.client.search(
-            body=query.query_dsl(), index=index.get_name(), params={"scroll": "1m"}
-        )
-        scroll_id = result["_scroll_id"]
-        scroll_size = len(result["hits"]["hits"])
-        counter = 0
-        full_result = result["hits"]["hits"]
+        return list(self.iter_search(query, index))
+
+    def search_page(self, query, index, page_size=None, cursor=None):
+        """
+        Returns one page of the hits matching the query.
+
+        The first page opens a point in time of the index and every page is
+        read from it sorted by _shard_doc, so later pages are consistent with
+        the first one and no field data is loaded. The point in time is kept
+        alive for PAGE_KEEP_ALIVE after each page and is only closed right
+        away when the first page is also the last one, the cursor of a cached
+        page may still be in use.
+
+        Parameters
+        ----------
+        query: Query
+            query object instantiated with the desired query parameters.
+        index: Index
+            OpenSearch index to use for the search.
+        page_size: int, optional
+            number of hits to return, defaults to the query size.
+        cursor: dict, optional
+            cursor returned with the previous page.
+
+        Returns
+        -------
+        tuple
+            the hits of the page and the cursor to pass to get the next page,
+            or None if this is the last page.
+
+        Raises
+        ------
+        ValueError
+            if the point in time of the cursor has expired.
+        """
+        page_size = page_size or query.size()
+        if cursor is None:
+            pit_id = self.client.create_pit(
+                index=index.get_name(), params={"keep_alive": PAGE_KEEP_ALIVE}
+            )["pit_id"]
+        else:
+            pit_id = cursor["pit_id"]
+        # one extra hit tells whether there is a next page
+        body = {
+            **query.query_dsl(),
+            **query.source_dsl(),
+            "size": page_size + 1,
+            "pit": {"id": pit_id, "keep_alive": PAGE_KEEP_ALIVE},
+            "sort": PIT_SORT,
+        }
+        if cursor is not None:
+            body["search_after"] = cursor["search_after"]
+
+        try:
+            result = self.client.search(body=body)
+        except opensearchpy.NotFoundError as e:
+            if cursor is None:
+                self.client.delete_pit(body={"pit_id": [pit_id]})
+                raise
+            raise ValueError("The cursor has expired, run the query again") from e
+        # OpenSearch may return a new id for the point in time
+        pit_id = result.get("pit_id", pit_id)
+        hits = result["hits"]["hits"]
+        next_cursor = None
+        if len(hits) > page_size:
+            next_cursor = {
+                "pit_id": pit_id,
+                "search_after": hits[page_size - 1]["sort"],
+            }
+        elif cursor is None:
+            self.client.delete_pit(body={"pit_id": [pit_id]})
+        hits = hits[:page_size]
+        for hit in hits:
+            hit.pop("sort")
+        return hits, next_cursor
+
+    def count(self, query, index):
+        """
+        Returns the number of documents matching the query, without fetching
+        any of them.
 
-        # scroll through the results and add results to list
-        while scroll_size > 0:
-            counter += scroll_size
-            result = self.client.scroll(scroll_id=scroll_id, scroll="1m")
-            full_result += result["hits"]["hits"]
-            scroll_id = result["_scroll_id"]
-            scroll_size = len(result["hits"]["hits"])
+        Parameters
+        ----------
+        query: Query
+            query object instantiated with the desired query parameters.
+        index: Index
+            OpenSearch index to use for the search.
+
+        Returns
+        -------
+        int
+            number of documents matching the query.
+        """
+        return self.client.count(body=query.query_dsl(), index=index.get_name())[
+            "count"
+        ]
+
+    def aggregate(self, query, index):
+        """
+        Runs the aggregations of the query over the matching documents,
+        without fetching any of them, so the response size only depends on the
+        number of buckets.
+
+        Parameters
+        ----------
+        query: Query
+            query object with at least one aggregation.
+        index: Index
+            OpenSearch index to use for the search.
 
-        return full_result
+        Returns
+        -------
+        dict
+            the buckets of every aggregation of the query by name, as a list
+            of {"key": value, "count": number of documents}. Date histogram
+            keys are formatted dates.
+        """
+        body = {**query.query_dsl(), "size": 0, "aggs": query.aggregation_dsl()}
+        result = self.client.search(body=body, index=index.get_name())
+        return {
+            name: [
+                {
+                    "key": bucket.get("key_as_string", bucket["key"]),
+                    "count": bucket["doc_count"],
+                }
+                for bucket in aggregation["buckets"]
+            ]
+            for name, aggregation in result.get("aggregations", {}).items()
+        }
+
+    def parallel_scan(self, query, index, slices=4, page_size=None):
+        """
+        Yields every hit matching the query, reading the index with several
+        threads at once.
+
+        The point in time of the index is split into slices, and each slice is
+        paged through with search_after by its own thread, so a full export of
+        an index is not limited to the throughput of a single cursor. The hits
+        of the slices are merged in the order they arrive, so unlike
+        iter_search they are not sorted. At most a few pages per slice are
+        held in memory, and the threads and the point in time are released
+        once the generator is exhausted or closed.
+
+        Parameters
+        ----------
+        query: Query
+            query object instantiated with the desired query parameters.
+        index: Index
+            OpenSearch index to use for the search.
+        slices: int, optional
+            number of slices read in parallel.
+        page_size: int, optional
+            number of hits fetched per request, defaults to the query size.
+
+        Yields
+        ------
+        dict
+            the hits matching the query, in no particular order.
+        """
+        if slices < 1:
+            raise ValueError(f"slices must be at least 1, got {slices}")
+        if slices == 1:
+            yield from self.iter_search(query, index, page_size)
+            return
+
+        page_size = page_size or query.size()
+        pit_id = self.client.create_pit(
+            index=index.get_name(), params={"keep_alive": PIT_KEEP_ALIVE}
+        )["pit_id"]
+        # pages of hits, or an exception, or None once a slice is done
+        pages = queue.Queue(maxsize=2 * slices)
+        stop = threading.Event()
+        try:
+            with ThreadPoolExecutor(max_workers=slices) as executor:
+                try:
+                    for slice_id in range(slices):
+                        executor.submit(
+                            self._scan_slice,
+                            query,
+                            pit_id,
+                            {"id": slice_id, "max": slices},
+                            page_size,
+                            pages,
+                            stop,
+                        )
+
+                    remaining = slices
+                    while remaining:
+                        page = pages.get()
+                        if page is None:
+                            remaining -= 1
+                        elif isinstance(page, Exception):
+                            raise page
+                        else:
+                            yield from page
+                finally:
+                    # lets the threads exit if the generator stops early
+                    stop.set()
+        finally:
+            self.client.delete_pit(body={"pit_id": [pit_id]})
+
+    def _scan_slice(self, query, pit_id, slice_, page_size, pages, stop):
+        """Puts the pages of hits of one slice of a point in time on pages."""
+
+        def put(item):
+            # waits for the consumer, unless it is gone
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            search_after = None
+            while not stop.is_set():
+                body = {
+                    **query.query_dsl(),
+                    **query.source_dsl(),
+                    "size": page_size,
+                    "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+                    "sort": PIT_SORT,
+                    "slice": slice_,
+                }
+                if search_after is not None:
+                    body["search_after"] = search_after
+
+                hits = self.client.search(body=body)["hits"]["hits"]
+                for hit in hits:
+                    search_after = hit.pop("sort")
+                if hits and not put(hits):
+                    return
+                if len(hits) < page_size:
+                    break
+        except Exception as e:
+            put(e)
+            return
+        put(None)
 
     def close(self):
         """Close the Transport and all internal connections"""
@@ -251,3 +677,78 @@ class Client:
             id=document.get_identifier(),
             body=document.get_body(),
         )
+
+
+def _handle_bulk_response(response, items, result, last_attempt):
+    """
+    Records the outcome of each document of a bulk response.
+
+    Parameters
+    ----------
+    response: dict
+        the bulk response.
+    items: list
+        encoded bulk request lines of each document of the request.
+    result: BulkResult
+        result the outcome of the documents is added to.
+    last_attempt: bool
+        whether throttled documents are reported as failed instead of being
+        returned for a retry.
+
+    Returns
+    -------
+    list
+        the items to send again.
+    """
+    retry_items = []
+    for item, response_item in zip(items, response["items"]):
+        ((action, item_result),) = response_item.items()
+        if item_result.get("status") in RETRY_STATUSES and not last_attempt:
+            retry_items.append(item)
+        else:
+            result.add_item(action, item_result)
+    return retry_items
+
+
+def _handle_bulk_error(error, items, result, last_attempt):
+    """
+    Handles a bulk request that failed as a whole.
+
+    Parameters
+    ----------
+    error: opensearchpy.TransportError
+        the error raised by the request, re-raised unless it is a throttling
+        or unavailability error.
+    items: list
+        encoded bulk request lines of each document of the request.
+    result: BulkResult
+        result the failed documents are added to on the last attempt.
+    last_attempt: bool
+        whether the documents are reported as failed instead of being
+        returned for a retry.
+
+    Returns
+    -------
+    list
+        the items to send again.
+    """
+    if error.status_code not in RETRY_STATUSES:
+        raise error
+    if not last_attempt:
+        return items
+
+    # report the whole request as failed
+    for item in items:
+        action, metadata = _bulk_item_action(item)
+        reason = {"type": str(error.error), "reason": str(error.info)}
+        result.add_item(
+            action, {**metadata, "status": error.status_code, "error": reason}
+        )
+    return []
+
+
+def _bulk_item_action(item):
+    """Returns the action and the metadata of a bulk item's action line."""
+    action_line = json.loads(item.split(b"\n", 1)[0])
+    ((action, metadata),) = action_line.items()
+    return action, metadata
@@ -1,9 +1,19 @@
 import json
 
+try:
+    import orjson
+except ImportError:  # orjson is not installed in the lambda environment
+    orjson = None
+
 from .action import Action
 from .index import Index
 
 
+def _json_dumps(body):
+    """Returns the body encoded as UTF-8 JSON with the standard library."""
+    return json.dumps(body).encode("utf-8")
+
+
 class Document:
     """
     Class to represent an OpenSearch document.
@@ -25,6 +35,10 @@ class Document:
     size: int
         the size of the document in bytes.
 
+    The contents are only serialized the first time they or the size are
+    requested, and the encoded bytes are kept until the body or the action
+    change.
+
     Methods
     -------
     update_body(body):
@@ -42,10 +56,19 @@ class Document:
     get_contents():
         returns full contents of the document as a str. this includes
         the index, action, identifier, and body.
+    get_encoded_contents():
+        returns the full contents of the document as UTF-8 encoded bytes.
     size_in_bytes():
-        returns the size of the encoded (ascii) document contents in bytes.
+        returns the size of the UTF-8 encoded document contents in bytes.
+    use_fast_json(enabled):
+        class method to serialize the bodies with orjson when it is installed.
     """
 
+    __slots__ = ("index", "identifier", "action", "body", "_encoded")
+
+    # encoder of the document bodies, a function returning bytes
+    _dumps = staticmethod(_json_dumps)
+
     def __init__(
         self,
         index,
@@ -57,10 +80,8 @@ class Document:
         self.identifier = self._validate_identifier(doc_id)
         self.action = Action.validate_action(action)
         self.body = body or {}
-        self.contents = ""
-        self.size = 0
-
-        self._update_contents()
+        # encoded contents, built on first use
+        self._encoded = None
 
     def update_body(self, body):
         """
@@ -73,7 +94,7 @@ class Document:
         """
         if type(body) is dict:
             self.body = body
-            self._update_contents()
+            self._encoded = None
         else:
             raise TypeError(
                 "Document body passed in as type {}, but must be of type dict".format(
@@ -91,6 +112,7 @@ class Document:
             action to be performed on the document by OpenSearch.
         """
         self.action = Action.validate_action(action)
+        self._encoded = None
 
     def get_body(self):
         """Returns the body of the document as a string."""
@@ -110,24 +132,60 @@ class Document:
 
     def get_contents(self):
         """Returns the full contents of the document as a string."""
-        return self.contents
+        return self.get_encoded_contents().decode("utf-8")
+
+    def get_encoded_contents(self):
+        """Returns the full contents of the document as UTF-8 encoded bytes."""
+        if self._encoded is None:
+            self._encoded = self._encode_contents()
+        return self._encoded
 
     def size_in_bytes(self):
         """Returns the size of the document's bulk request json string in bytes."""
-        return self.size
+        return len(self.get_encoded_contents())
+
+    @property
+    def contents(self):
+        return self.get_contents()
+
+    @property
+    def size(self):
+        return self.size_in_bytes()
+
+    @classmethod
+    def use_fast_json(cls, enabled=True):
+        """
+        Serializes the document bodies with orjson if it is installed, which
+        is several times faster than the standard library but writes compact
+        JSON without spaces. Documents already serialized are not affected.
+
+        Parameters
+        ----------
+        enabled: bool, optional
+            whether to use orjson, False goes back to the standard library.
+
+        Returns
+        -------
+        bool
+            whether orjson is used.
+        """
+        if enabled and orjson is not None:
+            cls._dumps = staticmethod(orjson.dumps)
+            return True
+        cls._dumps = staticmethod(_json_dumps)
+        return False
 
-    def _update_contents(self):
+    def _encode_contents(self):
         action_string = (
             '{ "'
             + self.action.value
-            + '": { "_index": "'
-            + self.index.get_name()
-            + '", "_id": "'
-            + self.identifier
-            + '" } }\n'
+            + '": { "_index": '
+            + json.dumps(self.index.get_name())
+            + ', "_id": '
+            + json.dumps(self.identifier)
+            + " } }\n"
         )
-        self.contents = action_string + json.dumps(self.body) + "\n"
-        self.size = len(self.contents.encode("ascii"))
+        return action_string.encode("utf-8") + self._dumps(self.body) + b"\n"
 
     def _validate_identifier(self, identifier):
         if type(identifier) is str or type(identifier) is int:
@@ -150,4 +208,4 @@ class Document:
         return type(document) is Document
 
     def __repr__(self):
-        return str(self.contents)
+        return self.get_contents()
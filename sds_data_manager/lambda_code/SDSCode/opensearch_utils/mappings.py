@@ -0,0 +1,61 @@
+# Settings and mappings of the indexes written by the indexer lambda.
+#
+# The bodies are installed as index templates, so they apply whenever OpenSearch
+# creates the index on the first write. Indexes that already exist keep their
+# mapping until they are reindexed.
+
+# Shared by both indexes, sized for the single t3.small data node: one shard
+# and no replica that could never be allocated. Refreshing every 30s instead of
+# every second saves indexing work, documents are searchable after that delay.
+INDEX_SETTINGS = {
+    "index": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+        "refresh_interval": "30s",
+    }
+}
+
+# Any string field not listed in the mappings is stored as an exact value,
+# filenames only hold codes (instrument, level, version...) and are never
+# searched as free text.
+STRINGS_AS_KEYWORDS = {
+    "strings_as_keywords": {
+        "match_mapping_type": "string",
+        "mapping": {"type": "keyword"},
+    }
+}
+
+METADATA_INDEX_BODY = {
+    "settings": INDEX_SETTINGS,
+    "mappings": {
+        "dynamic_templates": [STRINGS_AS_KEYWORDS],
+        "properties": {
+            "mission": {"type": "keyword"},
+            "level": {"type": "keyword"},
+            "type": {"type": "keyword"},
+            "instrument": {"type": "keyword"},
+            # dates in filenames are written as 20230724, queries may also
+            # use ISO 8601 dates
+            "date": {
+                "type": "date",
+                "format": "yyyyMMdd||strict_date_optional_time||epoch_millis",
+            },
+            "version": {"type": "keyword"},
+            "extension": {"type": "keyword"},
+        },
+    },
+}
+
+DATA_TRACKER_INDEX_BODY = {
+    "settings": INDEX_SETTINGS,
+    "mappings": {
+        "dynamic_templates": [STRINGS_AS_KEYWORDS],
+        "properties": {
+            "instrument": {"type": "keyword"},
+            "filename": {"type": "keyword"},
+            "data_level": {"type": "keyword"},
+            "version": {"type": "keyword"},
+            "status": {"type": "keyword"},
+        },
+    },
+}
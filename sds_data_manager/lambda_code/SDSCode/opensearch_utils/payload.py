@@ -1,5 +1,9 @@
 from .document import Document
 
+# Bulk requests are kept under the 10 MiB payload limit of the smallest
+# OpenSearch Service instance types, with room for the HTTP overhead.
+DEFAULT_MAX_BYTES = 5281500
+
 
 class Payload:
     """
@@ -7,12 +11,21 @@ class Payload:
 
     ...
 
+    Documents are encoded once when they are added. Each chunk keeps the
+    encoded documents as a list of bytes with a running size, and the parts
+    are only joined when a chunk is sent.
 
     Attributes
     ----------
     payload_contents: list
-        list of json strings representing the full payload contents,
-        broken up into a list to avoid request limits when sending to OpenSearch.
+        list of chunks, each a list of the UTF-8 encoded bulk request lines
+        of its documents, broken up to avoid request limits when sending to
+        OpenSearch.
+    max_bytes: int, optional
+        maximum size of a chunk in bytes. A document larger than this is
+        sent in a chunk of its own.
+    max_docs: int, optional
+        maximum number of documents in a chunk, unlimited by default.
 
     Methods
     -------
@@ -21,10 +34,18 @@ class Payload:
         bulk upload.
     get_contents():
         returns the full payload contents as a string.
+    payload_chunks():
+        returns the body of each bulk request as bytes.
+    chunk_items():
+        returns the encoded documents of each bulk request.
     """
 
-    def __init__(self):
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_docs=None):
         self.payload_contents = []
+        self.max_bytes = max_bytes
+        self.max_docs = max_docs
+        # size in bytes of the last chunk of payload_contents
+        self._chunk_size = 0
 
     def add_documents(self, documents):
         """
@@ -58,40 +79,38 @@ class Payload:
 
     def get_contents(self):
         """Returns the contents of the payload as a string."""
-        full_contents = "".join(self.payload_contents)
-        return full_contents
+        return b"".join(b"".join(chunk) for chunk in self.payload_contents).decode()
 
     def payload_chunks(self):
         """Returns a list of payload documents chunked to avoid bulk upload limits"""
+        return [b"".join(chunk) for chunk in self.payload_contents]
+
+    def chunk_items(self):
+        """
+        Returns the encoded documents of each chunk, as a list of bytes per
+        chunk, so failed documents can be sent again on their own.
+        """
         return self.payload_contents
 
     def __repr__(self):
         return str(self.payload_contents)
 
     def _add_to_payload(self, document):
-        # TODO: not sure what the actual request limit is or how it's
-        # determined, but the size of the encoded string seems to be
-        # the most consistent way to check if the limit is hit and that
-        # limit seems to be somewhere around the number of bytes below.
-        # Need to figure out how the request limits work.
-        request_limit = 5281500  # bytes
-
-        # check if the payload is empty and if the payload with the
-        # new document added would still be under the request limit
+        contents = document.get_encoded_contents()
+        size = len(contents)
+
+        # start a new chunk if the payload is empty or if the document would
+        # take the last chunk over one of its limits
         if (
-            len(self.payload_contents) > 0
-            and self._size_in_bytes(self.payload_contents[-1])
-            + document.size_in_bytes()
-            < request_limit
-        ):
-            # concat the new document
-            self.payload_contents[-1] = (
-                self.payload_contents[-1] + document.get_contents()
+            not self.payload_contents
+            or self._chunk_size + size > self.max_bytes
+            or (
+                self.max_docs is not None
+                and len(self.payload_contents[-1]) >= self.max_docs
             )
-        else:
-            # start a new payload chunk with the new document
-            self.payload_contents.append(document.get_contents())
+        ):
+            self.payload_contents.append([])
+            self._chunk_size = 0
 
-    def _size_in_bytes(self, payload):
-        """Returns the size of the payload contents in bytes."""
-        return len(payload.encode("ascii"))
+        self.payload_contents[-1].append(contents)
+        self._chunk_size += size
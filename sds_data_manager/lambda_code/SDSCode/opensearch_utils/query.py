@@ -1,6 +1,7 @@
 import json
 
 VALID_PARAMS = ["instrument", "level", "start_date", "end_date"]
+CALENDAR_INTERVALS = ["day", "week", "month", "quarter", "year"]
 
 
 class Query:
@@ -20,6 +21,12 @@ class Query:
         dictionary containing the json query in the OpenSearch DSL format.
     query_size: int, optional
         number of results to return. default is 10.
+    fields: list, optional
+        fields of the documents returned with the hits, every field by default
+        and none if the list is empty.
+    aggregations: dict
+        dictionary containing the aggregations of the query in the OpenSearch
+        DSL format, by name.
 
 
     Methods
@@ -28,12 +35,22 @@ class Query:
         returns the query in the OpenSearch Query DSL format
     size: int
         returns the number of results the query is allowed to return in the search.
+    add_terms_aggregation(name, field, size):
+        groups the matching documents by the values of a field.
+    add_date_histogram_aggregation(name, field, interval):
+        groups the matching documents by calendar interval of a date field.
+    aggregation_dsl: dict
+        returns the aggregations in the OpenSearch Query DSL format
+    source_dsl: dict
+        returns the source filtering in the OpenSearch Query DSL format
     """
 
-    def __init__(self, query_params, size=10):
+    def __init__(self, query_params, size=10, fields=None):
         self.query_params = query_params
         self.query_dsl_formatted = self._build_query_dsl(query_params)
         self.query_size = size
+        self.fields = fields
+        self.aggregations = {}
 
     def query_dsl(self):
         """Returns the query parameters in the AWS OpenSearch Query DSL format"""
@@ -43,10 +60,73 @@ class Query:
         """Returns the number of results the query is allowed to return in the search"""
         return self.query_size
 
+    def add_terms_aggregation(self, name, field, size=10):
+        """
+        Adds an aggregation counting the matching documents per value of a
+        keyword field, e.g. the number of files per instrument.
+
+        Parameters
+        ----------
+        name: str
+            name of the aggregation in the search response.
+        field: str
+            keyword field to group the documents by.
+        size: int, optional
+            maximum number of values returned, the most frequent first.
+        """
+        self.aggregations[name] = {"terms": {"field": field, "size": size}}
+
+    def add_date_histogram_aggregation(self, name, field="date", interval="day"):
+        """
+        Adds an aggregation counting the matching documents per calendar
+        interval of a date field, e.g. the number of files per day.
+
+        Parameters
+        ----------
+        name: str
+            name of the aggregation in the search response.
+        field: str, optional
+            date field to group the documents by.
+        interval: str, optional
+            calendar interval of the groups, one of CALENDAR_INTERVALS.
+        """
+        if interval not in CALENDAR_INTERVALS:
+            raise ValueError(
+                f"interval must be one of {CALENDAR_INTERVALS}, got {interval}"
+            )
+        self.aggregations[name] = {
+            "date_histogram": {
+                "field": field,
+                "calendar_interval": interval,
+                # only return the intervals with documents
+                "min_doc_count": 1,
+            }
+        }
+
+    def aggregation_dsl(self):
+        """Returns the aggregations in the AWS OpenSearch Query DSL format"""
+        return self.aggregations
+
+    def source_dsl(self):
+        """
+        Returns the source filtering of the hits in the AWS OpenSearch Query
+        DSL format, to add to the search requests returning hits.
+        """
+        if self.fields is None:
+            return {}
+        if not self.fields:
+            # OpenSearch returns every field when includes is empty
+            return {"_source": False}
+        return {"_source": {"includes": self.fields}}
+
     def _build_query_dsl(self, query_params):
         """
         Builds a Query DSL using a dictionary with field:value pairings.
 
+        Every parameter becomes a clause of the bool filter context: exact
+        term queries on the keyword fields and a range on the date field.
+        Filter clauses are not scored, so OpenSearch can cache them.
+
         Parameters
         ----------
         query_params: dict
@@ -55,7 +135,6 @@ class Query:
         """
         # define the query structure
         query = {"query": {"bool": {}}}
-        query_match_structure = {"match": {}}
         query_date_structure = {"range": {"date": {}}}
 
         # remove all params that are not valid
@@ -66,33 +145,23 @@ class Query:
         }
 
         # create the query
+        filters = []
         for param in query_params:
             # create a date query using start and end date parameters
-            if param == "start_date" or param == "end_date":
-                # create the filter strcture for date queries if it hasn't
-                # already been created
-                if "filter" not in query["query"]["bool"]:
-                    query["query"]["bool"]["filter"] = query_date_structure
+            if param == "start_date":
                 # create the greater than or equal to (gte) start date query
-                if param == "start_date":
-                    query["query"]["bool"]["filter"]["range"]["date"][
-                        "gte"
-                    ] = query_params[param]
+                query_date_structure["range"]["date"]["gte"] = query_params[param]
+            elif param == "end_date":
                 # create the less than or equal to (lte) end date query
-                if param == "end_date":
-                    query["query"]["bool"]["filter"]["range"]["date"][
-                        "lte"
-                    ] = query_params[param]
+                query_date_structure["range"]["date"]["lte"] = query_params[param]
             else:
-                # create the must query structure if it doesn't
-                # already exist
-                if "must" not in query["query"]["bool"]:
-                    query["query"]["bool"]["must"] = []
-
-                # add the search parameters to the must query structure
-                query_match = query_match_structure.copy()
-                query_match["match"] = {param: query_params[param]}
-                query["query"]["bool"]["must"].append(query_match)
+                # add an exact match on the keyword field
+                filters.append({"term": {param: query_params[param]}})
+
+        if query_date_structure["range"]["date"]:
+            filters.append(query_date_structure)
+        if filters:
+            query["query"]["bool"]["filter"] = filters
 
         return query
 
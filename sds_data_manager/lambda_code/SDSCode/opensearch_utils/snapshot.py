@@ -1,9 +1,11 @@
 import logging
 import string
+import time
 from datetime import datetime
 
 import boto3
 import requests
+from botocore.exceptions import ClientError
 from requests_aws4auth import AWS4Auth
 
 
@@ -69,67 +71,280 @@ def take_snapshot(url: string, awsauth):
     return r
 
 
-def run_backup(host, region, snapshot_repo_name, snapshot_s3_bucket, snapshot_role_arn):
-    """Creates a backup of the current state of OpenSearch. This includes registering
-    a repository, if needed, as well as timestamping the snapshot name, constructing
-    the snapshot url, and taking the snapshot.
-        Parameters
+def snapshot_in_progress(url: string, awsauth):
+    """Check whether a snapshot is currently running on the domain.
+
+    Parameters
+    ----------
+    url : str
+        OpenSearch _snapshot/_status endpoint URL including https://.
+    awsauth: AWS4Auth
+        Credentials for use in snapshot requests
+
+    Returns
+    -------
+    bool
+        True if at least one snapshot is in progress.
+    """
+    r = requests.get(url, auth=awsauth)
+    if r.status_code != 200:
+        raise RuntimeError(f"{r.status_code}.{r.text}")
+    return len(r.json().get("snapshots", [])) > 0
+
+
+class SnapshotCoordinator:
+    """
+    Class to coalesce the snapshot requests of many indexer invocations into
+    at most one snapshot per interval.
+
+    ...
+
+    The snapshot repository is registered the first time a snapshot is taken
+    and is not registered again by the same coordinator. Concurrent lambdas
+    agree on who takes the next snapshot through a lease item in a DynamoDB
+    table: the item is only written when the previous lease has expired, so
+    exactly one caller per interval wins. The lease is only taken once no
+    other snapshot is in progress on the domain, and it is released if the
+    snapshot can not be initiated.
+
+    A caller that skips its snapshot marks the lease item as pending, so the
+    writes at the end of a burst are not left out: take_pending_snapshot,
+    called on a schedule, takes a trailing snapshot once the interval has
+    passed.
+
+    Attributes
     ----------
     host : str
         The OpenSearch domain endpoint (does not include https:// or trailing /)
     region : str
         The region where the OpenSearch instance is deployed
     snapshot_repo_name : str
-        The name of the snpashot repository. This can be different than
-        the S3 bucket name.
+        The name of the snapshot repository.
     snapshot_s3_bucket : str
         The name of the S3 bucket that will be used to store the Snapshots
     snapshot_role_arn : str
         The ARN of the Snapshot Role
+    interval : int
+        Minimum number of seconds between two snapshots.
+    lease_table : boto3 DynamoDB Table, optional
+        Table holding the lease item. Without it, the interval is only
+        enforced within this process.
+    lease_key : dict, optional
+        Primary key of the lease item in the lease table. The table must not
+        expire the lease item through a TTL, it holds the pending flag.
+
+    Methods
+    -------
+    take_snapshot_if_due():
+        takes a snapshot if none was taken during the last interval.
+    take_pending_snapshot():
+        takes a snapshot if one was skipped since the last one.
     """
-    awsauth = get_auth(region)
-    snapshot_start_time: datetime = datetime.utcnow().strftime("%Y-%m-%d-%H:%M:%S")
-    snapshot_name = f"opensearch_snapshot_{snapshot_start_time}"
 
-    logging.info(f"Starting process for snapshot: {snapshot_name}.")
+    def __init__(
+        self,
+        host,
+        region,
+        snapshot_repo_name,
+        snapshot_s3_bucket,
+        snapshot_role_arn,
+        interval=900,
+        lease_table=None,
+        lease_key=None,
+    ):
+        self.host = host
+        self.region = region
+        self.snapshot_repo_name = snapshot_repo_name
+        self.snapshot_s3_bucket = snapshot_s3_bucket
+        self.snapshot_role_arn = snapshot_role_arn
+        self.interval = interval
+        self.lease_table = lease_table
+        self.lease_key = lease_key
+        self.repo_registered = False
+        # time before which this process knows the lease is taken
+        self._next_snapshot_time = 0
+        # whether a snapshot was skipped, when there is no lease table
+        self._pending = False
+        self._awsauth = None
+
+    def take_snapshot_if_due(self):
+        """
+        Takes a snapshot unless one was already taken during the current
+        interval or one is still in progress. A skipped snapshot is marked as
+        pending.
+
+        Returns
+        -------
+        bool
+            True if a snapshot was initiated.
+        """
+        if self._take_snapshot(pending_only=False):
+            return True
+        self._mark_pending()
+        return False
 
-    # Register the snapshot, this can be run every time, if the
-    # repo is registered will return 200
-    try:
-        path = f"_snapshot/{snapshot_repo_name}"  # the OpenSearch API endpoint
-        url = "https://" + host + "/" + path
+    def take_pending_snapshot(self):
+        """
+        Takes a snapshot if one was skipped since the last snapshot and the
+        interval has passed.
+
+        Returns
+        -------
+        bool
+            True if a snapshot was initiated.
+        """
+        return self._take_snapshot(pending_only=True)
+
+    def _take_snapshot(self, pending_only):
+        """
+        Takes a snapshot if the interval has passed, no snapshot is in
+        progress and the lease could be taken.
+
+        Parameters
+        ----------
+        pending_only : bool
+            only take a snapshot if one is pending.
+
+        Returns
+        -------
+        bool
+            True if a snapshot was initiated.
+        """
+        now = time.time()
+        if now < self._next_snapshot_time:
+            logging.info("Skipping snapshot, one was taken during this interval.")
+            return False
+        if pending_only and self.lease_table is None and not self._pending:
+            return False
+
+        url = f"https://{self.host}/_snapshot/_status"
+        if snapshot_in_progress(url, self._get_auth()):
+            logging.info("Skipping snapshot, a snapshot is already in progress.")
+            return False
+
+        if not self._acquire_lease(now, pending_only):
+            logging.info("Skipping snapshot, the lease is held or none is pending.")
+            return False
+        self._next_snapshot_time = now + self.interval
+        self._pending = False
+
+        try:
+            self._register_repo()
+            snapshot_start_time = datetime.utcnow().strftime("%Y-%m-%d-%H:%M:%S")
+            snapshot_name = f"opensearch_snapshot_{snapshot_start_time}"
+            path = f"_snapshot/{self.snapshot_repo_name}/{snapshot_name}"
+            response = take_snapshot(f"https://{self.host}/{path}", self._get_auth())
+            if response.status_code != 200:
+                raise RuntimeError(f"{response.status_code}.{response.text}")
+        except Exception:
+            # the next caller may try again right away
+            self._release_lease(now)
+            raise
+        logging.info(f"Snapshot {snapshot_name} initiated.")
+        return True
+
+    def _get_auth(self):
+        if self._awsauth is None:
+            self._awsauth = get_auth(self.region)
+        return self._awsauth
+
+    def _register_repo(self):
+        """Registers the snapshot repository, once per coordinator."""
+        if self.repo_registered:
+            return
 
         payload = {
             "type": "s3",
             "settings": {
-                "bucket": f"{snapshot_s3_bucket}",
-                "region": f"{region}",
-                "role_arn": f"{snapshot_role_arn}",
+                "bucket": f"{self.snapshot_s3_bucket}",
+                "region": f"{self.region}",
+                "role_arn": f"{self.snapshot_role_arn}",
             },
         }
-        response = register_repo(payload, url, awsauth)
-        if response.status_code == 200:
-            logging.info("Repo successfully registered")
-        else:
+        url = f"https://{self.host}/_snapshot/{self.snapshot_repo_name}"
+        response = register_repo(payload, url, self._get_auth())
+        if response.status_code != 200:
             raise RuntimeError(f"{response.status_code}.{response.text}")
-    except Exception as e:
-        logging.info(
-            f"Snapshot repo registration: \
-            {snapshot_repo_name} failed with error code/text: {e}"
+        logging.info("Repo successfully registered")
+        self.repo_registered = True
+
+    def _acquire_lease(self, now, pending_only=False):
+        """
+        Writes the lease item if the previous lease has expired. Writing the
+        item clears its pending flag.
+
+        Parameters
+        ----------
+        now : float
+            current time.
+        pending_only : bool
+            only take the lease if a snapshot is pending.
+
+        Returns
+        -------
+        bool
+            True if this caller now holds the lease.
+        """
+        if self.lease_table is None:
+            return True
+
+        condition = (
+            "(attribute_not_exists(lease_expires_at) OR lease_expires_at <= :now)"
         )
-        raise
-
-    # Initiate a new manual snapshot
-    try:
-        path = f"_snapshot/{snapshot_repo_name}/{snapshot_name}"
-        url = "https://" + host + "/" + path
-        response = take_snapshot(url, awsauth)
-        if response.status_code == 200:
-            logging.info(f"Snapshot {snapshot_name} initiated.")
-        else:
-            raise RuntimeError(f"{response.status_code}.{response.text}")
-    except RuntimeError as e:
-        logging.info(
-            f"Snapshot initiation for {snapshot_name} failed with error code/text: {e}"
+        values = {":now": int(now)}
+        if pending_only:
+            condition += " AND pending = :true"
+            values[":true"] = True
+        try:
+            self.lease_table.put_item(
+                Item={**self.lease_key, "lease_expires_at": int(now + self.interval)},
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def _release_lease(self, now):
+        """
+        Expires the lease taken at now and marks the snapshot as pending.
+
+        Parameters
+        ----------
+        now : float
+            time the lease was taken.
+        """
+        self._next_snapshot_time = 0
+        self._pending = True
+        if self.lease_table is None:
+            return
+
+        try:
+            self.lease_table.update_item(
+                Key=self.lease_key,
+                UpdateExpression="SET lease_expires_at = :expired, pending = :true",
+                # another caller may hold a newer lease already
+                ConditionExpression="lease_expires_at = :expires_at",
+                ExpressionAttributeValues={
+                    ":expired": 0,
+                    ":true": True,
+                    ":expires_at": int(now + self.interval),
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                logging.warning(f"Failed to release the snapshot lease: {e}")
+
+    def _mark_pending(self):
+        """Records that a snapshot was skipped, for take_pending_snapshot."""
+        self._pending = True
+        if self.lease_table is None:
+            return
+
+        self.lease_table.update_item(
+            Key=self.lease_key,
+            UpdateExpression="SET pending = :true",
+            ExpressionAttributeValues={":true": True},
         )
-        raise
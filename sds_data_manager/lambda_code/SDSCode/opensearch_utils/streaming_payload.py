@@ -0,0 +1,137 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .bulk_result import BulkResult
+from .payload import DEFAULT_MAX_BYTES, Payload
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingPayload(Payload):
+    """
+    Class to represent a bulk document payload that is sent to OpenSearch
+    while it is being built.
+
+    ...
+
+    As soon as a chunk is full it is handed to a background thread that sends
+    it with the client, and the payload only keeps the chunk being filled.
+    When max_pending chunks are already being sent, adding a document waits
+    for the oldest one to complete, so memory use does not grow with the
+    number of documents. The payload is also a context manager that flushes
+    on exit. If an exception is raised, the chunks not sent yet are dropped
+    instead, so the original error is not hidden by a failed flush.
+
+    Attributes
+    ----------
+    client: Client
+        client used to send the chunks.
+    result: BulkResult
+        outcome of every chunk sent so far.
+    max_pending: int, optional
+        maximum number of chunks being sent at the same time.
+    max_retries: int, optional
+        number of times throttled documents are sent again.
+    base_delay: float, optional
+        seconds to wait before the first retry, doubled on every retry.
+
+    Methods
+    -------
+    add_documents(documents):
+        adds document(s) to the payload, sending the chunks that are full.
+    flush():
+        sends the remaining documents, waits for every chunk to be sent and
+        returns the result.
+    close():
+        flushes the payload and stops the background threads.
+    clear():
+        drops the chunks not sent yet and stops the background threads.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_bytes=DEFAULT_MAX_BYTES,
+        max_docs=None,
+        max_pending=2,
+        max_retries=5,
+        base_delay=0.5,
+    ):
+        super().__init__(max_bytes=max_bytes, max_docs=max_docs)
+        self.client = client
+        self.result = BulkResult()
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_pending)
+        # futures of the chunks being sent, oldest first
+        self._pending = deque()
+
+    def flush(self):
+        """
+        Sends the documents that are not sent yet and waits for every chunk
+        to be sent.
+
+        Returns
+        -------
+        BulkResult
+            outcome of every document sent by this payload.
+        """
+        if self.payload_contents and self.payload_contents[-1]:
+            self._send_chunk(self.payload_contents.pop())
+        while self._pending:
+            self._wait_oldest()
+        return self.result
+
+    def close(self):
+        """Flushes the payload and stops the background threads."""
+        self.flush()
+        self._executor.shutdown()
+
+    def clear(self):
+        """
+        Drops the chunks that are not sent yet and stops the background
+        threads. The chunks already being sent are waited for.
+        """
+        self.payload_contents.clear()
+        self._executor.shutdown(cancel_futures=True)
+        self._pending.clear()
+
+    def _add_to_payload(self, document):
+        super()._add_to_payload(document)
+        # a new chunk was started, so the previous one is full
+        if len(self.payload_contents) > 1:
+            self._send_chunk(self.payload_contents.pop(0))
+
+    def _send_chunk(self, items):
+        """Sends a chunk in the background, once a thread is available."""
+        while len(self._pending) >= self.max_pending:
+            self._wait_oldest()
+        self._pending.append(
+            self._executor.submit(
+                self.client.send_chunk, items, self.max_retries, self.base_delay
+            )
+        )
+
+    def _wait_oldest(self):
+        """Waits for the oldest chunk being sent and records its result."""
+        self.result.merge(self._pending.popleft().result())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            unsent = len(self.payload_contents) + sum(
+                not future.running() and not future.done() for future in self._pending
+            )
+            logger.warning(f"Dropping {unsent} unsent chunks after {exc_type.__name__}")
+            self.clear()
+            return
+        self.close()
+
+    def __repr__(self):
+        return (
+            f"StreamingPayload({len(self._pending)} chunks being sent, {self.result})"
+        )
@@ -1,14 +1,22 @@
 # Standard
+import base64
+import binascii
+import csv
+import io
 import json
 import logging
 import os
 import sys
+import tempfile
+import time
+import uuid
 
 # Installed
 import boto3
 from opensearchpy import RequestsHttpConnection
 
 # Local
+from .dynamodb_utils.query_cache import QueryCache
 from .opensearch_utils.client import Client
 from .opensearch_utils.index import Index
 from .opensearch_utils.query import Query
@@ -18,6 +26,32 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
+# Number of results per page when the request does not specify a limit
+DEFAULT_LIMIT = 1000
+# Largest page a request may ask for, OpenSearch refuses larger sizes
+MAX_LIMIT = 10000
+# Fields of the metadata index the results can be grouped by
+GROUP_BY_FIELDS = ["mission", "level", "type", "instrument", "date", "version"]
+# Formats the results can be exported in, one line per result, with their
+# content type
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Fields of the metadata index written to CSV exports when no fields are
+# requested, after the S3 path
+CSV_FIELDS = ["mission", "level", "type", "instrument", "date", "version", "extension"]
+# Larger exports are uploaded to S3, Lambda responses are limited to 6 MB
+MAX_INLINE_EXPORT_BYTES = 5 * 1024 * 1024
+# Exports are written to the file once this much text is buffered
+EXPORT_BUFFER_BYTES = 64 * 1024
+
+# Lambda keeps the module loaded between warm invocations, so anything stored
+# here is reused until the container is recycled or the entry expires.
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "300"))
+_cache = {
+    "client": None,
+    "client_created_at": 0.0,
+    "query_cache": None,
+}
+
 
 def _create_open_search_client():
     """Creates and returns an OpenSearch client.
@@ -55,12 +89,172 @@ def _create_open_search_client():
         use_ssl=True,
         verify_certs=True,
         connnection_class=RequestsHttpConnection,
+        http_compress=True,
     )
 
 
+def _get_open_search_client():
+    """Return the OpenSearch client, reused between warm invocations.
+
+    The client (and the Secrets Manager lookup behind it) is only recreated
+    once it is older than ``CACHE_TTL_SECONDS``, so rotated credentials are
+    still picked up.
+
+    Returns
+    -------
+    Client
+        A Client object that's connected to the specified OpenSearch cluster.
+    """
+    now = time.monotonic()
+    if (
+        _cache["client"] is not None
+        and now - _cache["client_created_at"] < CACHE_TTL_SECONDS
+    ):
+        return _cache["client"]
+
+    if _cache["client"] is not None:
+        _cache["client"].close()
+
+    _cache["client"] = _create_open_search_client()
+    _cache["client_created_at"] = now
+    return _cache["client"]
+
+
+def _get_query_cache():
+    """Return the cache of the query results, reused between warm invocations.
+
+    Results are kept in memory for ``QUERY_CACHE_TTL_SECONDS``. When
+    ``QUERY_CACHE_TABLE`` is set, they are also shared with the other
+    containers through that DynamoDB table, where the indexer invalidates
+    them as it writes new documents.
+
+    Returns
+    -------
+    QueryCache
+        The cache of this container.
+    """
+    if _cache["query_cache"] is None:
+        table = None
+        if os.environ.get("QUERY_CACHE_TABLE"):
+            table = boto3.resource("dynamodb").Table(os.environ["QUERY_CACHE_TABLE"])
+        _cache["query_cache"] = QueryCache(
+            max_entries=int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "128")),
+            ttl=int(os.environ.get("QUERY_CACHE_TTL_SECONDS", "60")),
+            table=table,
+        )
+    return _cache["query_cache"]
+
+
+def _encode_next_token(cursor):
+    """Encodes the cursor of the next page into an opaque token."""
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+def _decode_next_token(next_token):
+    """Decodes a token created by _encode_next_token.
+
+    Raises
+    ------
+    ValueError
+        If the token was not created by _encode_next_token.
+    """
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(next_token.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid next_token: {next_token}") from e
+    if (
+        not isinstance(cursor, dict)
+        or not isinstance(cursor.get("pit_id"), str)
+        or not isinstance(cursor.get("search_after"), list)
+    ):
+        raise ValueError(f"Invalid next_token: {next_token}")
+    return cursor
+
+
+def _parse_limit(limit):
+    """Returns the page size requested by the limit query parameter.
+
+    Raises
+    ------
+    ValueError
+        If the limit is not an integer between 1 and MAX_LIMIT.
+    """
+    if limit is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(limit)
+    except ValueError as e:
+        raise ValueError(f"Invalid limit: {limit}") from e
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}, got {limit}")
+    return limit
+
+
+def _parse_fields(fields):
+    """Returns the fields requested by the comma separated fields parameter.
+
+    Every field is returned when the parameter is missing. The S3 path of the
+    files is the id of the hits, so it is always returned.
+    """
+    if fields is None:
+        return None
+    return [field for field in fields.split(",") if field]
+
+
+def _parse_group_by(query, group_by, interval, limit):
+    """Adds the aggregation requested by the group_by query parameter to query.
+
+    Dates are grouped by calendar interval, every other field by value.
+
+    Raises
+    ------
+    ValueError
+        If the results can't be grouped by that field or interval.
+    """
+    if group_by not in GROUP_BY_FIELDS:
+        raise ValueError(f"group_by must be one of {GROUP_BY_FIELDS}, got {group_by}")
+    if group_by == "date":
+        query.add_date_histogram_aggregation(group_by, group_by, interval or "day")
+    else:
+        query.add_terms_aggregation(group_by, group_by, size=limit)
+
+
+def _http_response(status_code, body, content_type="application/json"):
+    """Formats an API Gateway response, JSON unless another type is given."""
+    if content_type == "application/json":
+        body = json.dumps(body)  # Convert JSON data to a string
+    return {
+        "statusCode": status_code,
+        "body": body,
+        "headers": {
+            "Content-Type": content_type,
+            "Access-Control-Allow-Origin": "*",  # Allow CORS
+        },
+    }
+
+
 def lambda_handler(event, context):
     """Handler function for making queries.
 
+    Results are returned one page at a time. The ``limit`` query parameter sets
+    the number of results per page and the ``next_token`` returned with a page
+    is passed back as a query parameter to get the following page.
+
+    ``fields`` is a comma separated list of the fields returned in the
+    ``_source`` of each result, e.g. ``fields=version``, the S3 path is always
+    returned as the ``_id`` of the results.
+
+    With ``format=ndjson`` or ``format=csv`` every result is returned at once,
+    one line per result, as the response body or, if it is larger than
+    ``MAX_INLINE_EXPORT_BYTES``, as a ``download_url`` of the file in S3.
+    An empty ``fields`` parameter exports only the S3 paths, and ``format``
+    can't be combined with ``count_only`` or ``group_by``.
+
+    With ``count_only=true`` only the number of matching files is returned.
+    With ``group_by=<field>`` the number of matching files is returned per
+    value of the field, or per ``interval`` (day by default) for the date, and
+    ``limit`` sets the maximum number of groups.
+
     Parameters
     ----------
     event : dict
@@ -75,21 +269,191 @@ def lambda_handler(event, context):
     logger.info(f"Context: {context}")
 
     logger.info("Received event: " + json.dumps(event, indent=2))
-    # create the opensearch query from the API parameters
-    query = Query(event["queryStringParameters"])
-    client = _create_open_search_client()
+    query_params = event["queryStringParameters"] or {}
+    try:
+        limit = _parse_limit(query_params.get("limit"))
+        cursor = None
+        if query_params.get("next_token"):
+            cursor = _decode_next_token(query_params["next_token"])
+        # create the opensearch query from the API parameters
+        query = Query(
+            query_params, size=limit, fields=_parse_fields(query_params.get("fields"))
+        )
+        if query_params.get("group_by"):
+            _parse_group_by(
+                query, query_params["group_by"], query_params.get("interval"), limit
+            )
+        export_format = query_params.get("format")
+        if export_format is not None and export_format not in EXPORT_FORMATS:
+            raise ValueError(
+                f"format must be one of {list(EXPORT_FORMATS)}, got {export_format}"
+            )
+        if export_format is not None and (
+            query_params.get("count_only") == "true" or query_params.get("group_by")
+        ):
+            raise ValueError("format can't be combined with count_only or group_by")
+    except ValueError as e:
+        return _http_response(400, {"error": str(e)})
+
+    index = Index(os.environ["OS_INDEX"])
     logger.info("Query: " + str(query.query_dsl()))
-    # search the opensearch instance
-    search_result = client.search(query, Index(os.environ["OS_INDEX"]))
-    logger.info("Query Search Results: " + json.dumps(search_result))
-
-    # Format the response
-    response = {
-        "statusCode": 200,
-        "body": json.dumps(search_result),  # Convert JSON data to a string
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",  # Allow CORS
+
+    if export_format is not None:
+        return _export(_get_open_search_client(), query, index, export_format)
+
+    # identical requests get the same result until the indexer writes new
+    # documents for the instrument
+    query_cache = _get_query_cache()
+    cache_key = query_cache.make_key(
+        {
+            "index": index.get_name(),
+            "query": query.query_dsl(),
+            "source": query.source_dsl(),
+            "aggs": query.aggregation_dsl(),
+            "size": limit,
+            "cursor": cursor,
+            "count_only": query_params.get("count_only") == "true",
         },
-    }
-    return response
+        instrument=query_params.get("instrument"),
+    )
+    body = query_cache.get(cache_key)
+    if body is None:
+        try:
+            body = _run_query(
+                _get_open_search_client(), query, index, query_params, cursor
+            )
+        except ValueError as e:
+            # the point in time of the next_token has expired
+            return _http_response(400, {"error": str(e)})
+        query_cache.put(cache_key, body)
+    else:
+        logger.info("Returning the cached result of the query")
+
+    return _http_response(200, body)
+
+
+def _run_query(client, query, index, query_params, cursor):
+    """Returns the body of the response to a query.
+
+    Parameters
+    ----------
+    client : Client
+        Client connected to the OpenSearch cluster.
+    query : Query
+        The query built from the API parameters.
+    index : Index
+        The index to search.
+    query_params : dict
+        The API parameters.
+    cursor : dict
+        The cursor returned with the previous page, if any.
+
+    Returns
+    -------
+    dict
+        The count, groups or page of results requested.
+    """
+    # counts and groups don't fetch any of the matching documents
+    if query_params.get("count_only") == "true":
+        return {"count": client.count(query, index)}
+    if query.aggregation_dsl():
+        return {"groups": client.aggregate(query, index)[query_params["group_by"]]}
+
+    # search one page of the results, the cursor of the next page is returned
+    # to the caller as an opaque token
+    search_result, next_cursor = client.search_page(query, index, cursor=cursor)
+    logger.info(f"Query returned {len(search_result)} results")
+
+    next_token = None
+    if next_cursor is not None:
+        next_token = _encode_next_token(next_cursor)
+
+    return {"results": search_result, "next_token": next_token}
+
+
+def _export(client, query, index, export_format):
+    """Writes every result of a query to a file and returns it.
+
+    The results are read one page at a time and written to a temporary file
+    as they arrive, so the memory used does not grow with the number of
+    results. The file is returned in the response if it is small enough,
+    otherwise it is uploaded to the ``QUERY_RESULTS_BUCKET`` and a presigned
+    URL to download it is returned.
+
+    Parameters
+    ----------
+    client : Client
+        Client connected to the OpenSearch cluster.
+    query : Query
+        The query built from the API parameters, its size is the page size.
+    index : Index
+        The index to search.
+    export_format : str
+        One of EXPORT_FORMATS.
+
+    Returns
+    -------
+    dict
+        The API Gateway response.
+    """
+    # the lines of the results not written to the file yet
+    buffer = io.StringIO()
+    if export_format == "csv":
+        # an empty fields parameter exports only the S3 paths
+        fields = CSV_FIELDS if query.fields is None else query.fields
+        writer = csv.writer(buffer)
+        writer.writerow(["path", *fields])
+
+        def write(hit):
+            source = hit.get("_source", {})
+            writer.writerow([hit["_id"], *(source.get(field) for field in fields)])
+
+    else:
+
+        def write(hit):
+            buffer.write(json.dumps(hit))
+            buffer.write("\n")
+
+    # kept in memory while it is small enough to be returned in the response
+    with tempfile.SpooledTemporaryFile(max_size=MAX_INLINE_EXPORT_BYTES) as file:
+        count = 0
+        for hit in client.iter_search(query, index):
+            write(hit)
+            count += 1
+            if buffer.tell() >= EXPORT_BUFFER_BYTES:
+                file.write(buffer.getvalue().encode())
+                buffer.seek(0)
+                buffer.truncate()
+        file.write(buffer.getvalue().encode())
+        logger.info(f"Exported {count} results, {file.tell()} bytes")
+
+        content_type = EXPORT_FORMATS[export_format]
+        if file.tell() <= MAX_INLINE_EXPORT_BYTES:
+            file.seek(0)
+            return _http_response(200, file.read().decode(), content_type)
+
+        if not os.environ.get("QUERY_RESULTS_BUCKET"):
+            return _http_response(
+                413, {"error": "Too many results to export, narrow down the query"}
+            )
+        file.seek(0)
+        return _http_response(
+            200,
+            {
+                "download_url": _upload_export(file, export_format, content_type),
+                "count": count,
+            },
+        )
+
+
+def _upload_export(file, export_format, content_type):
+    """Uploads an export to S3 and returns a presigned URL to download it."""
+    bucket = os.environ["QUERY_RESULTS_BUCKET"]
+    key = f"exports/{uuid.uuid4()}.{export_format}"
+    s3_client = boto3.client("s3")
+    s3_client.upload_fileobj(file, bucket, key, ExtraArgs={"ContentType": content_type})
+    return s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": bucket, "Key": key},
+        ExpiresIn=int(os.environ.get("QUERY_RESULTS_URL_EXPIRE", "3600")),
+    )
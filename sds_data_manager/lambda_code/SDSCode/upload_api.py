@@ -1,8 +1,12 @@
 import json
 import logging
 import os
+import time
 
 import boto3
+from botocore.exceptions import ClientError
+
+from .filetype_matcher import FiletypeMatcher
 
 logger = logging.getLogger(__name__)
 logging.basicConfig()
@@ -10,47 +14,77 @@ logger.setLevel(logging.INFO)
 
 s3 = boto3.client("s3")
 
+# Seconds the pre-signed URLs are valid
+URL_EXPIRE = 3600
+# S3 limit on the number of parts of a multipart upload
+MAX_PARTS = 10_000
+# Query parameters controlling multipart uploads, not stored as metadata
+MULTIPART_PARAMS = ("parts", "upload_id", "action")
+# S3 errors caused by the request, e.g. an unknown or already completed upload
+MULTIPART_REQUEST_ERRORS = (
+    "NoSuchUpload",
+    "InvalidPart",
+    "InvalidPartOrder",
+    "EntityTooSmall",
+    "MalformedXML",
+)
+
+# Lambda keeps the module loaded between warm invocations, so the matcher is
+# reused until the container is recycled or the entry expires.
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "300"))
+# Matcher compiled from the last seen version (ETag) of config.json
+_matcher_cache = {"etag": None, "matcher": None, "checked_at": 0.0}
+
 
-def _load_allowed_filenames():
+def _get_filetype_matcher():
     """
-    Load the config.json file as a python dictionary.
+    Return the compiled matcher for the current version of config.json.
 
-    :return: dictionary object of file types and their attributes.
+    Once the cached matcher is older than CACHE_TTL_SECONDS the ETag of
+    config.json is checked, and the file is only downloaded and compiled
+    again if it has changed.
+
+    :return: FiletypeMatcher compiled from the allowed file types.
     """
+    now = time.monotonic()
+    if (
+        _matcher_cache["matcher"] is not None
+        and now - _matcher_cache["checked_at"] < CACHE_TTL_SECONDS
+    ):
+        return _matcher_cache["matcher"]
+
+    bucket = os.environ["S3_CONFIG_BUCKET_NAME"]
+    if _matcher_cache["matcher"] is not None:
+        etag = s3.head_object(Bucket=bucket, Key="config.json")["ETag"]
+        if etag == _matcher_cache["etag"]:
+            _matcher_cache["checked_at"] = now
+            return _matcher_cache["matcher"]
+        logger.info("config.json has changed, reloading it from S3.")
+
     # get the config file from the S3 bucket
-    config_object = s3.get_object(
-        Bucket=os.environ["S3_CONFIG_BUCKET_NAME"], Key="config.json"
-    )
+    config_object = s3.get_object(Bucket=bucket, Key="config.json")
     file_content = config_object["Body"].read()
-    return json.loads(file_content)
+    _matcher_cache["matcher"] = FiletypeMatcher(json.loads(file_content))
+    _matcher_cache["etag"] = config_object["ETag"]
+    _matcher_cache["checked_at"] = now
+    return _matcher_cache["matcher"]
 
 
-def _check_for_matching_filetype(pattern, filename):
+def _get_object_key(filename):
     """
-    Read a pattern from config.json and compare it to the desired filename.
+    Return the key of a file in the SDS storage bucket.
 
-    :param pattern: A file naming pattern from the config.json
-    :param filename: String name of the desired file name.
+    :param filename: Required.  A string representing the name of the object to upload.
 
-    :return: The file_dictionary, or None if there is no match.
+    :return: The key of the file, or None if it matches no file type.
     """
-    split_filename = filename.replace("_", ".").split(".")
+    filetype, metadata = _get_filetype_matcher().match_filetype(filename)
 
-    if len(split_filename) != len(pattern):
+    if metadata is None:
+        logger.info("Found no matching file types to index this file against.")
         return None
 
-    i = 0
-    file_dictionary = {}
-    for field in pattern:
-        if pattern[field] == "*":
-            file_dictionary[field] = split_filename[i]
-        elif pattern[field] == split_filename[i]:
-            file_dictionary[field] = split_filename[i]
-        else:
-            return None
-        i += 1
-
-    return file_dictionary
+    return filetype["path"] + filename
 
 
 def _generate_signed_upload_url(filename, tags=None):
@@ -62,15 +96,8 @@ def _generate_signed_upload_url(filename, tags=None):
 
     :return: A URL string if the file was found, otherwise None.
     """
-    filetypes = _load_allowed_filenames()
-    for filetype in filetypes:
-        path_to_upload_file = filetype["path"]
-        metadata = _check_for_matching_filetype(filetype["pattern"], filename)
-        if metadata is not None:
-            break
-
-    if metadata is None:
-        logger.info("Found no matching file types to index this file against.")
+    key = _get_object_key(filename)
+    if key is None:
         return None
 
     bucket_name = os.environ["S3_BUCKET"]
@@ -78,15 +105,177 @@ def _generate_signed_upload_url(filename, tags=None):
         ClientMethod="put_object",
         Params={
             "Bucket": bucket_name[5:],
-            "Key": path_to_upload_file + filename,
+            "Key": key,
             "Metadata": tags or dict(),
         },
-        ExpiresIn=3600,
+        ExpiresIn=URL_EXPIRE,
     )
 
     return url
 
 
+def _initiate_multipart_upload(filename, parts, tags=None):
+    """
+    Start a multipart upload of a file in the SDS storage bucket.
+
+    Each part is uploaded with a PUT request to its presigned url, in any
+    order and in parallel. Every part but the last one must be at least 5 MB.
+
+    :param filename: Required.  A string representing the name of the object to upload.
+    :param parts: Required.  The number of parts of the file.
+    :param tags: Optional.  A dictionary that will be stored in the S3 object metadata.
+
+    :return: A dictionary with the upload_id and the presigned url of every part,
+        or None if the file was not found.
+    """
+    key = _get_object_key(filename)
+    if key is None:
+        return None
+
+    bucket_name = os.environ["S3_BUCKET"][5:]
+    s3_client = boto3.client("s3")
+    upload = s3_client.create_multipart_upload(
+        Bucket=bucket_name, Key=key, Metadata=tags or dict()
+    )
+    urls = [
+        s3_client.generate_presigned_url(
+            ClientMethod="upload_part",
+            Params={
+                "Bucket": bucket_name,
+                "Key": key,
+                "UploadId": upload["UploadId"],
+                "PartNumber": part_number,
+            },
+            ExpiresIn=URL_EXPIRE,
+        )
+        for part_number in range(1, parts + 1)
+    ]
+
+    return {"upload_id": upload["UploadId"], "part_urls": urls}
+
+
+def _complete_multipart_upload(filename, upload_id, parts):
+    """
+    Assemble the parts uploaded to a multipart upload into the file.
+
+    The parts are listed from S3, so the ETags returned by the part uploads
+    don't have to be sent back, but the upload is only completed once every
+    part from 1 to parts has been uploaded.
+
+    :param filename: Required.  A string representing the name of the uploaded object.
+    :param upload_id: Required.  The id returned when the upload was initiated.
+    :param parts: Required.  The number of parts the upload was initiated with.
+
+    :return: The S3 URI of the file, or None if the file was not found.
+    :raises ValueError: If a part has not been uploaded.
+    """
+    key = _get_object_key(filename)
+    if key is None:
+        return None
+
+    bucket_name = os.environ["S3_BUCKET"][5:]
+    s3_client = boto3.client("s3")
+    uploaded = []
+    paginator = s3_client.get_paginator("list_parts")
+    for page in paginator.paginate(Bucket=bucket_name, Key=key, UploadId=upload_id):
+        uploaded += [
+            {"PartNumber": part["PartNumber"], "ETag": part["ETag"]}
+            for part in page.get("Parts", [])
+        ]
+    missing = set(range(1, parts + 1)) - {part["PartNumber"] for part in uploaded}
+    if missing or len(uploaded) != parts:
+        raise ValueError(
+            f"Parts {sorted(missing)} of {parts} have not been uploaded"
+            if missing
+            else f"More than {parts} parts have been uploaded"
+        )
+    s3_client.complete_multipart_upload(
+        Bucket=bucket_name,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={"Parts": uploaded},
+    )
+
+    return f"s3://{bucket_name}/{key}"
+
+
+def _abort_multipart_upload(filename, upload_id):
+    """
+    Abort a multipart upload and delete the parts already uploaded.
+
+    :param filename: Required.  A string representing the name of the uploaded object.
+    :param upload_id: Required.  The id returned when the upload was initiated.
+
+    :return: The upload_id, or None if the file was not found.
+    """
+    key = _get_object_key(filename)
+    if key is None:
+        return None
+
+    boto3.client("s3").abort_multipart_upload(
+        Bucket=os.environ["S3_BUCKET"][5:], Key=key, UploadId=upload_id
+    )
+
+    return upload_id
+
+
+def _multipart_handler(parameters):
+    """
+    Run one step of a multipart upload.
+
+    :param parameters: Dictionary
+        The query string parameters. 'parts' initiates an upload with that many
+        parts. 'upload_id' with 'action' set to 'complete' or 'abort' ends it,
+        the same 'parts' must be given to complete it.
+
+    :return: The API gateway response of the step.
+    """
+    filename = parameters["filename"]
+    action = parameters.get("action")
+    if "upload_id" not in parameters or action == "complete":
+        try:
+            parts = int(parameters.get("parts", 0))
+        except ValueError:
+            parts = 0
+        if not 1 <= parts <= MAX_PARTS:
+            return {
+                "statusCode": 400,
+                "body": json.dumps(f"parts must be between 1 and {MAX_PARTS}"),
+            }
+
+    if "upload_id" not in parameters:
+        tags = {
+            key: value
+            for key, value in parameters.items()
+            if key not in MULTIPART_PARAMS
+        }
+        result = _initiate_multipart_upload(filename, parts, tags=tags)
+    elif action == "complete":
+        try:
+            result = _complete_multipart_upload(
+                filename, parameters["upload_id"], parts
+            )
+        except ValueError as e:
+            return {"statusCode": 400, "body": json.dumps(str(e))}
+    elif action == "abort":
+        result = _abort_multipart_upload(filename, parameters["upload_id"])
+    else:
+        return {
+            "statusCode": 400,
+            "body": json.dumps("action must be 'complete' or 'abort'"),
+        }
+
+    if result is None:
+        return {
+            "statusCode": 400,
+            "body": json.dumps(
+                "The file name does not match mission file naming conventions."
+            ),
+        }
+
+    return {"statusCode": 200, "body": json.dumps(result)}
+
+
 def lambda_handler(event, context):
     """
     The entry point to the upload API lambda.
@@ -94,10 +283,16 @@ def lambda_handler(event, context):
     This function returns an S3 signed-URL based on the input filename,
     which the user can then use to upload a file into the SDS.
 
+    Large files are uploaded in parts instead: 'parts' returns an upload_id
+    and a signed-URL for every part, then the same filename, parts and
+    upload_id with 'action' set to 'complete' assembles the file, or the
+    filename and upload_id with 'action' set to 'abort' discards it.
+
     :param event: Dictionary
         Specifically only requires event['queryStringParameters']['filename']
         User-specified key:value pairs can also exist in the 'queryStringParameters',
         storing these pairs as object metadata.
+        Optionally 'parts', or 'upload_id' and 'action', for multipart uploads.
     :param context: Unused
 
     :return: A pre-signed url where users can upload a data file to the SDS.
@@ -111,6 +306,19 @@ def lambda_handler(event, context):
             "body": json.dumps("Please specify a filename to upload"),
         }
 
+    if any(key in event["queryStringParameters"] for key in MULTIPART_PARAMS):
+        try:
+            return _multipart_handler(event["queryStringParameters"])
+        except ClientError as e:
+            # other errors, e.g. AccessDenied or 5xx, are not the caller's
+            if e.response["Error"]["Code"] not in MULTIPART_REQUEST_ERRORS:
+                raise
+            logger.warning(f"Multipart upload failed: {e}")
+            return {
+                "statusCode": 400,
+                "body": json.dumps(e.response["Error"]["Message"]),
+            }
+
     filename = event["queryStringParameters"]["filename"]
     url = _generate_signed_upload_url(filename, tags=event["queryStringParameters"])
 
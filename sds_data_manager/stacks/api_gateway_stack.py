@@ -34,7 +34,8 @@ class ApiGateway(Stack):
         sds_id : str
             Name suffix for stack
         lambda_functions : dict
-            Lambda functions
+            Lambda functions and their HTTP method, or list of HTTP methods,
+            by route
         env : Environment
         hosted_zone : route53.IHostedZone
             Hosted zone used for DNS routing.
@@ -92,10 +93,14 @@ class ApiGateway(Stack):
             # Get the lambda function and its HTTP method
             lambda_info = lambda_functions[route]
             lambda_fn = lambda_info["function"]
-            http_method = lambda_info["httpMethod"]
+            http_methods = lambda_info["httpMethod"]
+            if isinstance(http_methods, str):
+                http_methods = [http_methods]
 
             # Define the API Gateway Resources
             resource = api.root.add_resource(route)
 
-            # Create a new method that is linked to the Lambda function
-            resource.add_method(http_method, apigw.LambdaIntegration(lambda_fn))
+            # Create a new method per HTTP method linked to the Lambda function
+            integration = apigw.LambdaIntegration(lambda_fn)
+            for http_method in http_methods:
+                resource.add_method(http_method, integration)
@@ -9,6 +9,15 @@ from aws_cdk import (
     Stack,
     aws_lambda_event_sources,
 )
+from aws_cdk import (
+    aws_dynamodb as dynamodb,
+)
+from aws_cdk import (
+    aws_events as events,
+)
+from aws_cdk import (
+    aws_events_targets as targets,
+)
 from aws_cdk import (
     aws_iam as iam,
 )
@@ -37,7 +46,7 @@ from .opensearch_stack import OpenSearch
 class SdsDataManager(Stack):
     """Stack for Data Management."""
 
-    def __init__(
+    def __init__(  # noqa: PLR0915
         self,
         scope: Construct,
         construct_id: str,
@@ -128,6 +137,60 @@ class SdsDataManager(Stack):
             block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
         )
 
+        # Exports of the query API too large to be returned in the response
+        query_results_bucket = s3.Bucket(
+            self,
+            f"QueryResultsBucket-{sds_id}",
+            bucket_name=f"sds-query-results-{sds_id}",
+            removal_policy=RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            # the download links expire after an hour, lifecycle rules can't
+            # expire objects sooner than a day
+            lifecycle_rules=[s3.LifecycleRule(expiration=cdk.Duration.days(1))],
+        )
+
+        # S3 URIs of the files the indexer has ingested, for the download API
+        object_index_table = dynamodb.Table(
+            self,
+            f"ObjectIndexTable-{sds_id}",
+            table_name=f"sds-object-index-{sds_id}",
+            partition_key=dynamodb.Attribute(
+                name="s3_uri", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="expires_at",
+        )
+
+        # Results of the query API shared by its containers, and the
+        # generation counters the indexer bumps to invalidate them
+        query_cache_table = dynamodb.Table(
+            self,
+            f"QueryCacheTable-{sds_id}",
+            table_name=f"sds-query-cache-{sds_id}",
+            partition_key=dynamodb.Attribute(
+                name="cache_key", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="expires_at",
+        )
+
+        # Lease the indexer invocations take to agree on who takes the next
+        # OpenSearch snapshot. No TTL, the lease item must not be deleted
+        # while a snapshot is pending.
+        snapshot_lease_table = dynamodb.Table(
+            self,
+            f"SnapshotLeaseTable-{sds_id}",
+            table_name=f"sds-snapshot-lease-{sds_id}",
+            partition_key=dynamodb.Attribute(
+                name="lease_id", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
         s3_write_policy = iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
             actions=["s3:PutObject"],
@@ -211,7 +274,11 @@ class SdsDataManager(Stack):
 
         dynamodb_write_policy = iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
-            actions=["dynamodb:PutItem"],
+            actions=[
+                "dynamodb:PutItem",
+                "dynamodb:BatchWriteItem",
+                "dynamodb:UpdateItem",
+            ],
             resources=["*"],
         )
 
@@ -263,6 +330,10 @@ class SdsDataManager(Stack):
                 "S3_SNAPSHOT_BUCKET_NAME": f"sds-opensearch-snapshot-{sds_id}",
                 "SNAPSHOT_ROLE_ARN": snapshot_role.role_arn,
                 "SNAPSHOT_REPO_NAME": "snapshot-repo",
+                "SNAPSHOT_LEASE_TABLE": snapshot_lease_table.table_name,
+                "SNAPSHOT_INTERVAL_SECONDS": "900",
+                "QUERY_CACHE_TABLE": query_cache_table.table_name,
+                "OBJECT_INDEX_TABLE": object_index_table.table_name,
                 "SECRET_ID": opensearch.secret_name,
                 "REGION": opensearch.region,
                 "STATE_MACHINE_ARN": processing_step_function_arn,
@@ -271,11 +342,21 @@ class SdsDataManager(Stack):
 
         indexer_lambda.add_event_source(
             aws_lambda_event_sources.S3EventSource(
-                data_bucket, events=[s3.EventType.OBJECT_CREATED]
+                data_bucket,
+                events=[s3.EventType.OBJECT_CREATED, s3.EventType.OBJECT_REMOVED],
             )
         )
         indexer_lambda.apply_removal_policy(cdk.RemovalPolicy.DESTROY)
 
+        # Takes the snapshot skipped at the end of a burst of writes, once
+        # every SNAPSHOT_INTERVAL_SECONDS
+        events.Rule(
+            self,
+            "SnapshotScheduleRule",
+            schedule=events.Schedule.rate(cdk.Duration.minutes(15)),
+            targets=[targets.LambdaFunction(indexer_lambda)],
+        )
+
         # Adding Opensearch permissions
         indexer_lambda.add_to_role_policy(opensearch.opensearch_all_http_permissions)
         # Adding s3 read permissions to get config.json
@@ -284,6 +365,9 @@ class SdsDataManager(Stack):
         indexer_lambda.add_to_role_policy(dynamodb_write_policy)
         # Adding step function execution policy
         indexer_lambda.add_to_role_policy(step_function_execution_policy)
+        object_index_table.grant_write_data(indexer_lambda)
+        query_cache_table.grant_write_data(indexer_lambda)
+        snapshot_lease_table.grant_write_data(indexer_lambda)
 
         # Add permissions for Lambda to access OpenSearch
         indexer_lambda.add_to_role_policy(
@@ -328,6 +412,18 @@ class SdsDataManager(Stack):
                 "S3_BUCKET": data_bucket.s3_url_for_object(),
                 "S3_CONFIG_BUCKET_NAME": f"sds-config-bucket-{sds_id}",
             },
+            # completes and aborts multipart uploads, the other steps only
+            # need s3:PutObject
+            initial_policy=[
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=[
+                        "s3:ListMultipartUploadParts",
+                        "s3:AbortMultipartUpload",
+                    ],
+                    resources=[f"{data_bucket.bucket_arn}/*"],
+                ),
+            ],
         )
         upload_api_lambda.add_to_role_policy(s3_write_policy)
         upload_api_lambda.add_to_role_policy(s3_read_policy)
@@ -353,7 +449,25 @@ class SdsDataManager(Stack):
                 "OS_INDEX": "metadata",
                 "SECRET_ID": opensearch.secret_name,
                 "REGION": env.region,
+                "QUERY_CACHE_TABLE": query_cache_table.table_name,
+                "QUERY_CACHE_TTL_SECONDS": "60",
+                "QUERY_RESULTS_BUCKET": query_results_bucket.bucket_name,
+                "QUERY_RESULTS_URL_EXPIRE": "3600",
             },
+            # The query API caches its results in the DynamoDB table and
+            # uploads large exports to the results bucket
+            initial_policy=[
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["dynamodb:GetItem", "dynamodb:PutItem"],
+                    resources=[query_cache_table.table_arn],
+                ),
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["s3:PutObject", "s3:GetObject"],
+                    resources=[f"{query_results_bucket.bucket_arn}/*"],
+                ),
+            ],
         )
         query_api_lambda.add_to_role_policy(opensearch.opensearch_read_only_policy)
 
@@ -371,14 +485,43 @@ class SdsDataManager(Stack):
             handler="lambda_handler",
             runtime=lambda_.Runtime.PYTHON_3_9,
             timeout=cdk.Duration.seconds(60),
+            # Batch requests may select the files with a query of the
+            # metadata index
+            environment={
+                "OS_ADMIN_USERNAME": "master-user",
+                "OS_DOMAIN": opensearch.sds_metadata_domain.domain_endpoint,
+                "OS_PORT": "443",
+                "OS_INDEX": "metadata",
+                "SECRET_ID": opensearch.secret_name,
+                "REGION": env.region,
+                "OBJECT_INDEX_TABLE": object_index_table.table_name,
+                "OBJECT_INDEX_TTL_SECONDS": "60",
+            },
+            initial_policy=[
+                # S3 only answers 404 for the missing objects of the buckets
+                # that can be listed, 403 otherwise
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["s3:ListBucket"],
+                    resources=[data_bucket.bucket_arn],
+                ),
+            ],
         )
         download_query_api.add_to_role_policy(
             opensearch.opensearch_all_http_permissions
         )
         download_query_api.add_to_role_policy(s3_read_policy)
 
+        opensearch_secret.grant_read(grantee=download_query_api)
+        # The indexer records the existing objects in the table
+        object_index_table.grant_read_data(download_query_api)
+
         self.lambda_functions = {
             "upload": {"function": upload_api_lambda, "httpMethod": "GET"},
             "query": {"function": query_api_lambda, "httpMethod": "GET"},
-            "download": {"function": download_query_api, "httpMethod": "GET"},
+            # batches of S3 URIs are sent in the body of a POST request
+            "download": {
+                "function": download_query_api,
+                "httpMethod": ["GET", "POST"],
+            },
         }
@@ -45,7 +45,7 @@ def template(app, sds_id, opensearch_stack, env):
 
 
 def test_s3_bucket_resource_count(template):
-    template.resource_count_is("AWS::S3::Bucket", 3)
+    template.resource_count_is("AWS::S3::Bucket", 4)
 
 
 def test_s3_data_bucket_resource_properties(template, sds_id):
@@ -114,8 +114,26 @@ def test_s3_snapshot_bucket_resource_properties(template, sds_id):
     )
 
 
+def test_s3_query_results_bucket_resource_properties(template, sds_id):
+    template.has_resource_properties(
+        "AWS::S3::Bucket",
+        {
+            "BucketName": f"sds-query-results-{sds_id}",
+            "LifecycleConfiguration": {
+                "Rules": [{"ExpirationInDays": 1, "Status": "Enabled"}]
+            },
+            "PublicAccessBlockConfiguration": {
+                "BlockPublicAcls": True,
+                "BlockPublicPolicy": True,
+                "IgnorePublicAcls": True,
+                "RestrictPublicBuckets": True,
+            },
+        },
+    )
+
+
 def test_s3_bucket_policy_resource_count(template):
-    template.resource_count_is("AWS::S3::BucketPolicy", 3)
+    template.resource_count_is("AWS::S3::BucketPolicy", 4)
 
 
 def test_s3_data_bucket_policy_resource_properties(template):
@@ -273,7 +291,7 @@ def test_s3_snapshot_bucket_policy_resource_properties(template):
 
 
 def test_custom_s3_auto_delete_resource_count(template):
-    template.resource_count_is("Custom::S3AutoDeleteObjects", 3)
+    template.resource_count_is("Custom::S3AutoDeleteObjects", 4)
 
 
 def test_data_bucket_custom_s3_auto_delete_resource_properties(template):
@@ -310,6 +328,48 @@ def test_config_bucket_custom_s3_auto_delete_resoource_count(template):
     )
 
 
+def test_query_cache_table_resource_properties(template):
+    template.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {
+            "TableName": "sds-query-cache-sdsid-test",
+            "KeySchema": [{"AttributeName": "cache_key", "KeyType": "HASH"}],
+            "BillingMode": "PAY_PER_REQUEST",
+            "TimeToLiveSpecification": {
+                "AttributeName": "expires_at",
+                "Enabled": True,
+            },
+        },
+    )
+
+
+def test_snapshot_lease_table_resource_properties(template):
+    template.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {
+            "TableName": "sds-snapshot-lease-sdsid-test",
+            "KeySchema": [{"AttributeName": "lease_id", "KeyType": "HASH"}],
+            "BillingMode": "PAY_PER_REQUEST",
+            "TimeToLiveSpecification": Match.absent(),
+        },
+    )
+
+
+def test_object_index_table_resource_properties(template):
+    template.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {
+            "TableName": "sds-object-index-sdsid-test",
+            "KeySchema": [{"AttributeName": "s3_uri", "KeyType": "HASH"}],
+            "BillingMode": "PAY_PER_REQUEST",
+            "TimeToLiveSpecification": {
+                "AttributeName": "expires_at",
+                "Enabled": True,
+            },
+        },
+    )
+
+
 def test_custom_s3_bucket_notifications_resource_properties(template):
     template.resource_count_is("Custom::S3BucketNotifications", 1)
 
@@ -333,7 +393,16 @@ def test_custom_s3_bucket_notifications_resource_properties(template):
                                 "Arn",
                             ]
                         },
-                    }
+                    },
+                    {
+                        "Events": ["s3:ObjectRemoved:*"],
+                        "LambdaFunctionArn": {
+                            "Fn::GetAtt": [
+                                Match.string_like_regexp("IndexerLambda*"),
+                                "Arn",
+                            ]
+                        },
+                    },
                 ]
             },
             "Managed": True,
@@ -380,6 +449,28 @@ def test_uploadapilambda_iam_policy_resource_properties(template):
             "PolicyDocument": {
                 "Version": "2012-10-17",
                 "Statement": [
+                    # multipart uploads
+                    {
+                        "Effect": "Allow",
+                        "Action": [
+                            "s3:ListMultipartUploadParts",
+                            "s3:AbortMultipartUpload",
+                        ],
+                        "Resource": {
+                            "Fn::Join": [
+                                "",
+                                [
+                                    {
+                                        "Fn::GetAtt": [
+                                            Match.string_like_regexp("DataBucket.*"),
+                                            "Arn",
+                                        ]
+                                    },
+                                    "/*",
+                                ],
+                            ]
+                        },
+                    },
                     {
                         "Effect": "Allow",
                         "Action": "s3:PutObject",
@@ -559,12 +650,74 @@ def test_indexer_lambda_iam_policy_resource_properties(template):
                             },
                         ],
                     },
-                    {"Action": "dynamodb:PutItem", "Effect": "Allow", "Resource": "*"},
+                    {
+                        "Action": [
+                            "dynamodb:PutItem",
+                            "dynamodb:BatchWriteItem",
+                            "dynamodb:UpdateItem",
+                        ],
+                        "Effect": "Allow",
+                        "Resource": "*",
+                    },
                     {
                         "Action": "states:StartExecution",
                         "Effect": "Allow",
                         "Resource": "*",
                     },
+                    {
+                        "Action": [
+                            "dynamodb:BatchWriteItem",
+                            "dynamodb:PutItem",
+                            "dynamodb:UpdateItem",
+                            "dynamodb:DeleteItem",
+                            "dynamodb:DescribeTable",
+                        ],
+                        "Effect": "Allow",
+                        "Resource": [
+                            {
+                                "Fn::GetAtt": [
+                                    Match.string_like_regexp("ObjectIndexTable.*"),
+                                    "Arn",
+                                ]
+                            }
+                        ],
+                    },
+                    {
+                        "Action": [
+                            "dynamodb:BatchWriteItem",
+                            "dynamodb:PutItem",
+                            "dynamodb:UpdateItem",
+                            "dynamodb:DeleteItem",
+                            "dynamodb:DescribeTable",
+                        ],
+                        "Effect": "Allow",
+                        "Resource": [
+                            {
+                                "Fn::GetAtt": [
+                                    Match.string_like_regexp("QueryCacheTable.*"),
+                                    "Arn",
+                                ]
+                            }
+                        ],
+                    },
+                    {
+                        "Action": [
+                            "dynamodb:BatchWriteItem",
+                            "dynamodb:PutItem",
+                            "dynamodb:UpdateItem",
+                            "dynamodb:DeleteItem",
+                            "dynamodb:DescribeTable",
+                        ],
+                        "Effect": "Allow",
+                        "Resource": [
+                            {
+                                "Fn::GetAtt": [
+                                    Match.string_like_regexp("SnapshotLeaseTable.*"),
+                                    "Arn",
+                                ]
+                            }
+                        ],
+                    },
                     {
                         "Action": "es:*",
                         "Effect": "Allow",
@@ -646,6 +799,38 @@ def test_queryapilambda_iam_policy_resource_properties(template):
             "PolicyDocument": {
                 "Version": "2012-10-17",
                 "Statement": [
+                    # query result cache
+                    {
+                        "Effect": "Allow",
+                        "Action": ["dynamodb:GetItem", "dynamodb:PutItem"],
+                        "Resource": {
+                            "Fn::GetAtt": [
+                                Match.string_like_regexp("QueryCacheTable.*"),
+                                "Arn",
+                            ]
+                        },
+                    },
+                    # large exports
+                    {
+                        "Effect": "Allow",
+                        "Action": ["s3:PutObject", "s3:GetObject"],
+                        "Resource": {
+                            "Fn::Join": [
+                                "",
+                                [
+                                    {
+                                        "Fn::GetAtt": [
+                                            Match.string_like_regexp(
+                                                "QueryResultsBucket.*"
+                                            ),
+                                            "Arn",
+                                        ]
+                                    },
+                                    "/*",
+                                ],
+                            ]
+                        },
+                    },
                     {
                         "Effect": "Allow",
                         "Action": "es:ESHttpGet",
@@ -682,6 +867,16 @@ def test_downloadquerylambda_iam_policy_resource_properties(template):
             "PolicyDocument": {
                 "Version": "2012-10-17",
                 "Statement": [
+                    {
+                        "Effect": "Allow",
+                        "Action": "s3:ListBucket",
+                        "Resource": {
+                            "Fn::GetAtt": [
+                                Match.string_like_regexp("DataBucket.*"),
+                                "Arn",
+                            ]
+                        },
+                    },
                     {
                         "Effect": "Allow",
                         "Action": "es:ESHttp*",
@@ -753,6 +948,37 @@ def test_downloadquerylambda_iam_policy_resource_properties(template):
                             },
                         ],
                     },
+                    {
+                        "Effect": "Allow",
+                        "Action": [
+                            "secretsmanager:GetSecretValue",
+                            "secretsmanager:DescribeSecret",
+                        ],
+                    },
+                    # object index
+                    {
+                        "Effect": "Allow",
+                        "Action": [
+                            "dynamodb:BatchGetItem",
+                            "dynamodb:Query",
+                            "dynamodb:GetItem",
+                            "dynamodb:Scan",
+                            "dynamodb:ConditionCheckItem",
+                            "dynamodb:DescribeTable",
+                        ],
+                        "Resource": [
+                            {
+                                "Fn::GetAtt": [
+                                    Match.string_like_regexp("ObjectIndexTable.*"),
+                                    "Arn",
+                                ]
+                            }
+                        ],
+                    },
+                    {
+                        "Effect": "Allow",
+                        "Action": ["dynamodb:GetRecords", "dynamodb:GetShardIterator"],
+                    },
                 ],
             },
             "PolicyName": Match.string_like_regexp(
@@ -955,11 +1181,11 @@ def test_custom_cdk_bucket_deployment_lambda_resource_properties(template):
     )
 
 
-# This is now only to add an eventsource to the indexer lambda.
-# The 3 others were being used by the
+# This is now only to add an eventsource and the snapshot schedule to the
+# indexer lambda. The 3 others were being used by the
 # lambda urls (download, query, upload) and so no longer exist.
 def test_lambda_permission_resource_count(template):
-    template.resource_count_is("AWS::Lambda::Permission", 1)
+    template.resource_count_is("AWS::Lambda::Permission", 2)
 
 
 def test_indexer_lambda_permission_resource_properties(template, account):
@@ -979,6 +1205,27 @@ def test_indexer_lambda_permission_resource_properties(template, account):
     )
 
 
+def test_snapshot_schedule_rule_resource_properties(template):
+    template.has_resource_properties(
+        "AWS::Events::Rule",
+        {
+            "ScheduleExpression": "rate(15 minutes)",
+            "State": "ENABLED",
+            "Targets": [
+                {
+                    "Arn": {
+                        "Fn::GetAtt": [
+                            Match.string_like_regexp("IndexerLambda*"),
+                            "Arn",
+                        ]
+                    },
+                    "Id": "Target0",
+                }
+            ],
+        },
+    )
+
+
 # Note: these tests don't work because in the previous version of the code,
 # we created lambda_.FunctionUrl objects
 # which granted permissions for lambda function URLs to be invoked.
@@ -93,3 +93,11 @@ def test_delete_table_policy(on_demand_dynamodb, provisioned_dynamodb):
             "UpdateReplacePolicy": "Delete",
         },
     )
+
+
+def test_no_time_to_live(on_demand_dynamodb):
+    # the processing status is the system of record, its items never expire
+    on_demand_dynamodb.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {"TimeToLiveSpecification": Match.absent()},
+    )
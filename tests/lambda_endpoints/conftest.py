@@ -2,7 +2,7 @@ import os
 
 import boto3
 import pytest
-from moto import mock_s3
+from moto import mock_dynamodb, mock_s3
 
 
 @pytest.fixture()
@@ -20,3 +20,36 @@ def s3_client(_aws_credentials):
     """Mocked S3 Client, so we don't need network requests."""
     with mock_s3():
         yield boto3.client("s3", region_name="us-east-1")
+
+
+@pytest.fixture()
+def dynamodb(_aws_credentials):
+    """Mocked DynamoDB resource with the processing status, object index and
+    query cache tables."""
+    with mock_dynamodb():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        dynamodb.create_table(
+            TableName="imap-data-watcher",
+            KeySchema=[
+                {"AttributeName": "instrument", "KeyType": "HASH"},
+                {"AttributeName": "filename", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "instrument", "AttributeType": "S"},
+                {"AttributeName": "filename", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        dynamodb.create_table(
+            TableName="sds-object-index",
+            KeySchema=[{"AttributeName": "s3_uri", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "s3_uri", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        dynamodb.create_table(
+            TableName="sds-query-cache",
+            KeySchema=[{"AttributeName": "cache_key", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "cache_key", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield dynamodb
@@ -0,0 +1,270 @@
+import hashlib
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sds_data_manager.lambda_code.SDSCode import download_api
+from sds_data_manager.lambda_code.SDSCode.download_api import (
+    download_file,
+    download_files,
+    downloads_from_response,
+)
+
+DATA = os.urandom(300_000)
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Stand-in for S3 serving DATA, with optional support of Range requests"""
+
+    def do_GET(self):  # noqa: N802
+        if self.path != "/file.pkts":
+            self.send_error(404)
+            return
+
+        requested = self.headers.get("Range")
+        self.server.ranges.append(requested)
+        if requested in self.server.failing_ranges:
+            self.send_error(503)
+            return
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", requested or "")
+        if match is None or not self.server.accept_ranges:
+            self._send(200, DATA)
+            return
+
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else len(DATA) - 1
+        if start >= len(DATA):
+            self.send_error(416)
+            return
+        end = min(end, len(DATA) - 1)
+        self._send(
+            206,
+            DATA[start : end + 1],
+            {"Content-Range": f"bytes {start}-{end}/{len(DATA)}"},
+        )
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture()
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+    server.ranges = []
+    server.accept_ranges = True
+    server.failing_ranges = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server, path="/file.pkts"):
+    host, port = server.server_address
+    return f"http://{host}:{port}{path}"
+
+
+def test_download_stream(server, tmp_path):
+    """The file is streamed to disk and renamed once complete"""
+    path = tmp_path / "file.pkts"
+
+    assert download_file(str(path), _url(server), chunk_size=4096)
+
+    assert path.read_bytes() == DATA
+    assert os.listdir(tmp_path) == ["file.pkts"]
+    assert server.ranges == [None]
+
+
+def test_download_not_found(server, tmp_path):
+    """A failed request returns False and leaves no file behind"""
+    path = tmp_path / "file.pkts"
+
+    assert not download_file(str(path), _url(server, "/missing.pkts"))
+
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("accept_ranges", [True, False])
+def test_download_resume(server, tmp_path, accept_ranges):
+    """A partial download is continued, or restarted if ranges are ignored"""
+    server.accept_ranges = accept_ranges
+    path = tmp_path / "file.pkts"
+    (tmp_path / "file.pkts.part").write_bytes(DATA[:100_000])
+
+    assert download_file(str(path), _url(server))
+
+    assert path.read_bytes() == DATA
+    assert server.ranges == ["bytes=100000-"]
+
+
+def test_download_resume_complete(server, tmp_path):
+    """A partial download holding the whole file is only renamed"""
+    path = tmp_path / "file.pkts"
+    (tmp_path / "file.pkts.part").write_bytes(DATA)
+
+    assert download_file(str(path), _url(server))
+
+    assert path.read_bytes() == DATA
+
+
+def test_download_resume_mismatch(server, tmp_path):
+    """A partial download larger than the file is restarted"""
+    path = tmp_path / "file.pkts"
+    (tmp_path / "file.pkts.part").write_bytes(DATA + b"stale")
+
+    assert download_file(str(path), _url(server))
+
+    assert path.read_bytes() == DATA
+    assert server.ranges == [f"bytes={len(DATA) + 5}-", "bytes=0-0", None]
+
+
+def test_download_ranges(server, tmp_path):
+    """Large files are downloaded with parallel range requests"""
+    path = tmp_path / "file.pkts"
+
+    assert download_file(str(path), _url(server), max_workers=4, part_size=64_000)
+
+    assert path.read_bytes() == DATA
+    assert os.listdir(tmp_path) == ["file.pkts"]
+    # the size request and one request per range
+    assert len(server.ranges) == 1 + 5
+    assert "bytes=256000-299999" in server.ranges
+
+
+def test_download_ranges_resume(server, tmp_path):
+    """Only the ranges missing from a partial download are requested"""
+    path = tmp_path / "file.pkts"
+    part = bytearray(len(DATA))
+    part[:128_000] = DATA[:128_000]
+    (tmp_path / "file.pkts.part").write_bytes(part)
+    (tmp_path / "file.pkts.part.json").write_text("[0, 64000]")
+
+    assert download_file(str(path), _url(server), max_workers=2, part_size=64_000)
+
+    assert path.read_bytes() == DATA
+    assert sorted(server.ranges[1:]) == [
+        "bytes=128000-191999",
+        "bytes=192000-255999",
+        "bytes=256000-299999",
+    ]
+
+
+def test_download_ranges_retry_stream(server, tmp_path):
+    """A failed parallel download is resumed by a retry with one worker"""
+    path = tmp_path / "file.pkts"
+    server.failing_ranges = {"bytes=128000-191999"}
+
+    assert not download_file(str(path), _url(server), max_workers=2, part_size=64_000)
+    assert (tmp_path / "file.pkts.part.json").exists()
+
+    server.failing_ranges = set()
+    server.ranges = []
+    assert download_file(str(path), _url(server), part_size=64_000)
+
+    assert path.read_bytes() == DATA
+    assert os.listdir(tmp_path) == ["file.pkts"]
+    assert "bytes=128000-191999" in server.ranges
+    assert "bytes=0-63999" not in server.ranges
+
+
+def test_download_ranges_unsupported(server, tmp_path):
+    """Files are streamed when the server does not support ranges"""
+    server.accept_ranges = False
+    path = tmp_path / "file.pkts"
+
+    assert download_file(str(path), _url(server), max_workers=4, part_size=64_000)
+
+    assert path.read_bytes() == DATA
+    assert len(server.ranges) == 2
+
+
+def test_download_checksum(server, tmp_path):
+    """The file is only kept if its checksum matches"""
+    path = tmp_path / "file.pkts"
+    sha256 = hashlib.sha256(DATA).hexdigest()
+
+    assert download_file(str(path), _url(server), checksum=sha256)
+    assert path.read_bytes() == DATA
+
+    md5 = hashlib.md5(DATA).hexdigest()
+    assert download_file(
+        str(path), _url(server), checksum=md5, checksum_algorithm="md5"
+    )
+
+    with pytest.raises(ValueError, match="checksum"):
+        download_file(str(tmp_path / "other.pkts"), _url(server), checksum="0" * 64)
+    assert not (tmp_path / "other.pkts").exists()
+    assert not (tmp_path / "other.pkts.part").exists()
+
+
+def test_download_files(server, tmp_path):
+    """Files are downloaded concurrently, failures don't stop the others"""
+    downloads = [
+        (str(tmp_path / "a" / f"file_{i}.pkts"), _url(server)) for i in range(5)
+    ]
+    downloads.append((str(tmp_path / "missing.pkts"), _url(server, "/missing.pkts")))
+    reports = []
+
+    result = download_files(
+        downloads,
+        max_connections=3,
+        progress=lambda *report: reports.append(report),
+    )
+
+    assert sorted(result["downloaded"]) == sorted(path for path, _ in downloads[:5])
+    assert result["failed"] == [str(tmp_path / "missing.pkts")]
+    assert result["bytes"] == 5 * len(DATA)
+    assert result["throughput"] > 0
+    for path, _ in downloads[:5]:
+        assert open(path, "rb").read() == DATA
+    # one report per file, the last one with every file done
+    assert len(reports) == 6
+    assert reports[-1][:3] == (6, 6, 5 * len(DATA))
+
+
+def test_download_files_budget(tmp_path, monkeypatch):
+    """The chunks are sized from the budget of every connection of every file"""
+    calls = []
+    monkeypatch.setattr(
+        download_api,
+        "download_file",
+        lambda path, link, **kwargs: calls.append(kwargs) or False,
+    )
+    downloads = [(str(tmp_path / "file.pkts"), "http://localhost/file.pkts")]
+
+    download_files(
+        downloads,
+        max_connections=2,
+        max_bytes_in_flight=8000,
+        max_workers=2,
+        chunk_size=10_000,
+    )
+    download_files(downloads, max_connections=2, chunk_size=100)
+
+    assert calls == [{"chunk_size": 2000, "max_workers": 2}, {"chunk_size": 100}]
+
+
+def test_downloads_from_response(tmp_path):
+    """The files of a batch response keep their S3 path"""
+    response = {
+        "download_urls": {
+            "s3://bucket/imap/swe/l0/file.pkts": "https://url",
+        },
+        "not_found": [],
+    }
+
+    assert downloads_from_response(response, str(tmp_path)) == [
+        (str(tmp_path / "imap" / "swe" / "l0" / "file.pkts"), "https://url")
+    ]
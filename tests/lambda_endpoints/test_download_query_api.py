@@ -1,13 +1,39 @@
+import base64
+import json
 from pathlib import Path
+from unittest.mock import MagicMock
 
+import botocore
 import pytest
 
+from sds_data_manager.lambda_code.SDSCode import download_query_api
 from sds_data_manager.lambda_code.SDSCode.download_query_api import lambda_handler
+from sds_data_manager.lambda_code.SDSCode.dynamodb_utils.object_index import (
+    object_index_item,
+)
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.action import Action
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.client import Client
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.document import Document
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.index import Index
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.payload import Payload
+
+from ..opensearch_utils.fake_opensearch import pit_openmock
 
 BUCKET_NAME = "test-bucket"
 TEST_FILE = "science_block_20221116_163611Z_idle.bin"
 
 
+@pytest.fixture(autouse=True)
+def _reset_object_index(monkeypatch):
+    """Every test starts without any known object"""
+    monkeypatch.setattr(
+        download_query_api,
+        "_cache",
+        {"client": None, "client_created_at": 0.0, "object_index": None},
+    )
+    monkeypatch.delenv("OBJECT_INDEX_TABLE", raising=False)
+
+
 @pytest.fixture(autouse=True)
 def setup_s3(s3_client):
     """Populate the mocked s3 client with a bucket and a file
@@ -82,3 +108,155 @@ def test_input_parameters_missing():
 
     response = lambda_handler(event=bad_para_event, context=None)
     assert response["statusCode"] == 400
+
+
+def _batch(params):
+    response = lambda_handler({"queryStringParameters": params}, context=None)
+    return response["statusCode"], response["body"]
+
+
+def _post(s3_uris=None, body=None):
+    if body is None:
+        body = json.dumps({"s3_uris": s3_uris})
+    response = lambda_handler({"httpMethod": "POST", "body": body}, context=None)
+    return response["statusCode"], response["body"]
+
+
+def test_batch_s3_uris(setup_s3):
+    """Every existing file of a batch gets a download URL in one response"""
+    setup_s3.put_object(Bucket=BUCKET_NAME, Key="imap/l0/other.pkts", Body=b"data")
+    found = [
+        f"s3://{BUCKET_NAME}/{TEST_FILE}",
+        f"s3://{BUCKET_NAME}/imap/l0/other.pkts",
+    ]
+    missing = f"s3://{BUCKET_NAME}/missing.pkts"
+
+    status, body = _post([*found, missing, found[0]])
+
+    assert status == 200
+    body = json.loads(body)
+    assert list(body["download_urls"]) == found
+    assert all(BUCKET_NAME in url for url in body["download_urls"].values())
+    assert body["not_found"] == [missing]
+
+
+def test_batch_forbidden(setup_s3, monkeypatch):
+    """Objects S3 refuses to describe are not found, other errors fail the batch"""
+    found = f"s3://{BUCKET_NAME}/{TEST_FILE}"
+    forbidden = f"s3://{BUCKET_NAME}/forbidden.pkts"
+
+    def head_object(Bucket, Key):  # noqa: N803
+        if Key == TEST_FILE:
+            return {}
+        raise botocore.exceptions.ClientError(
+            {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}},
+            "HeadObject",
+        )
+
+    s3_client = MagicMock(wraps=setup_s3, head_object=head_object)
+    monkeypatch.setattr(download_query_api.boto3, "client", lambda _: s3_client)
+
+    code, status = "403", 403
+    response_status, body = _post([found, forbidden])
+    assert response_status == 200
+    assert json.loads(body)["not_found"] == [forbidden]
+
+    code, status = "SlowDown", 503
+    response_status, _ = _post([forbidden])
+    assert response_status == 503
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        json.dumps({"s3_uris": ["not-a-uri"]}),
+        json.dumps({"s3_uris": ["s3://bucket-only"]}),
+        json.dumps({"s3_uris": ["s3://bucket/file"] * 1001}),
+        json.dumps({"s3_uris": "s3://bucket/file"}),
+        json.dumps({"s3_uris": [1]}),
+        json.dumps(["s3://bucket/file"]),
+        "not json",
+        "",
+    ],
+)
+def test_batch_invalid_body(body):
+    """Invalid bodies, URIs and too large batches return a 400 response"""
+    status, _ = _post(body=body)
+
+    assert status == 400
+
+
+def test_batch_max_size(monkeypatch):
+    """A batch of MAX_BATCH_SIZE files fits in one request"""
+    monkeypatch.setattr(download_query_api, "_object_exists", lambda *_: True)
+    s3_uris = [
+        f"s3://{BUCKET_NAME}/imap/mag/l0/2023/07/imap_mag_l0_raw_{i:04d}_v01-01.pkts"
+        for i in range(download_query_api.MAX_BATCH_SIZE)
+    ]
+    body = json.dumps({"s3_uris": s3_uris})
+    event = {
+        "httpMethod": "POST",
+        "body": base64.b64encode(body.encode()).decode(),
+        "isBase64Encoded": True,
+    }
+
+    response = lambda_handler(event, context=None)
+
+    assert response["statusCode"] == 200
+    assert list(json.loads(response["body"])["download_urls"]) == s3_uris
+
+
+@pit_openmock
+def test_batch_query(monkeypatch):
+    """The files of a batch can be selected with a query"""
+    monkeypatch.setenv("OS_INDEX", "metadata")
+    client = Client(hosts=[{"host": "localhost", "port": 9000}])
+    index = Index("metadata")
+    payload = Payload()
+    for instrument, key in [("mag", TEST_FILE), ("swe", "swe.pkts")]:
+        document = Document(
+            index,
+            f"s3://{BUCKET_NAME}/{key}",
+            Action.CREATE,
+            {"instrument": instrument, "level": "l0"},
+        )
+        payload.add_documents(document)
+    client.send_payload(payload)
+    create_client = MagicMock(return_value=client)
+    monkeypatch.setattr(download_query_api, "_create_open_search_client", create_client)
+
+    status, body = _batch({"instrument": "mag", "level": "l0"})
+
+    assert status == 200
+    assert list(json.loads(body)["download_urls"]) == [
+        f"s3://{BUCKET_NAME}/{TEST_FILE}"
+    ]
+
+    monkeypatch.setattr(download_query_api, "MAX_BATCH_SIZE", 1)
+    status, body = _batch({"level": "l0"})
+    assert status == 400
+    assert "narrow down" in body
+    # the client is reused by the following requests
+    create_client.assert_called_once()
+
+
+def test_object_index(setup_s3, dynamodb, monkeypatch):
+    """Objects recorded by the indexer are presigned without asking S3"""
+    monkeypatch.setenv("OBJECT_INDEX_TABLE", "sds-object-index")
+    indexed = f"s3://{BUCKET_NAME}/imap/l0/indexed.pkts"
+    dynamodb.Table("sds-object-index").put_item(Item=object_index_item(indexed))
+    head_object = MagicMock(wraps=setup_s3.head_object)
+    s3_client = MagicMock(wraps=setup_s3, head_object=head_object)
+    monkeypatch.setattr(download_query_api.boto3, "client", lambda _: s3_client)
+
+    status, body = _batch({"s3_uri": indexed})
+    assert status == 200
+    head_object.assert_not_called()
+
+    # objects missing from the index are checked in S3, once
+    found = f"s3://{BUCKET_NAME}/{TEST_FILE}"
+    for _ in range(2):
+        status, body = _post([indexed, found])
+        assert status == 200
+        assert list(json.loads(body)["download_urls"]) == [indexed, found]
+    head_object.assert_called_once_with(Bucket=BUCKET_NAME, Key=TEST_FILE)
@@ -0,0 +1,163 @@
+import json
+import random
+import time
+from pathlib import Path
+
+import pytest
+
+from sds_data_manager.lambda_code.SDSCode.filetype_matcher import FiletypeMatcher
+from sds_data_manager.lambda_code.SDSCode.indexer import _check_for_matching_filetype
+
+CONFIG_PATH = (
+    Path(__file__).parent.parent.parent / "sds_data_manager" / "config" / "config.json"
+)
+
+
+@pytest.fixture()
+def filetypes():
+    with open(CONFIG_PATH) as f:
+        return json.load(f)
+
+
+def _linear_match(filetypes, filename):
+    """Reference implementation, scanning the patterns in order"""
+    for filetype in filetypes:
+        metadata = _check_for_matching_filetype(filetype["pattern"], filename)
+        if metadata is not None:
+            return metadata
+    return None
+
+
+def _benchmark_filetypes(count):
+    """Build a configuration with count patterns of a few different shapes"""
+    filetypes = []
+    for i in range(count):
+        pattern = {
+            "mission": "imap",
+            "level": f"l{i % 4}",
+            "instrument": f"inst{i // 4}",
+            "date": "*",
+            "version": "*",
+            "extension": "pkts" if i % 2 else "cdf",
+        }
+        if i % 10 == 0:
+            pattern["instrument"] = "*"
+        if i % 7 == 0:
+            pattern = {"mission": "imap", "type": f"t{i}", **pattern}
+        filetypes.append({"product": f"product-{i}", "pattern": pattern, "path": ""})
+    return filetypes
+
+
+def _benchmark_filenames(count, seed=0):
+    rng = random.Random(seed)
+    filenames = []
+    for _ in range(count):
+        fields = [
+            "imap",
+            f"l{rng.randrange(5)}",
+            f"inst{rng.randrange(140)}",
+            f"2023{rng.randrange(1, 13):02d}{rng.randrange(1, 29):02d}",
+            f"v{rng.randrange(1, 10):02d}",
+        ]
+        if rng.random() < 0.2:
+            fields.insert(1, f"t{rng.randrange(500)}")
+        filenames.append("_".join(fields) + rng.choice([".pkts", ".cdf", ".txt"]))
+    return filenames
+
+
+def test_match(filetypes):
+    """Correctly return the metadata of the matching pattern"""
+    matcher = FiletypeMatcher(filetypes)
+
+    metadata = matcher.match("imap_l0_sci_mag_20230724_v01.pkts")
+    assert metadata == {
+        "mission": "imap",
+        "level": "l0",
+        "type": "sci",
+        "instrument": "mag",
+        "date": "20230724",
+        "version": "v01",
+        "extension": "pkts",
+    }
+
+    filetype, metadata = matcher.match_filetype("imap_l1_mag_20230724_v01.fits")
+    assert filetype == filetypes[1]
+    assert metadata["level"] == "l1"
+
+
+def test_match_no_match(filetypes):
+    """Correctly return None when no pattern matches"""
+    matcher = FiletypeMatcher(filetypes)
+
+    # literal field mismatch
+    assert matcher.match("imap_l1_mag_20230724_v01.pkts") is None
+    # wrong number of fields
+    assert matcher.match("imap_l0_mag_20230724_v01.pkts") is None
+    assert matcher.match_filetype("not_a_data_file") == (None, None)
+
+
+def test_match_first_pattern_wins():
+    """When several patterns match, the first one in the config is used"""
+    filetypes = [
+        {"product": "any", "pattern": {"mission": "imap", "level": "*"}},
+        {"product": "l0", "pattern": {"mission": "imap", "level": "l0"}},
+    ]
+    matcher = FiletypeMatcher(filetypes)
+    assert matcher.match_filetype("imap.l0")[0]["product"] == "any"
+
+    matcher = FiletypeMatcher(filetypes[::-1])
+    assert matcher.match_filetype("imap.l0")[0]["product"] == "l0"
+
+
+def test_match_same_as_linear_scan():
+    """The compiled matcher returns the same result as scanning the config"""
+    filetypes = _benchmark_filetypes(100)
+    matcher = FiletypeMatcher(filetypes)
+
+    for filename in _benchmark_filenames(2000):
+        assert matcher.match(filename) == _linear_match(filetypes, filename)
+
+
+def test_classify(filetypes):
+    """Correctly classify a list of filenames in one call"""
+    matcher = FiletypeMatcher(filetypes)
+    filenames = [
+        "imap_l0_sci_mag_20230724_v01.pkts",
+        "not_a_data_file",
+        "imap_l1_mag_20230724_v01.fits",
+        "imap_l1_mag_20230724_v01.pkts",
+    ]
+
+    results = matcher.classify(filenames)
+
+    assert results == [matcher.match(filename) for filename in filenames]
+    assert results[0]["instrument"] == "mag"
+    assert results[1] is None
+    assert results[2]["level"] == "l1"
+    assert results[3] is None
+    assert matcher.classify([]) == []
+
+
+@pytest.mark.benchmark()
+def test_benchmark_match():
+    """Benchmark 100k filenames against a 500 pattern configuration"""
+    filetypes = _benchmark_filetypes(500)
+    filenames = _benchmark_filenames(100_000)
+
+    start = time.perf_counter()
+    matcher = FiletypeMatcher(filetypes)
+    compiled = [matcher.match(filename) for filename in filenames]
+    compiled_time = time.perf_counter() - start
+
+    # the linear scan is far too slow for the full set, time a sample instead
+    sample = filenames[:1000]
+    start = time.perf_counter()
+    linear = [_linear_match(filetypes, filename) for filename in sample]
+    linear_time = (time.perf_counter() - start) * len(filenames) / len(sample)
+
+    print(
+        f"\n{len(filenames)} filenames, {len(filetypes)} patterns: "
+        f"compiled {compiled_time:.2f}s, linear scan ~{linear_time:.2f}s "
+        f"(extrapolated from {len(sample)} filenames)"
+    )
+    assert compiled[: len(sample)] == linear
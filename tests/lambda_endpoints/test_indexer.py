@@ -1,6 +1,11 @@
+import json
 import os
+import threading
 import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import MagicMock
 
 import boto3
 import pytest
@@ -8,7 +13,13 @@ from botocore.exceptions import ClientError
 from opensearchpy import RequestsHttpConnection
 
 from sds_data_manager.lambda_code.SDSCode import indexer
+from sds_data_manager.lambda_code.SDSCode.dynamodb_utils.object_index import (
+    object_index_item,
+)
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.action import Action
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.bulk_result import (
+    BulkResult,
+)
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.client import Client
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.document import Document
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.index import Index
@@ -125,5 +136,304 @@ class TestIndexer(unittest.TestCase):
         self.client.close()
 
 
+@pytest.fixture()
+def config_bucket(s3_client, monkeypatch):
+    """Mocked config bucket with an empty warm-invocation cache"""
+    monkeypatch.setenv("S3_CONFIG_BUCKET_NAME", "config-bucket")
+    monkeypatch.setattr(indexer, "s3", s3_client)
+    monkeypatch.setattr(
+        indexer,
+        "_cache",
+        {
+            "config": None,
+            "config_etag": None,
+            "config_checked_at": 0.0,
+            "matcher": None,
+            "client": None,
+            "client_created_at": 0.0,
+            "snapshot_coordinator": None,
+            "query_cache": None,
+        },
+    )
+    monkeypatch.setattr(indexer, "_thread_local", threading.local())
+    s3_client.create_bucket(Bucket="config-bucket")
+    s3_client.put_object(
+        Bucket="config-bucket", Key="config.json", Body=json.dumps([{"a": 1}])
+    )
+    return s3_client
+
+
+def _put_repo_config(s3_client):
+    """Replace the mocked config.json with the one deployed from this repo"""
+    config_path = Path(__file__).parents[2] / "sds_data_manager/config/config.json"
+    s3_client.put_object(
+        Bucket="config-bucket", Key="config.json", Body=config_path.read_bytes()
+    )
+
+
+def test_load_allowed_filenames_cached(config_bucket, monkeypatch):
+    """The config is not downloaded again while the cache entry is fresh"""
+    monkeypatch.setattr(indexer, "CACHE_TTL_SECONDS", 300)
+    assert indexer._load_allowed_filenames() == [{"a": 1}]
+
+    config_bucket.put_object(
+        Bucket="config-bucket", Key="config.json", Body=json.dumps([{"b": 2}])
+    )
+    assert indexer._load_allowed_filenames() == [{"a": 1}]
+
+
+def test_load_allowed_filenames_etag(config_bucket, monkeypatch):
+    """An expired cache entry is only reloaded when the ETag has changed"""
+    monkeypatch.setattr(indexer, "CACHE_TTL_SECONDS", 0)
+    config = indexer._load_allowed_filenames()
+    # unchanged config, the same object is returned from the cache
+    assert indexer._load_allowed_filenames() is config
+
+    config_bucket.put_object(
+        Bucket="config-bucket", Key="config.json", Body=json.dumps([{"b": 2}])
+    )
+    assert indexer._load_allowed_filenames() == [{"b": 2}]
+
+
+def test_classify_filenames(config_bucket):
+    """Correctly classify a list of S3 keys using the config in S3"""
+    config = [
+        {
+            "product": "IMAP-L1-File",
+            "pattern": {
+                "mission": "imap",
+                "level": "l1",
+                "instrument": "*",
+                "date": "*",
+                "version": "*",
+                "extension": "fits",
+            },
+            "path": "imap/l1/",
+        }
+    ]
+    config_bucket.put_object(
+        Bucket="config-bucket", Key="config.json", Body=json.dumps(config)
+    )
+
+    results = indexer.classify_filenames(
+        ["imap/l1/imap_l1_mag_20230724_v01.fits", "imap/l0/unknown.pkts"]
+    )
+
+    assert results == [
+        {
+            "mission": "imap",
+            "level": "l1",
+            "instrument": "mag",
+            "date": "20230724",
+            "version": "v01",
+            "extension": "fits",
+        },
+        None,
+    ]
+
+
+INDEXER_ENVIRONMENT = {
+    "OS_DOMAIN": "localhost",
+    "SNAPSHOT_REPO_NAME": "snapshot-repo",
+    "S3_SNAPSHOT_BUCKET_NAME": "snapshot-bucket",
+    "SNAPSHOT_ROLE_ARN": "arn:aws:iam::012345678901:role/snapshot-role",
+    "REGION": "us-east-1",
+    "METADATA_INDEX": "metadata",
+    "DATA_TRACKER_INDEX": "data_tracker",
+    "S3_DATA_BUCKET": "s3://data-bucket",
+    "DYNAMODB_TABLE": "imap-data-watcher",
+    "STATE_MACHINE_ARN": "arn:aws:states:us-east-1:012345678901:stateMachine:sm",
+    "QUERY_CACHE_TABLE": "sds-query-cache",
+    "OBJECT_INDEX_TABLE": "sds-object-index",
+}
+
+
+def test_lambda_handler_batch(config_bucket, dynamodb, monkeypatch):
+    """All records of an event are indexed together"""
+    ## Arrange ##
+    _put_repo_config(config_bucket)
+    for key, value in INDEXER_ENVIRONMENT.items():
+        monkeypatch.setenv(key, value)
+    client = MagicMock()
+    # a document created by an earlier delivery of the event is not a failure
+    client.send_payload.return_value = _bulk_result(409)
+    monkeypatch.setattr(indexer, "_get_open_search_client", lambda: client)
+    coordinator = MagicMock()
+    monkeypatch.setattr(indexer, "_get_snapshot_coordinator", lambda: coordinator)
+    step_function_client = MagicMock()
+    monkeypatch.setattr(indexer, "step_function_client", step_function_client)
+
+    keys = [
+        "imap/l0/imap_l0_sci_mag_20230724_v01.pkts",
+        "imap/l0/unknown_file.txt",
+        "imap/l0/imap_l0_sci_swe_20230724_v01.pkts",
+        "imap/l1/imap_l1_mag_20230724_v01.fits",
+    ]
+    event = {"Records": [{"s3": {"object": {"key": key}}} for key in keys]}
+
+    ## Act ##
+    indexer.lambda_handler(event, None)
+
+    ## Assert ##
+    # one bulk payload with a metadata and a data_tracker document per file
+    client.send_payload.assert_called_once()
+    payload = client.send_payload.call_args[0][0]
+    # the query cache is invalidated once the new documents are searchable,
+    # without forcing a refresh
+    assert client.send_payload.call_args.kwargs["refresh"] == "wait_for"
+    assert payload.get_contents().count('"_index": "metadata"') == 3
+    assert payload.get_contents().count('"_index": "data_tracker"') == 3
+    coordinator.take_snapshot_if_due.assert_called_once()
+
+    items = dynamodb.Table("imap-data-watcher").scan()["Items"]
+    files = [item for item in items if item["instrument"] in ("mag", "swe")]
+    files_keys = keys[:1] + keys[2:]
+    assert sorted(item["filename"] for item in files) == sorted(files_keys)
+
+    # the cached query results of both instruments are invalidated
+    generations = {
+        item["cache_key"]: item["generation"]
+        for item in dynamodb.Table("sds-query-cache").scan()["Items"]
+    }
+    assert generations == {"generation#mag": 1, "generation#swe": 1, "generation#*": 1}
+
+    # the files are recorded for the download API
+    objects = [
+        item["s3_uri"] for item in dynamodb.Table("sds-object-index").scan()["Items"]
+    ]
+    assert sorted(objects) == sorted(f"s3://data-bucket/{key}" for key in files_keys)
+
+    # one step function execution per instrument
+    inputs = [
+        json.loads(call.kwargs["input"])
+        for call in step_function_client.start_execution.call_args_list
+    ]
+    assert inputs == [{"instrument": "mag"}, {"instrument": "swe"}]
+
+
+def _bulk_result(status):
+    """BulkResult of a payload with one document rejected with the status"""
+    result = BulkResult()
+    result.successful = 5
+    result.add_item(
+        "create",
+        {"_index": "metadata", "_id": "file", "status": status, "error": {}},
+    )
+    return result
+
+
+def test_lambda_handler_bulk_failure(config_bucket, dynamodb, monkeypatch):
+    """Documents rejected by OpenSearch fail the invocation, before processing"""
+    _put_repo_config(config_bucket)
+    for key, value in INDEXER_ENVIRONMENT.items():
+        monkeypatch.setenv(key, value)
+    client = MagicMock()
+    client.send_payload.return_value = _bulk_result(400)
+    monkeypatch.setattr(indexer, "_get_open_search_client", lambda: client)
+    monkeypatch.setattr(indexer, "_get_snapshot_coordinator", MagicMock)
+    step_function_client = MagicMock()
+    monkeypatch.setattr(indexer, "step_function_client", step_function_client)
+    key = "imap/l0/imap_l0_sci_mag_20230724_v01.pkts"
+    event = {"Records": [{"s3": {"object": {"key": key}}}]}
+
+    with pytest.raises(RuntimeError, match="1 documents could not be indexed"):
+        indexer.lambda_handler(event, None)
+
+    step_function_client.start_execution.assert_not_called()
+
+
+def test_lambda_handler_removed(dynamodb, monkeypatch):
+    """Deleted files are removed from the object index and nothing is indexed"""
+    monkeypatch.setenv("S3_DATA_BUCKET", "s3://data-bucket")
+    monkeypatch.setenv("OBJECT_INDEX_TABLE", "sds-object-index")
+    monkeypatch.setattr(indexer, "_get_dynamodb", lambda: dynamodb)
+    table = dynamodb.Table("sds-object-index")
+    for key in ["imap/l0/deleted.pkts", "imap/l0/kept.pkts"]:
+        table.put_item(Item=object_index_item(f"s3://data-bucket/{key}"))
+    client = MagicMock()
+    monkeypatch.setattr(indexer, "_get_open_search_client", lambda: client)
+    event = {
+        "Records": [
+            {
+                "eventName": "ObjectRemoved:Delete",
+                "s3": {"object": {"key": "imap/l0/deleted.pkts"}},
+            }
+        ]
+    }
+
+    assert indexer.lambda_handler(event, None) is None
+
+    assert [item["s3_uri"] for item in table.scan()["Items"]] == [
+        "s3://data-bucket/imap/l0/kept.pkts"
+    ]
+    client.send_payload.assert_not_called()
+
+
+def test_lambda_handler_scheduled(monkeypatch):
+    """The scheduled rule takes the pending snapshot and indexes nothing"""
+    coordinator = MagicMock()
+    monkeypatch.setattr(indexer, "_get_snapshot_coordinator", lambda: coordinator)
+    event = {"source": "aws.events", "detail-type": "Scheduled Event"}
+
+    assert indexer.lambda_handler(event, None) is None
+
+    coordinator.take_pending_snapshot.assert_called_once()
+    coordinator.take_snapshot_if_due.assert_not_called()
+
+
+def test_lambda_handler_no_match(config_bucket, monkeypatch):
+    """Nothing is sent when none of the files match a known file type"""
+    _put_repo_config(config_bucket)
+    monkeypatch.setenv("METADATA_INDEX", "metadata")
+    monkeypatch.setenv("DATA_TRACKER_INDEX", "data_tracker")
+    monkeypatch.setenv("DYNAMODB_TABLE", "imap-data-watcher")
+    client = MagicMock()
+    monkeypatch.setattr(indexer, "_get_open_search_client", lambda: client)
+
+    event = {"Records": [{"s3": {"object": {"key": "imap/unknown_file.txt"}}}]}
+
+    assert indexer.lambda_handler(event, None) is None
+    client.send_payload.assert_not_called()
+
+
+def test_get_dynamodb_per_thread(monkeypatch):
+    """Every thread gets its own DynamoDB resource, reused by later calls"""
+    monkeypatch.setattr(indexer, "_thread_local", threading.local())
+
+    resource = indexer._get_dynamodb()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        thread_resources = executor.submit(
+            lambda: [indexer._get_dynamodb(), indexer._get_dynamodb()]
+        ).result()
+
+    assert indexer._get_dynamodb() is resource
+    assert thread_resources[0] is thread_resources[1]
+    assert thread_resources[0] is not resource
+
+
+def test_get_open_search_client_cached(monkeypatch):
+    """The OpenSearch client is reused until the cache entry expires"""
+    monkeypatch.setattr(indexer, "_cache", {"client": None, "client_created_at": 0.0})
+    monkeypatch.setenv("METADATA_INDEX", "metadata")
+    monkeypatch.setenv("DATA_TRACKER_INDEX", "data_tracker")
+    create_client = MagicMock(side_effect=lambda: MagicMock())
+    monkeypatch.setattr(indexer, "_create_open_search_client", create_client)
+
+    monkeypatch.setattr(indexer, "CACHE_TTL_SECONDS", 300)
+    client = indexer._get_open_search_client()
+    assert indexer._get_open_search_client() is client
+    assert create_client.call_count == 1
+    # the index templates are installed once per client
+    templates = [call.args[0] for call in client.put_index_template.call_args_list]
+    assert [index.get_name() for index in templates] == ["metadata", "data_tracker"]
+
+    # once expired, the old client is closed and a new one is created
+    monkeypatch.setattr(indexer, "CACHE_TTL_SECONDS", 0)
+    new_client = indexer._get_open_search_client()
+    assert new_client is not client
+    client.close.assert_called_once()
+    assert create_client.call_count == 2
+
+
 if __name__ == "__main__":
     unittest.main()
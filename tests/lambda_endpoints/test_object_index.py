@@ -0,0 +1,66 @@
+import time
+
+from sds_data_manager.lambda_code.SDSCode.dynamodb_utils.object_index import (
+    ObjectIndex,
+    object_index_item,
+    object_index_key,
+)
+from sds_data_manager.lambda_code.SDSCode.dynamodb_utils.status_writer import (
+    ProcessingStatusWriter,
+)
+
+TABLE_NAME = "sds-object-index"
+
+
+def _uri(i):
+    return f"s3://data-bucket/imap/l0/file_{i}.pkts"
+
+
+def test_find_in_table(dynamodb):
+    """Objects recorded by the indexer are found in batches of 100"""
+    with ProcessingStatusWriter(
+        TABLE_NAME, key_names=("s3_uri",), dynamodb=dynamodb
+    ) as writer:
+        writer.put_items([object_index_item(_uri(i)) for i in range(150)])
+    index = ObjectIndex(TABLE_NAME, dynamodb=dynamodb)
+
+    found = index.find([_uri(i) for i in range(140, 160)])
+
+    assert found == {_uri(i) for i in range(140, 150)}
+
+
+def test_find_in_memory(dynamodb, monkeypatch):
+    """Found objects are remembered for the ttl without asking the table"""
+    dynamodb.Table(TABLE_NAME).put_item(Item=object_index_item(_uri(1)))
+    index = ObjectIndex(TABLE_NAME, ttl=60, dynamodb=dynamodb)
+    assert index.find([_uri(1)]) == {_uri(1)}
+    dynamodb.Table(TABLE_NAME).delete_item(Key=object_index_key(_uri(1)))
+
+    assert index.find([_uri(1)]) == {_uri(1)}
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert index.find([_uri(1)]) == set()
+
+
+def test_find_expired(dynamodb):
+    """Expired items are ignored until DynamoDB deletes them"""
+    table = dynamodb.Table(TABLE_NAME)
+    table.put_item(Item=object_index_item(_uri(1)))
+    table.put_item(Item=object_index_item(_uri(2), retention=-1))
+    index = ObjectIndex(TABLE_NAME, dynamodb=dynamodb)
+
+    assert index.find([_uri(1), _uri(2)]) == {_uri(1)}
+
+
+def test_without_table():
+    """Only the objects added are known without a table"""
+    index = ObjectIndex(max_entries=2)
+    index.add(_uri(1))
+
+    assert index.find([_uri(1), _uri(2)]) == {_uri(1)}
+
+    index.add(_uri(2))
+    index.add(_uri(3))
+    assert len(index._known) <= 2
+    assert _uri(3) in index.find([_uri(3)])
@@ -1,6 +1,8 @@
+import json
 import os
 import time
 import unittest
+from unittest.mock import MagicMock
 
 import boto3
 import pytest
@@ -13,6 +15,9 @@ from sds_data_manager.lambda_code.SDSCode.opensearch_utils.action import Action
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.client import Client
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.document import Document
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.index import Index
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.payload import Payload
+
+from ..opensearch_utils.fake_opensearch import pit_openmock
 
 
 @pytest.mark.network()
@@ -92,7 +97,247 @@ class TestQueries(unittest.TestCase):
         response_out = queries.lambda_handler(event, "")
 
         ## Assert ##
-        assert response_out == response_expected
+        assert json.loads(response_out["body"])["results"] == response_expected
 
     def tearDown(self):
         self.client.send_document(self.document, action_override=Action.DELETE)
+
+
+@pytest.fixture(autouse=True)
+def _reset_cache(monkeypatch):
+    """Every test starts without a cached client or query result"""
+    monkeypatch.setattr(
+        queries,
+        "_cache",
+        {"client": None, "client_created_at": 0.0, "query_cache": None},
+    )
+    monkeypatch.delenv("QUERY_CACHE_TABLE", raising=False)
+
+
+@pytest.fixture()
+@pit_openmock
+def query_client(monkeypatch):
+    """Queries lambda connected to a fake cluster holding 25 documents"""
+    monkeypatch.setenv("OS_INDEX", "test_data")
+    client = Client(hosts=[{"host": "localhost", "port": 9000}])
+    index = Index("test_data")
+    client.create_index(index)
+    payload = Payload()
+    for i in range(25):
+        body = {"instrument": "mag" if i % 5 else "swe", "level": "l0"}
+        payload.add_documents(Document(index, f"file_{i:02d}", Action.CREATE, body))
+    client.send_payload(payload)
+    monkeypatch.setattr(queries, "_create_open_search_client", lambda: client)
+    return client
+
+
+def _query(params):
+    response = queries.lambda_handler({"queryStringParameters": params}, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def test_queries_pagination(query_client):
+    """Page through the results with the returned next_token"""
+    ids = []
+    params = {"instrument": "mag", "limit": "7"}
+    pages = 0
+    while True:
+        status, body = _query(params)
+        assert status == 200
+        assert len(body["results"]) <= 7
+        ids += [hit["_id"] for hit in body["results"]]
+        pages += 1
+        if body["next_token"] is None:
+            break
+        params = {**params, "next_token": body["next_token"]}
+
+    # 20 results in pages of 7, 7 and 6
+    assert pages == 3
+    assert ids == [f"file_{i:02d}" for i in range(25) if i % 5]
+
+
+def test_queries_next_token_expired(query_client):
+    """A next_token whose point in time has expired returns a 400 response"""
+    _, body = _query({"instrument": "mag", "limit": "7"})
+    query_client.client.pits.clear()
+
+    status, body = _query(
+        {"instrument": "mag", "limit": "7", "next_token": body["next_token"]}
+    )
+
+    assert status == 400
+    assert "expired" in body["error"]
+
+
+def test_queries_default_limit(query_client):
+    """Every result fits in the default page size"""
+    status, body = _query({"level": "l0"})
+
+    assert status == 200
+    assert len(body["results"]) == 25
+    assert body["next_token"] is None
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{"limit": "0"}, {"limit": "a"}, {"limit": "100000"}, {"next_token": "%%%"}],
+)
+def test_queries_invalid_parameters(query_client, params):
+    """Invalid pagination parameters return a 400 response"""
+    status, body = _query(params)
+
+    assert status == 400
+    assert "error" in body
+
+
+def test_queries_count_only(query_client):
+    """Only the number of matching files is returned"""
+    status, body = _query({"instrument": "mag", "count_only": "true"})
+
+    assert status == 200
+    assert body == {"count": 20}
+
+
+def test_queries_group_by(query_client):
+    """The number of matching files is returned per value of the field"""
+    status, body = _query({"level": "l0", "group_by": "instrument"})
+
+    assert status == 200
+    assert body == {"groups": [{"key": "mag", "count": 20}, {"key": "swe", "count": 5}]}
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{"group_by": "filename"}, {"group_by": "date", "interval": "hour"}],
+)
+def test_queries_invalid_group_by(query_client, params):
+    """Invalid grouping parameters return a 400 response"""
+    status, body = _query(params)
+
+    assert status == 400
+    assert "error" in body
+
+
+def test_queries_fields(query_client):
+    """Only the requested fields are returned with the S3 path of the files"""
+    status, body = _query({"instrument": "swe", "fields": "level"})
+
+    assert status == 200
+    assert [hit["_id"] for hit in body["results"]] == [
+        f"file_{i:02d}" for i in range(0, 25, 5)
+    ]
+    assert all(hit["_source"] == {"level": "l0"} for hit in body["results"])
+
+
+def test_queries_cached(query_client, monkeypatch):
+    """Repeated queries are answered from the cache, in any parameter order"""
+    search_page = MagicMock(wraps=query_client.search_page)
+    monkeypatch.setattr(query_client, "search_page", search_page)
+
+    first = _query({"instrument": "swe", "level": "l0"})
+    second = _query({"level": "l0", "instrument": "swe"})
+
+    assert first == second
+    assert search_page.call_count == 1
+    _query({"instrument": "mag", "level": "l0"})
+    assert search_page.call_count == 2
+
+
+def test_queries_cache_invalidated(query_client, dynamodb, monkeypatch):
+    """Results cached in the table are dropped when the instrument is indexed"""
+    monkeypatch.setenv("QUERY_CACHE_TABLE", "sds-query-cache")
+    count = MagicMock(wraps=query_client.count)
+    monkeypatch.setattr(query_client, "count", count)
+    params = {"instrument": "swe", "count_only": "true"}
+
+    _query(params)
+    # a new container shares the results through the table
+    queries._cache["query_cache"] = None
+    _query(params)
+    assert count.call_count == 1
+
+    queries._get_query_cache().bump_generations(["swe"])
+    assert _query(params) == (200, {"count": 5})
+    assert count.call_count == 2
+
+
+def _export(params):
+    return queries.lambda_handler({"queryStringParameters": params}, None)
+
+
+def test_queries_export_ndjson(query_client):
+    """Every result is returned as one JSON line, without pagination"""
+    response = _export({"level": "l0", "format": "ndjson", "limit": "7"})
+
+    assert response["statusCode"] == 200
+    assert response["headers"]["Content-Type"] == "application/x-ndjson"
+    hits = [json.loads(line) for line in response["body"].splitlines()]
+    assert [hit["_id"] for hit in hits] == [f"file_{i:02d}" for i in range(25)]
+    assert hits[0]["_source"] == {"instrument": "swe", "level": "l0"}
+
+
+def test_queries_export_csv(query_client):
+    """Results are returned as CSV rows of the S3 path and requested fields"""
+    response = _export({"instrument": "swe", "format": "csv", "fields": "level"})
+
+    assert response["statusCode"] == 200
+    assert response["headers"]["Content-Type"] == "text/csv"
+    assert response["body"].splitlines() == ["path,level"] + [
+        f"file_{i:02d},l0" for i in range(0, 25, 5)
+    ]
+
+
+def test_queries_export_csv_paths_only(query_client):
+    """An empty fields parameter exports only the S3 paths"""
+    response = _export({"instrument": "swe", "format": "csv", "fields": ""})
+
+    assert response["statusCode"] == 200
+    assert response["body"].splitlines() == ["path"] + [
+        f"file_{i:02d}" for i in range(0, 25, 5)
+    ]
+
+
+def test_queries_export_s3(query_client, s3_client, monkeypatch):
+    """Large exports are uploaded to S3 and returned as a download link"""
+    s3_client.create_bucket(Bucket="query-results")
+    monkeypatch.setenv("QUERY_RESULTS_BUCKET", "query-results")
+    monkeypatch.setattr(queries, "MAX_INLINE_EXPORT_BYTES", 100)
+    monkeypatch.setattr(queries, "EXPORT_BUFFER_BYTES", 10)
+
+    status, body = _query({"level": "l0", "format": "csv"})
+
+    assert status == 200
+    assert body["count"] == 25
+    assert "query-results" in body["download_url"]
+    (exported,) = s3_client.list_objects_v2(Bucket="query-results")["Contents"]
+    content = s3_client.get_object(Bucket="query-results", Key=exported["Key"])
+    assert content["ContentType"] == "text/csv"
+    assert len(content["Body"].read().decode().splitlines()) == 26
+
+
+def test_queries_export_too_large(query_client, monkeypatch):
+    """Large exports are refused when there is no bucket to upload them to"""
+    monkeypatch.delenv("QUERY_RESULTS_BUCKET", raising=False)
+    monkeypatch.setattr(queries, "MAX_INLINE_EXPORT_BYTES", 100)
+
+    status, body = _query({"level": "l0", "format": "ndjson"})
+
+    assert status == 413
+    assert "error" in body
+
+
+def test_queries_export_invalid_format(query_client):
+    """Unknown formats return a 400 response"""
+    status, body = _query({"format": "xml"})
+
+    assert status == 400
+    assert "format" in body["error"]
+
+
+@pytest.mark.parametrize("params", [{"count_only": "true"}, {"group_by": "level"}])
+def test_queries_export_with_aggregation(query_client, params):
+    """Exports can't be combined with counts or groups"""
+    status, body = _query({"format": "csv", **params})
+
+    assert status == 400
+    assert "format" in body["error"]
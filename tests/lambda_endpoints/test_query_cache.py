@@ -0,0 +1,80 @@
+import time
+
+from sds_data_manager.lambda_code.SDSCode.dynamodb_utils.query_cache import (
+    QueryCache,
+)
+
+TABLE_NAME = "sds-query-cache"
+
+
+def _query(*filters):
+    return {"query": {"bool": {"filter": list(filters)}}}
+
+
+def test_make_key_normalized():
+    """The order of the filters and keys doesn't change the key"""
+    cache = QueryCache()
+    level = {"term": {"level": "l1"}}
+    instrument = {"term": {"instrument": "mag"}}
+
+    key = cache.make_key({"index": "metadata", "query": _query(level, instrument)})
+
+    assert key == cache.make_key(
+        {"query": _query(instrument, level), "index": "metadata"}
+    )
+    assert key != cache.make_key({"index": "metadata", "query": _query(level)})
+
+
+def test_lru_eviction():
+    """The least recently used results are evicted first"""
+    cache = QueryCache(max_entries=2)
+    cache.put("a", {"count": 1})
+    cache.put("b", {"count": 2})
+    assert cache.get("a") == {"count": 1}
+
+    cache.put("c", {"count": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"count": 1}
+    assert cache.get("c") == {"count": 3}
+
+
+def test_ttl(monkeypatch):
+    """Results expire after the ttl"""
+    cache = QueryCache(ttl=60)
+    cache.put("a", {"count": 1})
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+
+    assert cache.get("a") is None
+
+
+def test_shared_tier(dynamodb):
+    """Results are shared between caches through the table"""
+    table = dynamodb.Table(TABLE_NAME)
+    writer = QueryCache(table=table)
+    reader = QueryCache(table=table)
+
+    writer.put("a", {"count": 1})
+    # too large for a DynamoDB item
+    QueryCache(table=table, max_shared_bytes=10).put("b", {"results": ["x" * 20]})
+
+    assert reader.get("a") == {"count": 1}
+    assert reader.get("b") is None
+
+
+def test_bump_generations(dynamodb):
+    """Writing documents for an instrument changes the keys depending on it"""
+    cache = QueryCache(table=dynamodb.Table(TABLE_NAME))
+    request = {"query": _query({"term": {"instrument": "mag"}})}
+    mag_key = cache.make_key(request, instrument="mag")
+    swe_key = cache.make_key(request, instrument="swe")
+    all_key = cache.make_key(request)
+
+    cache.bump_generations(["mag"])
+
+    assert cache.generation("mag") == 1
+    assert cache.make_key(request, instrument="mag") != mag_key
+    assert cache.make_key(request, instrument="swe") == swe_key
+    assert cache.make_key(request) != all_key
@@ -0,0 +1,112 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from sds_data_manager.lambda_code.SDSCode.dynamodb_utils.status_writer import (
+    ProcessingStatusWriter,
+)
+
+TABLE_NAME = "imap-data-watcher"
+
+
+def _items(count, instrument="mag"):
+    return [
+        {"instrument": instrument, "filename": f"file_{i}.pkts", "status": "PENDING"}
+        for i in range(count)
+    ]
+
+
+def test_write_batches(dynamodb):
+    """Items are written in batches of 25 and the rest on flush"""
+    ## Arrange ##
+    writer = ProcessingStatusWriter(TABLE_NAME, dynamodb=dynamodb)
+    table = dynamodb.Table(TABLE_NAME)
+
+    ## Act ##
+    writer.put_items(_items(30))
+
+    ## Assert ##
+    # the first full batch is written right away, the rest is buffered
+    assert table.scan()["Count"] == 25
+    writer.flush()
+    assert table.scan()["Count"] == 30
+
+
+def test_context_manager_flush(dynamodb):
+    """Buffered items are written when the context manager exits"""
+    with ProcessingStatusWriter(TABLE_NAME, dynamodb=dynamodb) as writer:
+        writer.put_items(_items(3))
+        assert dynamodb.Table(TABLE_NAME).scan()["Count"] == 0
+
+    assert dynamodb.Table(TABLE_NAME).scan()["Count"] == 3
+
+
+def test_context_manager_error(dynamodb):
+    """Buffered items are dropped, not written, when an exception is raised"""
+    writer = ProcessingStatusWriter(TABLE_NAME, dynamodb=dynamodb)
+
+    def fail():
+        with writer:
+            writer.put_items(_items(3))
+            raise ValueError("failed")
+
+    with pytest.raises(ValueError, match="failed"):
+        fail()
+
+    assert dynamodb.Table(TABLE_NAME).scan()["Count"] == 0
+    writer.flush()
+    assert dynamodb.Table(TABLE_NAME).scan()["Count"] == 0
+
+
+def test_duplicate_keys(dynamodb):
+    """The latest item with the same key replaces the buffered one"""
+    writer = ProcessingStatusWriter(TABLE_NAME, dynamodb=dynamodb)
+    item = _items(1)[0]
+    writer.put_item(item)
+    writer.put_item({**item, "status": "IN_PROGRESS"})
+    writer.flush()
+
+    items = dynamodb.Table(TABLE_NAME).scan()["Items"]
+    assert items == [{**item, "status": "IN_PROGRESS"}]
+
+
+def test_retry_unprocessed_items(monkeypatch):
+    """Unprocessed items are retried with exponential backoff"""
+    ## Arrange ##
+    sleep = MagicMock()
+    monkeypatch.setattr("time.sleep", sleep)
+    items = _items(3)
+    unprocessed = {TABLE_NAME: [{"PutRequest": {"Item": items[2]}}]}
+    dynamodb = MagicMock()
+    dynamodb.batch_write_item.side_effect = [
+        {"UnprocessedItems": unprocessed},
+        {"UnprocessedItems": unprocessed},
+        {"UnprocessedItems": {}},
+    ]
+    writer = ProcessingStatusWriter(TABLE_NAME, base_delay=0.1, dynamodb=dynamodb)
+
+    ## Act ##
+    writer.put_items(items)
+    writer.flush()
+
+    ## Assert ##
+    assert dynamodb.batch_write_item.call_count == 3
+    # only the unprocessed items are sent again
+    assert dynamodb.batch_write_item.call_args.kwargs["RequestItems"] == unprocessed
+    assert [call.args[0] for call in sleep.call_args_list] == [0.1, 0.2]
+
+
+def test_retry_exhausted(monkeypatch):
+    """An error is raised when items are still unprocessed after every retry"""
+    monkeypatch.setattr("time.sleep", MagicMock())
+    items = _items(1)
+    dynamodb = MagicMock()
+    dynamodb.batch_write_item.return_value = {
+        "UnprocessedItems": {TABLE_NAME: [{"PutRequest": {"Item": items[0]}}]}
+    }
+    writer = ProcessingStatusWriter(TABLE_NAME, max_retries=2, dynamodb=dynamodb)
+    writer.put_items(items)
+
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    assert dynamodb.batch_write_item.call_count == 3
@@ -0,0 +1,160 @@
+import json
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from sds_data_manager.lambda_code.SDSCode import upload_api
+from sds_data_manager.lambda_code.SDSCode.upload_api import lambda_handler
+
+BUCKET_NAME = "test-data-bucket"
+CONFIG_BUCKET_NAME = "test-config-bucket"
+TEST_FILE = "imap_l0_sci_swe_20230101_v001.pkts"
+CONFIG_PATH = (
+    Path(__file__).parent.parent.parent / "sds_data_manager" / "config" / "config.json"
+)
+
+
+@pytest.fixture(autouse=True)
+def setup_s3(s3_client, monkeypatch):
+    """Mocked data and config buckets"""
+    s3_client.create_bucket(Bucket=BUCKET_NAME)
+    s3_client.create_bucket(Bucket=CONFIG_BUCKET_NAME)
+    s3_client.upload_file(str(CONFIG_PATH), CONFIG_BUCKET_NAME, "config.json")
+    monkeypatch.setenv("S3_BUCKET", f"s3://{BUCKET_NAME}")
+    monkeypatch.setenv("S3_CONFIG_BUCKET_NAME", CONFIG_BUCKET_NAME)
+    monkeypatch.setattr(upload_api, "s3", s3_client)
+    monkeypatch.setattr(
+        upload_api,
+        "_matcher_cache",
+        {"etag": None, "matcher": None, "checked_at": 0.0},
+    )
+    return s3_client
+
+
+def _event(**parameters):
+    return {"queryStringParameters": {"filename": TEST_FILE, **parameters}}
+
+
+def test_upload_url():
+    """A single pre-signed URL is returned without parts"""
+    response = lambda_handler(_event(), None)
+
+    assert response["statusCode"] == 200
+    url = json.loads(response["body"])
+    assert f"imap/l0/{TEST_FILE}" in url
+
+
+def test_multipart_upload(setup_s3):
+    """The parts are uploaded to their URLs, then assembled into the file"""
+    response = lambda_handler(_event(parts="2", version="v001"), None)
+
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert len(body["part_urls"]) == 2
+    assert "partNumber=2" in body["part_urls"][1]
+    assert body["upload_id"] in body["part_urls"][0]
+
+    # stand-in for the PUT requests to the pre-signed URLs
+    key = f"imap/l0/{TEST_FILE}"
+    for part_number, data in [(1, b"a" * 5 * 1024 * 1024), (2, b"b")]:
+        setup_s3.upload_part(
+            Bucket=BUCKET_NAME,
+            Key=key,
+            UploadId=body["upload_id"],
+            PartNumber=part_number,
+            Body=data,
+        )
+
+    response = lambda_handler(
+        _event(upload_id=body["upload_id"], action="complete", parts="2"), None
+    )
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"]) == f"s3://{BUCKET_NAME}/{key}"
+    uploaded = setup_s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    assert uploaded["Metadata"] == {"filename": TEST_FILE, "version": "v001"}
+
+
+@pytest.mark.parametrize("uploaded", [[1, 3], [], [1, 2, 3, 4]])
+def test_multipart_upload_missing_part(setup_s3, uploaded):
+    """An upload is only completed with exactly the parts it was started with"""
+    body = json.loads(lambda_handler(_event(parts="3"), None)["body"])
+    key = f"imap/l0/{TEST_FILE}"
+    for part_number in uploaded:
+        setup_s3.upload_part(
+            Bucket=BUCKET_NAME,
+            Key=key,
+            UploadId=body["upload_id"],
+            PartNumber=part_number,
+            Body=b"a" * 5 * 1024 * 1024,
+        )
+
+    response = lambda_handler(
+        _event(upload_id=body["upload_id"], action="complete", parts="3"), None
+    )
+
+    assert response["statusCode"] == 400
+    assert "parts" in json.loads(response["body"]).lower()
+    assert "Contents" not in setup_s3.list_objects_v2(Bucket=BUCKET_NAME)
+
+
+def test_multipart_upload_abort(setup_s3):
+    """An aborted upload can not be completed"""
+    body = json.loads(lambda_handler(_event(parts="3"), None)["body"])
+
+    response = lambda_handler(_event(upload_id=body["upload_id"], action="abort"), None)
+
+    assert response["statusCode"] == 200
+    assert setup_s3.list_multipart_uploads(Bucket=BUCKET_NAME).get("Uploads") is None
+    response = lambda_handler(
+        _event(upload_id=body["upload_id"], action="complete", parts="3"), None
+    )
+    assert response["statusCode"] == 400
+
+
+@pytest.mark.parametrize(
+    "parameters",
+    [
+        {"parts": "0"},
+        {"parts": "10001"},
+        {"parts": "many"},
+        {"upload_id": "id", "action": "resume"},
+        {"action": "complete"},
+        {"upload_id": "id", "action": "complete"},
+        {"parts": "2", "filename": "unknown.txt"},
+    ],
+)
+def test_multipart_upload_invalid(parameters):
+    """Invalid multipart requests are rejected"""
+    response = lambda_handler(_event(**parameters), None)
+
+    assert response["statusCode"] == 400
+
+
+def test_multipart_upload_server_error(setup_s3, monkeypatch):
+    """S3 errors not caused by the request are raised"""
+    error = ClientError(
+        {"Error": {"Code": "AccessDenied", "Message": "Access Denied"}},
+        "ListParts",
+    )
+    monkeypatch.setattr(
+        upload_api, "_complete_multipart_upload", MagicMock(side_effect=error)
+    )
+
+    with pytest.raises(ClientError):
+        lambda_handler(_event(upload_id="id", action="complete", parts="2"), None)
+
+
+def test_filetype_matcher_cache(setup_s3, monkeypatch):
+    """config.json is only downloaded again when its ETag changes"""
+    matcher = upload_api._get_filetype_matcher()
+    assert upload_api._get_filetype_matcher() is matcher
+
+    # expired, but config.json is unchanged
+    monkeypatch.setattr(upload_api, "CACHE_TTL_SECONDS", 0)
+    assert upload_api._get_filetype_matcher() is matcher
+
+    setup_s3.put_object(Bucket=CONFIG_BUCKET_NAME, Key="config.json", Body=b"[]")
+    assert upload_api._get_filetype_matcher() is not matcher
@@ -0,0 +1,186 @@
+"""openmock FakeOpenSearch extended with the search features openmock lacks"""
+import copy
+import datetime
+import uuid
+import zlib
+from collections import Counter
+from functools import wraps
+from unittest.mock import patch
+
+from openmock import FakeOpenSearch, openmock
+from openmock.fake_indices import FakeIndicesClient
+from opensearchpy import NotFoundError
+
+
+class FakeTemplateIndicesClient(FakeIndicesClient):
+    """FakeIndicesClient recording the index templates it is sent"""
+
+    def put_index_template(self, name, body, params=None, headers=None):
+        self.client.templates[name] = body
+        return {"acknowledged": True}
+
+
+class FakePitOpenSearch(FakeOpenSearch):
+    """
+    FakeOpenSearch with point in time, search_after and index template
+    support.
+
+    Searches against a point in time or with a sort order sort their hits on
+    the first sort field, the document id standing in for _shard_doc, and
+    return copies of the stored documents so the "sort" values added to the
+    hits do not leak into the index. Sliced searches only return the hits
+    whose id hashes to the slice, and source filtering only keeps the included
+    fields. Counts apply their query, and terms and date histogram
+    aggregations are computed over the matching documents.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # {pit id: index name}
+        self.pits = {}
+        # {template name: template body}
+        self.templates = {}
+
+    @property
+    def indices(self):
+        return FakeTemplateIndicesClient(self)
+
+    def create_pit(self, index, params=None, headers=None):
+        pit_id = str(uuid.uuid4())
+        self.pits[pit_id] = index
+        return {"pit_id": pit_id, "_shards": {"total": 1, "failed": 0}}
+
+    def delete_pit(self, body=None, params=None, headers=None):
+        pits = [
+            {"pit_id": pit_id, "successful": self.pits.pop(pit_id, None) is not None}
+            for pit_id in body["pit_id"]
+        ]
+        return {"pits": pits}
+
+    def count(self, index=None, doc_type=None, body=None, params=None, headers=None):
+        if not body or "query" not in body:
+            return super().count(index=index, doc_type=doc_type, params=params)
+        result = self.search(index=index, body={"query": body["query"]})
+        return {"count": result["hits"]["total"]["value"]}
+
+    def search(self, index=None, doc_type=None, body=None, params=None, headers=None):
+        if body and body.get("query") == {"bool": {}}:
+            # an empty bool query matches every document
+            body = {key: value for key, value in body.items() if key != "query"}
+        if body and "aggs" in body:
+            return self._aggregate(index, body)
+        if not body or ("pit" not in body and "sort" not in body):
+            return super().search(
+                index=index, doc_type=doc_type, body=body, params=params
+            )
+
+        body = dict(body)
+        pit = body.pop("pit", None)
+        size = body.pop("size", 10)
+        search_after = body.pop("search_after", None)
+        sort_field = next(iter(body.pop("sort", [{"_shard_doc": "asc"}])[0]))
+        slice_ = body.pop("slice", None)
+        source = body.pop("_source", None)
+        if pit is not None:
+            if pit["id"] not in self.pits:
+                raise NotFoundError(
+                    404, "search_phase_execution_exception", "No search context found"
+                )
+            index = self.pits[pit["id"]]
+
+        result = super().search(index=index, body=body, params={})
+        hits = sorted(
+            (copy.deepcopy(hit) for hit in result["hits"]["hits"]),
+            key=lambda hit: _sort_value(hit, sort_field),
+        )
+        if slice_ is not None:
+            hits = [
+                hit
+                for hit in hits
+                if zlib.crc32(str(hit["_id"]).encode()) % slice_["max"] == slice_["id"]
+            ]
+        if search_after is not None:
+            hits = [
+                hit for hit in hits if [_sort_value(hit, sort_field)] > search_after
+            ]
+        hits = hits[:size]
+        for hit in hits:
+            hit["sort"] = [_sort_value(hit, sort_field)]
+            if source is False:
+                del hit["_source"]
+            elif source is not None:
+                hit["_source"] = {
+                    field: value
+                    for field, value in hit["_source"].items()
+                    if field in source["includes"]
+                }
+
+        result["hits"]["hits"] = hits
+        if pit is not None:
+            result["pit_id"] = pit["id"]
+        return result
+
+    def _aggregate(self, index, body):
+        body = dict(body)
+        aggs = body.pop("aggs")
+        size = body.pop("size", 10)
+        result = super().search(index=index, body=body, params={})
+        sources = [hit["_source"] for hit in result["hits"]["hits"]]
+        result["hits"]["hits"] = copy.deepcopy(result["hits"]["hits"][:size])
+        result["aggregations"] = {
+            name: {"buckets": _buckets(definition, sources)}
+            for name, definition in aggs.items()
+        }
+        return result
+
+
+def _buckets(definition, sources):
+    """Buckets of a terms or date_histogram aggregation of the sources"""
+    if "terms" in definition:
+        terms = definition["terms"]
+        counts = Counter(
+            source[terms["field"]] for source in sources if terms["field"] in source
+        )
+        return [
+            {"key": key, "doc_count": count}
+            for key, count in counts.most_common(terms.get("size", 10))
+        ]
+
+    histogram = definition["date_histogram"]
+    counts = Counter()
+    for source in sources:
+        date = datetime.datetime.strptime(source[histogram["field"]], "%Y%m%d")
+        interval = histogram["calendar_interval"]
+        if interval not in ("day", "month", "year"):
+            raise NotImplementedError(f"calendar_interval {interval}")
+        if interval in ("month", "year"):
+            date = date.replace(day=1)
+        if interval == "year":
+            date = date.replace(month=1)
+        counts[date] += 1
+    return [
+        {
+            "key": int(date.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000),
+            "key_as_string": date.strftime("%Y%m%d"),
+            "doc_count": counts[date],
+        }
+        for date in sorted(counts)
+    ]
+
+
+def _sort_value(hit, field):
+    """Sort value of a hit, the document id stands in for the shard doc order"""
+    if field in ("_shard_doc", "_id"):
+        return hit["_id"]
+    return hit["_source"][field]
+
+
+def pit_openmock(f):
+    """Same as openmock, with FakePitOpenSearch as the fake cluster"""
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        with patch("openmock.FakeOpenSearch", FakePitOpenSearch):
+            return openmock(f)(*args, **kwargs)
+
+    return decorated
@@ -1,6 +1,11 @@
+from unittest.mock import MagicMock
+
+import opensearchpy
 import pytest
-from openmock import openmock
 
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils import (
+    client as client_module,
+)
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.action import Action
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.client import Client
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.document import Document
@@ -8,9 +13,11 @@ from sds_data_manager.lambda_code.SDSCode.opensearch_utils.index import Index
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.payload import Payload
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.query import Query
 
+from .fake_opensearch import pit_openmock
+
 
 @pytest.fixture()
-@openmock
+@pit_openmock
 def client():
     # mocked Opensearch client Params
     host = "localhost"
@@ -65,6 +72,22 @@ def test_create_index(client, index):
     assert client.index_exists(index)
 
 
+def test_put_index_template(client):
+    """
+    Correctly send the body of the index as an index template.
+    """
+    ## Arrange ##
+    body = {"mappings": {"properties": {"instrument": {"type": "keyword"}}}}
+
+    ## Act ##
+    client.put_index_template(Index("metadata", body))
+
+    ## Assert ##
+    assert client.client.templates == {
+        "metadata-template": {"index_patterns": ["metadata"], "template": body}
+    }
+
+
 def test_send_document_create(client, index):
     """
     Correctly create the specified document in OpenSearch.
@@ -242,6 +265,107 @@ def test_send_payload(client, index):
     assert document2_out == document2_expected
 
 
+def test_send_payload_result(client, index, documents):
+    """
+    Report the documents accepted and rejected by OpenSearch.
+    """
+    ## Arrange ##
+    payload = Payload()
+    payload.add_documents(documents)
+
+    ## Act ##
+    first = client.send_payload(payload)
+    # the documents already exist, so creating them again is rejected
+    second = client.send_payload(payload)
+
+    ## Assert ##
+    assert first.successful == 3
+    assert first.is_successful()
+    assert second.successful == 0
+    assert [failure["_id"] for failure in second.failed] == ["1", "2", "3"]
+    assert {failure["status"] for failure in second.failed} == {409}
+    assert second.retries == 0
+
+
+def test_send_payload_chunks(client, index):
+    """
+    Send every chunk of the payload and merge their results.
+    """
+    ## Arrange ##
+    payload = Payload(max_docs=2)
+    for i in range(12):
+        payload.add_documents(Document(index, i, Action.INDEX, {"instrument": i}))
+
+    ## Act ##
+    result = client.send_payload(payload, max_workers=3)
+
+    ## Assert ##
+    assert result.successful == 12
+    assert client.client.count(index=index.get_name())["count"] == 12
+
+
+def test_send_payload_retry_items(client, index, documents, monkeypatch):
+    """
+    Send the throttled documents again, and only those.
+    """
+    ## Arrange ##
+    sleep = MagicMock()
+    monkeypatch.setattr(client_module.time, "sleep", sleep)
+    bulk = client.client.bulk
+    bodies = []
+
+    def throttling_bulk(body, **kwargs):
+        bodies.append(body)
+        response = bulk(body, **kwargs)
+        if len(bodies) == 1:
+            # the second document is throttled on the first request
+            client.client.delete(index.get_name(), "2")
+            response["items"][1]["create"]["status"] = 429
+            response["items"][1]["create"]["error"] = {"type": "rejected"}
+        return response
+
+    client.client.bulk = throttling_bulk
+    payload = Payload()
+    payload.add_documents(documents)
+
+    ## Act ##
+    result = client.send_payload(payload, base_delay=0.1)
+
+    ## Assert ##
+    assert result.successful == 3
+    assert result.retries == 1
+    assert bodies[1] == documents[1].get_contents().encode()
+    sleep.assert_called_once_with(0.1)
+
+
+def test_send_payload_retry_request(client, index, documents, monkeypatch):
+    """
+    Send a throttled bulk request again, and report it once retries run out.
+    """
+    ## Arrange ##
+    monkeypatch.setattr(client_module.time, "sleep", MagicMock())
+    client.client.bulk = MagicMock(
+        side_effect=opensearchpy.TransportError(429, "too_many_requests", {})
+    )
+    payload = Payload()
+    payload.add_documents(documents)
+
+    ## Act ##
+    result = client.send_payload(payload, max_retries=2)
+
+    ## Assert ##
+    assert client.client.bulk.call_count == 3
+    assert result.retries == 2
+    assert [failure["status"] for failure in result.failed] == [429, 429, 429]
+    assert result.failed[0] == {
+        "action": "create",
+        "_index": "test_data",
+        "_id": "1",
+        "status": 429,
+        "error": {"type": "too_many_requests", "reason": "{}"},
+    }
+
+
 def test_search(client, index, documents):
     """
     Correctly query the OpenSearch cluster and receive the intended results.
@@ -453,6 +577,257 @@ def test_scroll_search(client, index):
         search.pop("_version")
     for search in search_expected:
         search.pop("_score")
+    # hits are returned sorted by document id
+    search_expected.sort(key=lambda hit: hit["_id"])
 
     ## Assert ##
     assert search_out == search_expected
+
+
+def test_iter_search(client, index):
+    """
+    Lazily page through the results and release the point in time at the end.
+    """
+    ## Arrange ##
+    payload = Payload()
+    for i in range(1, 20):
+        payload.add_documents(Document(index, i, Action.CREATE, {"instrument": 10}))
+    client.send_payload(payload)
+    query = Query({"instrument": 10})
+
+    searches = []
+    search = client.client.search
+
+    def counting_search(*args, **kwargs):
+        searches.append(kwargs["body"])
+        return search(*args, **kwargs)
+
+    client.client.search = counting_search
+
+    ## Act ##
+    hits = client.iter_search(query, index, page_size=5)
+    first = next(hits)
+
+    ## Assert ##
+    # only the first page has been requested
+    assert first["_id"] == "1"
+    assert len(searches) == 1
+    assert len(client.client.pits) == 1
+
+    rest = list(hits)
+    assert [hit["_id"] for hit in [first, *rest]] == sorted(
+        str(i) for i in range(1, 20)
+    )
+    assert all("sort" not in hit for hit in rest)
+    assert len(searches) == 4
+    assert searches[1]["search_after"] == ["13"]
+    assert client.client.pits == {}
+
+
+def test_iter_search_closed(client, index, documents):
+    """
+    Release the point in time when the caller stops iterating early.
+    """
+    payload = Payload()
+    payload.add_documents(documents)
+    client.send_payload(payload)
+
+    hits = client.iter_search(Query({"instrument": "mag"}), index, page_size=1)
+    next(hits)
+    assert len(client.client.pits) == 1
+
+    hits.close()
+    assert client.client.pits == {}
+
+
+def test_search_page(client, index, documents):
+    """
+    Return one page of hits and the cursor of the next page, read from a
+    point in time of the index.
+    """
+    payload = Payload()
+    payload.add_documents(documents)
+    client.send_payload(payload)
+    query = Query({"instrument": "mag"})
+
+    hits, cursor = client.search_page(query, index, page_size=2)
+    assert [hit["_id"] for hit in hits] == ["1", "2"]
+    assert cursor == {"pit_id": next(iter(client.client.pits)), "search_after": ["2"]}
+    assert all("sort" not in hit for hit in hits)
+
+    hits, cursor = client.search_page(query, index, page_size=2, cursor=cursor)
+    assert [hit["_id"] for hit in hits] == ["3"]
+    assert cursor is None
+
+
+def test_search_page_single_page(client, index, documents):
+    """
+    The point in time is closed right away when the first page is the last one.
+    """
+    payload = Payload()
+    payload.add_documents(documents)
+    client.send_payload(payload)
+
+    hits, cursor = client.search_page(Query({"instrument": "mag"}), index)
+
+    assert len(hits) == 3
+    assert cursor is None
+    assert client.client.pits == {}
+
+
+def test_search_page_expired(client, index, documents):
+    """
+    A cursor whose point in time has expired raises a ValueError.
+    """
+    payload = Payload()
+    payload.add_documents(documents)
+    client.send_payload(payload)
+    query = Query({"instrument": "mag"})
+    _, cursor = client.search_page(query, index, page_size=2)
+    client.client.pits.clear()
+
+    with pytest.raises(ValueError, match="expired"):
+        client.search_page(query, index, page_size=2, cursor=cursor)
+
+
+def test_parallel_scan(client, index):
+    """
+    Read every hit once, one thread per slice of a single point in time.
+    """
+    payload = Payload()
+    for i in range(1, 50):
+        payload.add_documents(Document(index, i, Action.CREATE, {"instrument": 10}))
+    client.send_payload(payload)
+
+    slices = []
+    search = client.client.search
+
+    def recording_search(*args, **kwargs):
+        slices.append(kwargs["body"]["slice"]["id"])
+        return search(*args, **kwargs)
+
+    client.client.search = recording_search
+
+    hits = list(
+        client.parallel_scan(Query({"instrument": 10}), index, slices=3, page_size=5)
+    )
+
+    assert sorted(hit["_id"] for hit in hits) == sorted(str(i) for i in range(1, 50))
+    assert all("sort" not in hit for hit in hits)
+    assert set(slices) == {0, 1, 2}
+    assert client.client.pits == {}
+
+
+def test_parallel_scan_closed(client, index):
+    """
+    Stop the threads and release the point in time when the caller stops early.
+    """
+    payload = Payload()
+    for i in range(1, 50):
+        payload.add_documents(Document(index, i, Action.CREATE, {"instrument": 10}))
+    client.send_payload(payload)
+
+    hits = client.parallel_scan(Query({"instrument": 10}), index, slices=2, page_size=1)
+    next(hits)
+    assert len(client.client.pits) == 1
+
+    hits.close()
+    assert client.client.pits == {}
+
+
+def test_parallel_scan_error(client, index, documents):
+    """
+    Raise the error of a slice in the caller.
+    """
+    client.client.search = MagicMock(
+        side_effect=opensearchpy.TransportError(500, "boom")
+    )
+
+    with pytest.raises(opensearchpy.TransportError):
+        list(client.parallel_scan(Query({"instrument": "mag"}), index, slices=2))
+    assert client.client.pits == {}
+
+    with pytest.raises(ValueError, match="slices"):
+        next(client.parallel_scan(Query({"instrument": "mag"}), index, slices=0))
+
+
+def test_count(client, index, documents):
+    """
+    Count the documents matching a query without fetching them.
+    """
+    payload = Payload()
+    payload.add_documents(documents)
+    client.send_payload(payload)
+
+    assert client.count(Query({"level": "l0"}), index) == 2
+    assert client.count(Query({}), index) == 3
+
+
+def test_aggregate(client, index, documents):
+    """
+    Return the buckets of the aggregations without any hit.
+    """
+    payload = Payload()
+    payload.add_documents(documents)
+    client.send_payload(payload)
+    query = Query({"instrument": "mag"})
+    query.add_terms_aggregation("level", "level")
+    query.add_date_histogram_aggregation("date")
+    search = client.client.search
+    responses = []
+
+    def recording_search(*args, **kwargs):
+        responses.append(search(*args, **kwargs))
+        return responses[-1]
+
+    client.client.search = recording_search
+
+    groups = client.aggregate(query, index)
+
+    assert groups == {
+        "level": [{"key": "l0", "count": 2}, {"key": "l1", "count": 1}],
+        "date": [{"key": "20221230", "count": 1}, {"key": "20230112", "count": 2}],
+    }
+    assert responses[0]["hits"]["hits"] == []
+
+
+def test_search_fields(client, index, documents):
+    """
+    Only return the requested fields of the documents, on every kind of page.
+    """
+    payload = Payload()
+    payload.add_documents(documents)
+    client.send_payload(payload)
+    query = Query({"instrument": "mag"}, fields=["level", "version"])
+
+    hits = client.search(query, index)
+    page, _ = client.search_page(query, index)
+    scanned = list(client.parallel_scan(query, index, slices=2))
+
+    for results in (hits, page, sorted(scanned, key=lambda hit: hit["_id"])):
+        assert [hit["_id"] for hit in results] == ["1", "2", "3"]
+        assert [hit["_source"] for hit in results] == [
+            {"level": "l0", "version": "*"},
+            {"level": "l1", "version": "*"},
+            {"level": "l0", "version": "*"},
+        ]
+    # the stored documents are untouched
+    assert client.get_document(documents[0])["_source"]["extension"] == "fits"
+
+
+def test_send_payload_refresh(client, index, documents):
+    """
+    The refresh parameter is passed on to every bulk request.
+    """
+    ## Arrange ##
+    bulk = client.client.bulk
+    client.client.bulk = MagicMock(wraps=bulk)
+    payload = Payload()
+    payload.add_documents(documents)
+
+    ## Act ##
+    result = client.send_payload(payload, refresh="wait_for")
+
+    ## Assert ##
+    assert result.is_successful()
+    assert client.client.bulk.call_args.kwargs["params"]["refresh"] == "wait_for"
@@ -0,0 +1,134 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.action import Action
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.client import Client
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.document import Document
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.index import Index
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.payload import Payload
+
+
+class BulkHandler(BaseHTTPRequestHandler):
+    """Stand-in for the OpenSearch _bulk endpoint, recording what it receives"""
+
+    def do_POST(self):  # noqa: N802
+        raw_body = self.rfile.read(int(self.headers["Content-Length"]))
+        body = raw_body
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(raw_body)
+
+        # every document is a create action followed by its source
+        lines = body.splitlines()
+        items = [
+            {"create": {"_id": json.loads(line)["create"]["_id"], "status": 201}}
+            for line in lines[::2]
+        ]
+        response = json.dumps({"took": 1, "errors": False, "items": items}).encode()
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            response = gzip.compress(response)
+            compressed = True
+        else:
+            compressed = False
+
+        self.server.requests.append(
+            {
+                "request_bytes": len(raw_body),
+                "body_bytes": len(body),
+                "response_bytes": len(response),
+                "content_encoding": self.headers.get("Content-Encoding"),
+            }
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if compressed:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture()
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BulkHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, http_compress):
+    host, port = server.server_address
+    return Client(
+        hosts=[{"host": host, "port": port}],
+        use_ssl=False,
+        verify_certs=False,
+        http_compress=http_compress,
+    )
+
+
+def _payload(count):
+    index = Index("metadata")
+    payload = Payload()
+    for i in range(count):
+        body = {
+            "mission": "imap",
+            "level": "l1",
+            "instrument": "mag",
+            "date": f"202307{i % 28 + 1:02d}",
+            "version": f"v{i % 10:02d}",
+            "extension": "cdf",
+        }
+        payload.add_documents(
+            Document(index, f"imap/l1/imap_l1_mag_{i}.cdf", Action.CREATE, body)
+        )
+    return payload
+
+
+@pytest.mark.parametrize("http_compress", [True, False])
+def test_http_compress(server, http_compress):
+    """Request bodies are only gzipped when compression is turned on"""
+    payload = _payload(100)
+
+    result = _client(server, http_compress).send_payload(payload)
+
+    assert result.successful == 100
+    (request,) = server.requests
+    assert request["body_bytes"] == len(payload.payload_chunks()[0])
+    if http_compress:
+        assert request["content_encoding"] == "gzip"
+        assert request["request_bytes"] < request["body_bytes"] / 4
+    else:
+        assert request["content_encoding"] is None
+        assert request["request_bytes"] == request["body_bytes"]
+
+
+@pytest.mark.benchmark()
+def test_benchmark_http_compress(server):
+    """Bytes on the wire and latency of a 5 MB bulk chunk, with and without gzip"""
+    payload = _payload(25_000)
+    (chunk,) = payload.chunk_items()
+
+    for http_compress in (False, True):
+        client = _client(server, http_compress)
+        start = time.perf_counter()
+        result = client.send_chunk(chunk)
+        elapsed = time.perf_counter() - start
+        request = server.requests[-1]
+
+        assert result.successful == len(chunk)
+        print(
+            f"\ngzip={http_compress}: {request['body_bytes'] / 1e6:.2f} MB chunk, "
+            f"{request['request_bytes'] / 1e6:.2f} MB sent, "
+            f"{request['response_bytes'] / 1e6:.2f} MB received, "
+            f"{elapsed * 1000:.0f} ms"
+        )
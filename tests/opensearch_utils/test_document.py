@@ -1,3 +1,6 @@
+import json
+import time
+
 import pytest
 
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.action import Action
@@ -132,3 +135,94 @@ def test_is_document_false():
     ## Arrange ##
     document = "string, not a document"
     assert not Document.is_document(document)
+
+
+def test_lazy_contents(document):
+    """
+    Serialize the document only when its contents are requested, and again
+    after the body or the action change.
+    """
+    assert document._encoded is None
+
+    contents = document.get_encoded_contents()
+    assert document.get_encoded_contents() is contents
+    assert document.size_in_bytes() == len(contents)
+
+    document.update_body({"test": "test"})
+    assert document.get_contents().endswith('{"test": "test"}\n')
+
+    document.update_action(Action.INDEX)
+    assert document.get_contents().startswith('{ "index": ')
+
+
+def test_slots(document):
+    """
+    Documents do not carry an instance dictionary.
+    """
+    assert not hasattr(document, "__dict__")
+    with pytest.raises(AttributeError):
+        document.other = 1
+
+
+def test_identifier_escaped():
+    """
+    Correctly escape identifiers holding quotes in the action line.
+    """
+    document = Document(Index("test_data"), 'imap/"quoted".pkts', Action.CREATE)
+
+    action_line = document.get_contents().split("\n")[0]
+    assert json.loads(action_line)["create"]["_id"] == 'imap/"quoted".pkts'
+
+
+def test_use_fast_json(document, document_body):
+    """
+    Serialize the body with orjson once enabled.
+    """
+    pytest.importorskip("orjson")
+    try:
+        assert Document.use_fast_json()
+        document.update_body(document_body)
+
+        body_line = document.get_contents().split("\n")[1]
+        assert body_line == json.dumps(document_body, separators=(",", ":"))
+    finally:
+        assert not Document.use_fast_json(False)
+
+
+@pytest.mark.benchmark()
+def test_benchmark_documents():
+    """Benchmark building 100k documents and their bulk payload"""
+    from sds_data_manager.lambda_code.SDSCode.opensearch_utils.payload import (
+        Payload,
+    )
+
+    index = Index("metadata")
+    bodies = [
+        {
+            "mission": "imap",
+            "level": "l0",
+            "instrument": "mag",
+            "date": f"2023{i % 12 + 1:02d}01",
+            "version": "v01",
+            "extension": "pkts",
+        }
+        for i in range(100_000)
+    ]
+
+    for fast in (False, True):
+        if fast and not Document.use_fast_json():
+            break
+        start = time.perf_counter()
+        documents = [
+            Document(index, f"imap/l0/file_{i}.pkts", Action.CREATE, body)
+            for i, body in enumerate(bodies)
+        ]
+        created = time.perf_counter() - start
+        payload = Payload()
+        payload.add_documents(documents)
+        total = time.perf_counter() - start
+        print(
+            f"\n{len(documents)} documents, {'orjson' if fast else 'json'}: "
+            f"created in {created:.2f}s, payload built in {total:.2f}s"
+        )
+    Document.use_fast_json(False)
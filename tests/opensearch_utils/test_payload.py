@@ -85,3 +85,52 @@ def test_get_contents(payload, index):
 
     contents_out = payload.get_contents()
     assert contents_expected == contents_out
+
+
+def test_payload_chunks_max_docs(index):
+    """
+    Correctly start a new chunk once a chunk holds max_docs documents.
+    """
+    payload = Payload(max_docs=2)
+    documents = [Document(index, i, Action.CREATE, {"i": i}) for i in range(5)]
+
+    payload.add_documents(documents)
+
+    chunks = payload.payload_chunks()
+    assert len(chunks) == 3
+    assert (
+        chunks[0]
+        == (documents[0].get_contents() + documents[1].get_contents()).encode()
+    )
+    assert [len(items) for items in payload.chunk_items()] == [2, 2, 1]
+
+
+def test_payload_chunks_max_bytes(index):
+    """
+    Correctly keep every chunk under max_bytes, except for a document larger
+    than the limit which gets a chunk of its own.
+    """
+    documents = [Document(index, i, Action.CREATE, {"i": i}) for i in range(10)]
+    max_bytes = 3 * documents[0].size_in_bytes()
+    payload = Payload(max_bytes=max_bytes)
+    large = Document(index, "large", Action.CREATE, {"data": "x" * max_bytes})
+
+    payload.add_documents([*documents[:5], large, *documents[5:]])
+
+    chunks = payload.payload_chunks()
+    assert [len(items) for items in payload.chunk_items()] == [3, 2, 1, 3, 2]
+    assert all(len(chunk) <= max_bytes for chunk in chunks if b"large" not in chunk)
+    assert b"".join(chunks).decode() == payload.get_contents()
+
+
+def test_payload_non_ascii(index):
+    """
+    Correctly size and encode documents holding non-ASCII characters.
+    """
+    payload = Payload()
+    document = Document(index, "imap/l0/données_é.pkts", Action.CREATE, {"a": "é"})
+
+    payload.add_documents(document)
+
+    assert payload.get_contents() == document.get_contents()
+    assert len(payload.payload_chunks()[0]) == document.size_in_bytes()
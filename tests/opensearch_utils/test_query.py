@@ -1,3 +1,5 @@
+import pytest
+
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils.query import Query
 
 
@@ -16,18 +18,18 @@ def test_get_name_both_dates():
     query_dsl_expected = {
         "query": {
             "bool": {
-                "must": [
-                    {"match": {"level": "l0"}},
-                    {"match": {"instrument": "mag"}},
-                ],
-                "filter": {
-                    "range": {
-                        "date": {
-                            "gte": "2022-01-01T00:00:00",
-                            "lte": "2022-01-30T00:00:00",
+                "filter": [
+                    {"term": {"level": "l0"}},
+                    {"term": {"instrument": "mag"}},
+                    {
+                        "range": {
+                            "date": {
+                                "gte": "2022-01-01T00:00:00",
+                                "lte": "2022-01-30T00:00:00",
+                            }
                         }
-                    }
-                },
+                    },
+                ],
             }
         }
     }
@@ -56,11 +58,11 @@ def test_get_name_no_start_date():
     query_dsl_expected = {
         "query": {
             "bool": {
-                "must": [
-                    {"match": {"level": "l0"}},
-                    {"match": {"instrument": "mag"}},
+                "filter": [
+                    {"term": {"level": "l0"}},
+                    {"term": {"instrument": "mag"}},
+                    {"range": {"date": {"lte": "2022-01-30T00:00:00"}}},
                 ],
-                "filter": {"range": {"date": {"lte": "2022-01-30T00:00:00"}}},
             }
         }
     }
@@ -88,11 +90,11 @@ def test_get_name_no_end_date():
     query_dsl_expected = {
         "query": {
             "bool": {
-                "must": [
-                    {"match": {"level": "l0"}},
-                    {"match": {"instrument": "mag"}},
+                "filter": [
+                    {"term": {"level": "l0"}},
+                    {"term": {"instrument": "mag"}},
+                    {"range": {"date": {"gte": "2022-01-01T00:00:00"}}},
                 ],
-                "filter": {"range": {"date": {"gte": "2022-01-01T00:00:00"}}},
             }
         }
     }
@@ -115,9 +117,9 @@ def test_get_name_no_date():
     query_dsl_expected = {
         "query": {
             "bool": {
-                "must": [
-                    {"match": {"level": "l0"}},
-                    {"match": {"instrument": "mag"}},
+                "filter": [
+                    {"term": {"level": "l0"}},
+                    {"term": {"instrument": "mag"}},
                 ]
             }
         }
@@ -129,3 +131,42 @@ def test_get_name_no_date():
 
     ## Assert ##
     assert query_dsl_out == query_dsl_expected
+
+
+def test_aggregation_dsl():
+    """
+    test that the aggregations are kept apart from the query.
+    """
+    ## Arrange ##
+    query = Query({"level": "l1"})
+
+    ## Act ##
+    query.add_terms_aggregation("per_instrument", "instrument", size=20)
+    query.add_date_histogram_aggregation("per_month", interval="month")
+
+    ## Assert ##
+    assert query.aggregation_dsl() == {
+        "per_instrument": {"terms": {"field": "instrument", "size": 20}},
+        "per_month": {
+            "date_histogram": {
+                "field": "date",
+                "calendar_interval": "month",
+                "min_doc_count": 1,
+            }
+        },
+    }
+    assert "aggs" not in query.query_dsl()
+
+    with pytest.raises(ValueError, match="interval"):
+        query.add_date_histogram_aggregation("per_hour", interval="hour")
+
+
+def test_source_dsl():
+    """
+    test that the source filtering is only set when fields are requested.
+    """
+    assert Query({"level": "l1"}).source_dsl() == {}
+    assert Query({"level": "l1"}, fields=["version"]).source_dsl() == {
+        "_source": {"includes": ["version"]}
+    }
+    assert Query({"level": "l1"}, fields=[]).source_dsl() == {"_source": False}
@@ -1,7 +1,9 @@
 from unittest.mock import MagicMock
 
+import boto3
 import pytest
 from freezegun import freeze_time
+from moto import mock_dynamodb
 
 from sds_data_manager.lambda_code.SDSCode.opensearch_utils import snapshot
 
@@ -45,85 +47,175 @@ def test_get_auth():
     assert true_awsauth.session_token == out_awsauth.session_token
 
 
+HOST = "search-sdsmetadatadomain.es.amazonaws.com"
+REPO_URL = "https://" + HOST + "/_snapshot/snapshot-repo"
+STATUS_URL = "https://" + HOST + "/_snapshot/_status"
+LEASE_KEY = {"lease_id": "opensearch-snapshot"}
+
+
+@pytest.fixture()
+def lease_table():
+    """A DynamoDB table to hold the snapshot lease"""
+    with mock_dynamodb():
+        # boto3.Session is mocked by _mock_boto_session, build the session directly
+        session = boto3.session.Session(region_name="us-east-1")
+        dynamodb = session.resource("dynamodb")
+        table = dynamodb.create_table(
+            TableName="lease-table",
+            KeySchema=[{"AttributeName": "lease_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "lease_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield table
+
+
+@pytest.fixture()
+def snapshot_requests(requests_mock):
+    """Successful repo, status and snapshot requests"""
+    requests_mock.put(REPO_URL, text="mocked PUT response", status_code=200)
+    requests_mock.get(STATUS_URL, json={"snapshots": []}, status_code=200)
+    requests_mock.put(
+        REPO_URL + "/opensearch_snapshot_2023-08-01-12:58:30",
+        text="mocked PUT response",
+        status_code=200,
+    )
+    return requests_mock
+
+
+def _coordinator(lease_table=None):
+    return snapshot.SnapshotCoordinator(
+        HOST,
+        "us-west-2",
+        "snapshot-repo",
+        "snapshot-bucket",
+        "arn:aws:iam::012345678901:role/snapshot-role",
+        interval=900,
+        lease_table=lease_table,
+        lease_key=LEASE_KEY,
+    )
+
+
+def _snapshot_requests(requests_mock):
+    """Number of register repo and take snapshot requests sent"""
+    methods = [(r.method, r.url) for r in requests_mock.request_history]
+    register = methods.count(("PUT", REPO_URL))
+    take = sum(1 for m, url in methods if m == "PUT" and url != REPO_URL)
+    return register, take
+
+
+@pytest.mark.usefixtures("_mock_boto_session")
+def test_snapshot_coordinator_interval(snapshot_requests):
+    """Only one snapshot is taken per interval and the repo is registered once"""
+    coordinator = _coordinator()
+
+    with freeze_time("2023-08-01 12:58:30"):
+        assert coordinator.take_snapshot_if_due()
+        assert not coordinator.take_snapshot_if_due()
+    assert _snapshot_requests(snapshot_requests) == (1, 1)
+
+    with freeze_time("2023-08-01 13:13:30"):
+        snapshot_requests.put(
+            REPO_URL + "/opensearch_snapshot_2023-08-01-13:13:30", status_code=200
+        )
+        assert coordinator.take_snapshot_if_due()
+    assert _snapshot_requests(snapshot_requests) == (1, 2)
+
+
 @freeze_time("2023-08-01 12:58:30")
 @pytest.mark.usefixtures("_mock_boto_session")
-def test_run_backup_no_exceptions(requests_mock):
-    """test that run_backup runs without exceptions"""
-    ## Arrange ##
-    host = (
-        "search-sdsmetadatadomain-x6xubdgtaqvrdn72uvgybjoiiu.us-west-2.es.amazonaws.com"
+def test_snapshot_coordinator_lease(snapshot_requests, lease_table):
+    """Coordinators sharing a lease take a single snapshot between them"""
+    coordinators = [_coordinator(lease_table) for _ in range(5)]
+
+    taken = [coordinator.take_snapshot_if_due() for coordinator in coordinators]
+
+    assert taken == [True, False, False, False, False]
+    assert _snapshot_requests(snapshot_requests) == (1, 1)
+    lease = lease_table.get_item(Key=LEASE_KEY)["Item"]
+    assert lease["lease_expires_at"] > 0
+
+
+@freeze_time("2023-08-01 12:58:30")
+@pytest.mark.usefixtures("_mock_boto_session")
+def test_snapshot_coordinator_in_progress(snapshot_requests):
+    """No snapshot is taken while another one is still running"""
+    snapshot_requests.get(
+        STATUS_URL, json={"snapshots": [{"snapshot": "running"}]}, status_code=200
     )
-    region = "us-west-2"
-    snapshot_repo_name = "snapshot-repo"
-    snapshot_s3_bucket = "snapshot-bucket"
-    snapshot_role_arn = "arn:aws:iam::012345678901:role/snapshot-role"
+    coordinator = _coordinator()
 
-    repo_url = "https://" + host + "/_snapshot/snapshot-repo"
-    snapshot_url = repo_url + "/opensearch_snapshot_2023-08-01-12:58:30"
-    # request repo successful request
-    requests_mock.put(repo_url, text="mocked PUT response", status_code=200)
-    # take snapshot successful request
-    requests_mock.put(snapshot_url, text="mocked PUT response", status_code=200)
+    assert not coordinator.take_snapshot_if_due()
+    assert _snapshot_requests(snapshot_requests) == (0, 0)
 
-    ## Act ##
-    snapshot.run_backup(
-        host, region, snapshot_repo_name, snapshot_s3_bucket, snapshot_role_arn
+
+@freeze_time("2023-08-01 12:58:30")
+@pytest.mark.usefixtures("_mock_boto_session")
+def test_snapshot_coordinator_exception(snapshot_requests):
+    """A failed snapshot request raises a RuntimeError"""
+    snapshot_requests.put(
+        REPO_URL + "/opensearch_snapshot_2023-08-01-12:58:30",
+        text="mocked PUT response",
+        status_code=400,
     )
+    coordinator = _coordinator()
 
-    ## Assert ##
-    # No return, but no exceptions should be raised
+    with pytest.raises(RuntimeError, match="400.mocked PUT response"):
+        coordinator.take_snapshot_if_due()
 
 
 @freeze_time("2023-08-01 12:58:30")
 @pytest.mark.usefixtures("_mock_boto_session")
-def test_run_backup_repo_exception(requests_mock):
-    """test that run_backup returns an error when the repository
-    registration requests returns an error status"""
-    ## Arrange ##
-    host = "sdsmetadata.com"
-    region = "us-west-2"
-    snapshot_repo_name = "snapshot-repo"
-    snapshot_s3_bucket = "snapshot-bucket"
-    snapshot_role_arn = "arn:aws:iam::012345678901:role/snapshot-role"
-
-    repo_url = "https://" + host + "/_snapshot/snapshot-repo"
-    snapshot_url = repo_url + "/opensearch_snapshot_2023-08-01-12:58:30"
-    # register repo failed request
-    requests_mock.put(repo_url, text="mocked PUT response", status_code=400)
-    # take snapshot successful request
-    requests_mock.put(snapshot_url, text="mocked PUT response", status_code=200)
-
-    ## Act / Assert ##
-    with pytest.raises(RuntimeError) as e:
-        snapshot.run_backup(
-            host, region, snapshot_repo_name, snapshot_s3_bucket, snapshot_role_arn
-        )
-    assert str(e) == "<ExceptionInfo RuntimeError('400.mocked PUT response') tblen=2>"
+def test_snapshot_coordinator_in_progress_lease(snapshot_requests, lease_table):
+    """The lease is not taken while another snapshot is still running"""
+    snapshot_requests.get(
+        STATUS_URL, json={"snapshots": [{"snapshot": "running"}]}, status_code=200
+    )
+
+    assert not _coordinator(lease_table).take_snapshot_if_due()
+
+    lease = lease_table.get_item(Key=LEASE_KEY)["Item"]
+    assert "lease_expires_at" not in lease
+    assert lease["pending"]
 
 
 @freeze_time("2023-08-01 12:58:30")
 @pytest.mark.usefixtures("_mock_boto_session")
-def test_run_backup_snapshot_exception(requests_mock):
-    """test that run_backup returns an exception when the take snapshot request
-    returns and error status."""
-    ## Arrange ##
-    host = "search-sdsmetadatadomain.es.amazonaws.com"
-    region = "us-west-2"
-    snapshot_repo_name = "snapshot-repo"
-    snapshot_s3_bucket = "snapshot-bucket"
-    snapshot_role_arn = "arn:aws:iam::012345678901:role/snapshot-role"
-
-    repo_url = "https://" + host + "/_snapshot/snapshot-repo"
-    snapshot_url = repo_url + "/opensearch_snapshot_2023-08-01-12:58:30"
-    # register repo successful request
-    requests_mock.put(repo_url, text="mocked PUT response", status_code=200)
-    # take snapshot failed request
-    requests_mock.put(snapshot_url, text="mocked PUT response", status_code=400)
-
-    ## Act / Assert ##
-    with pytest.raises(RuntimeError) as e:
-        snapshot.run_backup(
-            host, region, snapshot_repo_name, snapshot_s3_bucket, snapshot_role_arn
+def test_snapshot_coordinator_release_lease(snapshot_requests, lease_table):
+    """A failed snapshot releases the lease, so the next caller takes it"""
+    snapshot_url = REPO_URL + "/opensearch_snapshot_2023-08-01-12:58:30"
+    snapshot_requests.put(snapshot_url, text="mocked PUT response", status_code=400)
+    coordinator = _coordinator(lease_table)
+
+    with pytest.raises(RuntimeError, match="400.mocked PUT response"):
+        coordinator.take_snapshot_if_due()
+
+    snapshot_requests.put(snapshot_url, status_code=200)
+    assert _coordinator(lease_table).take_snapshot_if_due()
+    # the other caller holds the lease now
+    assert not coordinator.take_snapshot_if_due()
+
+
+@pytest.mark.usefixtures("_mock_boto_session")
+def test_snapshot_coordinator_pending(snapshot_requests, lease_table):
+    """A skipped snapshot is taken by take_pending_snapshot after the interval"""
+    coordinators = [_coordinator(lease_table) for _ in range(2)]
+    with freeze_time("2023-08-01 12:58:30"):
+        # nothing was skipped yet
+        assert not coordinators[0].take_pending_snapshot()
+        assert coordinators[0].take_snapshot_if_due()
+        assert not coordinators[1].take_snapshot_if_due()
+
+    with freeze_time("2023-08-01 13:00:00"):
+        assert not coordinators[1].take_pending_snapshot()
+    assert _snapshot_requests(snapshot_requests) == (1, 1)
+
+    with freeze_time("2023-08-01 13:13:30"):
+        snapshot_requests.put(
+            REPO_URL + "/opensearch_snapshot_2023-08-01-13:13:30", status_code=200
         )
+        assert coordinators[1].take_pending_snapshot()
+    assert _snapshot_requests(snapshot_requests) == (2, 2)
 
-    assert str(e) == "<ExceptionInfo RuntimeError('400.mocked PUT response') tblen=2>"
+    # the trailing snapshot cleared the pending flag
+    with freeze_time("2023-08-01 13:28:30"):
+        assert not coordinators[0].take_pending_snapshot()
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.action import Action
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.bulk_result import (
+    BulkResult,
+)
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.client import Client
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.document import Document
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.index import Index
+from sds_data_manager.lambda_code.SDSCode.opensearch_utils.streaming_payload import (
+    StreamingPayload,
+)
+
+from .fake_opensearch import pit_openmock
+
+
+@pytest.fixture()
+@pit_openmock
+def client():
+    return Client(hosts=[{"host": "localhost", "port": 9000}])
+
+
+@pytest.fixture()
+def index():
+    return Index("test_data")
+
+
+class SlowClient:
+    """Client recording the chunks it sends and how many are in flight"""
+
+    def __init__(self):
+        self.chunks = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def send_chunk(self, items, max_retries, base_delay):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+            self.chunks.append(items)
+        result = BulkResult()
+        result.successful = len(items)
+        return result
+
+
+def test_streaming_payload_sends_full_chunks(index):
+    """Full chunks are sent while documents are added, with bounded memory"""
+    client = SlowClient()
+    payload = StreamingPayload(client, max_docs=10, max_pending=2)
+
+    for i in range(95):
+        payload.add_documents(Document(index, i, Action.CREATE, {"i": i}))
+        # only the chunk being filled is kept in the payload
+        assert len(payload.payload_contents) == 1
+        assert len(payload._pending) <= 2
+
+    # the last chunk is only sent by flush
+    assert sum(len(chunk) for chunk in payload.payload_contents) == 5
+    result = payload.flush()
+
+    assert result.successful == 95
+    assert len(client.chunks) == 10
+    assert client.max_in_flight <= 2
+    assert payload.payload_contents == []
+    payload.close()
+
+
+def test_streaming_payload_context_manager(client, index):
+    """Every document is in OpenSearch when the context manager exits"""
+    with StreamingPayload(client, max_docs=4) as payload:
+        for i in range(10):
+            payload.add_documents(Document(index, i, Action.CREATE, {"i": i}))
+
+    assert payload.result.successful == 10
+    assert payload.result.is_successful()
+    assert client.client.count(index=index.get_name())["count"] == 10
+
+
+def test_streaming_payload_flush_empty():
+    """Flushing a payload without documents sends nothing"""
+    client = SlowClient()
+
+    with StreamingPayload(client) as payload:
+        assert payload.flush().successful == 0
+
+    assert client.chunks == []
+
+
+def test_streaming_payload_exception(index):
+    """The chunk not sent yet is dropped when an exception is raised"""
+    client = SlowClient()
+    payload = StreamingPayload(client, max_docs=10)
+
+    def add_and_fail():
+        with payload:
+            for i in range(15):
+                payload.add_documents(Document(index, i, Action.CREATE, {"i": i}))
+            raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError, match="failed"):
+        add_and_fail()
+
+    # the full chunk was being sent already, the one being filled is dropped
+    assert [len(chunk) for chunk in client.chunks] == [10]
+    assert payload.payload_contents == []